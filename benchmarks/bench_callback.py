@@ -0,0 +1,65 @@
+"""
+Replay synthetic runs directly into LessEffortCallback.
+
+Reports events/s, per-event latency percentiles and peak RSS; with --json
+the results are saved, and with --baseline they are compared against a
+previous run's.
+
+Run with::
+
+    python -m benchmarks.bench_callback [--events N] [--page-size N] \
+        [--json results.json] [--baseline baseline.json]
+"""
+
+import argparse
+import contextlib
+import io
+
+from livetable.lessEffortCallback import LessEffortCallback
+
+from . import results, synthetic
+
+
+def run(documents, rate=None, display_rate=None, store=False):
+    lines = []
+
+    def row_out(msg, *args, **kwargs):
+        lines.append(msg)
+
+    callback = LessEffortCallback(
+        out=lines.append,
+        row_out=row_out,
+        store_enabled=store,
+        display_rate=display_rate,
+    )
+    # The callback reports every start document on stdout
+    with contextlib.redirect_stdout(io.StringIO()):
+        latencies, events, elapsed = synthetic.replay(documents, callback, rate)
+    metrics = {"events_per_s": events / elapsed}
+    metrics.update(results.latency_percentiles(latencies))
+    metrics["lines"] = len(lines)
+    metrics["peak_rss_mb"] = results.peak_rss_mb()
+    return metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    synthetic.add_arguments(parser)
+    parser.add_argument(
+        "--display-rate", type=float, default=None, help="LessEffortCallback display rate"
+    )
+    parser.add_argument(
+        "--store", action="store_true", help="also fill the columnar event store"
+    )
+    results.add_arguments(parser)
+    args = parser.parse_args()
+
+    params = synthetic.generator_options(args)
+    params.update(display_rate=args.display_rate, store=args.store)
+    documents = list(synthetic.synthetic_documents(**synthetic.generator_options(args)))
+    metrics = run(documents, args.rate, args.display_rate, args.store)
+    results.report(args, "bench_callback", params, metrics)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Row filter latency over a large ColumnStore.
+
+Measures the first evaluation of a filter over ``--rows`` stored rows (what
+the operator waits for after pressing Enter) and the incremental update
+after each block of new events. The store is full, so every block also
+overwrites the oldest rows and their matches are forgotten.
+
+Run with::
+
+    python -m benchmarks.bench_filter [--rows N] [--block N] [--json results.json]
+"""
+
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+from livetable.columnStore import ColumnStore
+from livetable.rowFilter import FilterIndex, parse_filter
+
+from . import results
+
+QUERIES = {
+    "threshold": "I0 > 1e5",
+    "range": "I0 > 1e5 and en_energy between 280 and 290",
+    "compound": "not (det0 < 0.1 or det1 > 0.9) and seq_num >= 1000",
+}
+
+
+def _block(rng, first, n):
+    return (
+        np.arange(first, first + n),
+        np.arange(first, first + n) * 0.01,
+        {
+            "I0": rng.uniform(0, 2e5, n),
+            "en_energy": rng.uniform(250, 320, n),
+            "det0": rng.random(n),
+            "det1": rng.random(n),
+        },
+    )
+
+
+def _median_ms(func, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times) * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--block", type=int, default=100, help="new events per update")
+    parser.add_argument("--repeat", type=int, default=5)
+    results.add_arguments(parser)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    store = ColumnStore(["I0", "en_energy", "det0", "det1"], max_rows=args.rows)
+    store.extend(*_block(rng, 0, args.rows))
+
+    metrics = {}
+    for name, text in QUERIES.items():
+        row_filter = parse_filter(text)
+        metrics[f"{name}_full_ms"] = _median_ms(
+            lambda: FilterIndex(store, row_filter), args.repeat
+        )
+        index = FilterIndex(store, row_filter)
+        updates = []
+        for _ in range(args.repeat):
+            store.extend(*_block(rng, store.total_rows, args.block))
+            t0 = time.perf_counter()
+            index.update()
+            index.rows()
+            updates.append(time.perf_counter() - t0)
+        metrics[f"{name}_update_ms"] = statistics.median(updates) * 1e3
+        metrics[f"{name}_matches"] = len(index)
+
+    params = {"rows": args.rows, "block": args.block, "repeat": args.repeat}
+    results.report(args, "bench_filter", params, metrics)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Per-event formatting cost before and after compiled render plans.
+
+Compares bluesky's LiveTable with PagedLiveTable (single events and event
+pages), and the previous per-event baseline formatting with the cached
+baseline plan.
+
+Run with::
+
+    python -m benchmarks.bench_render_plan [--events N] [--columns N]
+"""
+
+import argparse
+import time
+
+from bluesky.callbacks.core import LiveTable
+from event_model import compose_run, pack_event_page
+
+from livetable.pagedLiveTable import PagedLiveTable
+from livetable.renderPlan import get_baseline_plan, hinted_fields
+
+
+def _documents(n_events, n_columns):
+    bundle = compose_run()
+    data_keys = {
+        f"det{i}": {"dtype": "number", "shape": [], "source": "sim", "precision": 3}
+        for i in range(n_columns)
+    }
+    data_keys["motor"] = {"dtype": "number", "shape": [], "source": "sim"}
+    descriptor = bundle.compose_descriptor(
+        data_keys=data_keys,
+        name="primary",
+        object_keys={"det": [k for k in data_keys if k != "motor"], "motor": ["motor"]},
+    )
+    t0 = time.time()
+    events = [
+        descriptor.compose_event(
+            data={k: i * 0.5 + j for j, k in enumerate(data_keys)},
+            timestamps={k: t0 for k in data_keys},
+            seq_num=i + 1,
+            time=t0 + i * 0.01,
+        )
+        for i in range(n_events)
+    ]
+    return bundle.start_doc, descriptor.descriptor_doc, events
+
+
+def _time_table(cls, start, descriptor, events, pages=False):
+    fields = ["motor"] + [k for k in descriptor["data_keys"] if k != "motor"]
+    table = cls(fields, separator_lines=False, out=lambda line: None)
+    table("start", start)
+    table("descriptor", descriptor)
+    t0 = time.perf_counter()
+    if pages:
+        table("event_page", pack_event_page(*events))
+    else:
+        for event in events:
+            table("event", event)
+    return (time.perf_counter() - t0) / len(events)
+
+
+def _legacy_baseline(descriptor, event):
+    columns = hinted_fields(descriptor)
+    border = "+" + "-" * 32 + "+" + "-" * 32 + "+"
+    lines = [border]
+    for k, v in event["data"].items():
+        if k not in columns:
+            continue
+        lines.append(f"| {k:>30} | {v:<30} |")
+    lines.append(border)
+    return lines
+
+
+def _planned_baseline(descriptor, event):
+    plan = get_baseline_plan(descriptor)
+    lines = [plan.border]
+    for k, v in event["data"].items():
+        if k not in plan.columns:
+            continue
+        lines.append(plan.row_template.format(k, v))
+    lines.append(plan.border)
+    return lines
+
+
+def _time_baseline(func, descriptor, events):
+    t0 = time.perf_counter()
+    for event in events:
+        func(descriptor, event)
+    return (time.perf_counter() - t0) / len(events)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--columns", type=int, default=8)
+    args = parser.parse_args()
+
+    start, descriptor, events = _documents(args.events, args.columns)
+    results = [
+        ("LiveTable event", _time_table(LiveTable, start, descriptor, events)),
+        ("PagedLiveTable event", _time_table(PagedLiveTable, start, descriptor, events)),
+        (
+            "PagedLiveTable event_page",
+            _time_table(PagedLiveTable, start, descriptor, events, pages=True),
+        ),
+        ("legacy baseline", _time_baseline(_legacy_baseline, descriptor, events)),
+        ("planned baseline", _time_baseline(_planned_baseline, descriptor, events)),
+    ]
+    print(f"{args.events} events, {args.columns + 1} columns")
+    for name, per_event in results:
+        print(f"{name:>28}: {per_event * 1e6:8.2f} us/event")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Import time, CLI start-up time and time to first paint of the table tabs.
+
+Every measurement runs in a fresh interpreter, so nothing is cached in
+``sys.modules``; the median of ``--repeat`` runs is reported. The tabs are
+painted on the offscreen Qt platform, with a Kafka config file that need
+not exist: the tab must appear without waiting for the broker.
+
+Run with::
+
+    python -m benchmarks.bench_startup [--repeat N] [--json results.json]
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+from . import results
+
+MODULES = (
+    "livetable.kafka_table",
+    "livetable.zmq_table",
+    "livetable.fanoutServer",
+    "livetable.QtKafkaTable",
+    "livetable.QtZmqTable",
+)
+
+CLIS = ("livetable.kafka_table", "livetable.zmq_table")
+
+# Modules that should only be imported when they are actually used
+HEAVY = ("matplotlib", "nslsii", "confluent_kafka", "bluesky_widgets", "qtpy")
+
+IMPORT_SCRIPT = """
+import sys, time
+t0 = time.perf_counter()
+import {module}
+print(time.perf_counter() - t0)
+print("heavy:" + ",".join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+PAINT_SCRIPT = """
+import os, sys, time
+t0 = time.perf_counter()
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+from types import SimpleNamespace
+from qtpy.QtCore import QEvent, QObject
+from qtpy.QtWidgets import QApplication
+from {module} import {tab}
+
+app = QApplication([])
+config = {{
+    "kafka": {{"bl_acronym": "bench", "config_file": {config_file!r}}},
+    "zmq": {{}},
+}}
+model = SimpleNamespace(settings=SimpleNamespace(gui_config=config))
+t_built = None
+
+
+class FirstPaint(QObject):
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Paint:
+            print(t_built - t0)
+            print(time.perf_counter() - t0)
+            sys.stdout.flush()
+            os._exit(0)
+        return False
+
+
+tab = {tab}(model)
+t_built = time.perf_counter()
+paint = FirstPaint()
+tab.installEventFilter(paint)
+tab.show()
+app.exec_()
+"""
+
+
+def _run(args, timeout=60):
+    proc = subprocess.run(
+        [sys.executable, *args], capture_output=True, text=True, timeout=timeout
+    )
+    if proc.returncode:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    return proc.stdout.strip().splitlines()
+
+
+def import_time(module, repeat):
+    times = []
+    for _ in range(repeat):
+        *_, t, heavy = _run(["-c", IMPORT_SCRIPT.format(module=module, heavy=HEAVY)])
+        times.append(float(t))
+    return statistics.median(times), heavy[len("heavy:") :]
+
+
+def cli_time(module, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        _run(["-m", module, "--help"])
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times)
+
+
+def first_paint(module, tab, config_file, repeat):
+    built, painted = [], []
+    for _ in range(repeat):
+        script = PAINT_SCRIPT.format(module=module, tab=tab, config_file=config_file)
+        *_, t_built, t_paint = _run(["-c", script])
+        built.append(float(t_built))
+        painted.append(float(t_paint))
+    return statistics.median(built), statistics.median(painted)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--config-file",
+        default="/etc/bluesky/kafka.yml",
+        help="kafka config file for the Kafka tab",
+    )
+    results.add_arguments(parser)
+    args = parser.parse_args()
+
+    metrics = {}
+    for module in MODULES:
+        name = module.rsplit(".", 1)[1]
+        try:
+            t, heavy = import_time(module, args.repeat)
+        except RuntimeError as ex:
+            print(f"{module}: not measured ({ex})")
+            continue
+        metrics[f"import_{name}_ms"] = t * 1e3
+        if heavy:
+            print(f"{module} imports {heavy}")
+    for module in CLIS:
+        name = module.rsplit(".", 1)[1]
+        try:
+            metrics[f"cli_{name}_help_ms"] = cli_time(module, args.repeat) * 1e3
+        except RuntimeError as ex:
+            print(f"{module} --help: not measured ({ex})")
+    for module, tab in (
+        ("livetable.QtKafkaTable", "QtKafkaTableTab"),
+        ("livetable.QtZmqTable", "QtZMQTableTab"),
+    ):
+        try:
+            built, painted = first_paint(module, tab, args.config_file, args.repeat)
+        except (RuntimeError, subprocess.TimeoutExpired) as ex:
+            print(f"{tab}: first paint not measured ({ex})")
+            continue
+        metrics[f"{tab}_built_ms"] = built * 1e3
+        metrics[f"{tab}_first_paint_ms"] = painted * 1e3
+
+    params = {"repeat": args.repeat, "config_file": args.config_file}
+    results.report(args, "bench_startup", params, metrics)
+
+
+if __name__ == "__main__":
+    main()
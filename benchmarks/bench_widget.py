@@ -0,0 +1,113 @@
+"""
+Replay synthetic runs through a table model into QtReConsoleMonitor.
+
+A LessEffortCallback renders into a BaseLiveTableModel (the newMsg/newRows
+plumbing LiveTableModel inherits) from a feeder thread, while the monitor
+drains and displays the lines on an offscreen Qt platform. Reports events/s
+from the feeder, per-event latency percentiles, GUI time per frame, how
+long the display takes to catch up after the last document, and peak RSS.
+
+Run with::
+
+    python -m benchmarks.bench_widget [--events N] [--rate R] \
+        [--render-mode coalesced|immediate] [--json results.json]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import threading
+import time
+
+from . import results, synthetic
+
+
+def run(documents, rate=None, render_mode="coalesced", max_fps=20, timeout=60):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from qtpy.QtCore import QTimer
+    from qtpy.QtWidgets import QApplication
+
+    from livetable.lessEffortCallback import LessEffortCallback
+    from livetable.simpleConsoleMonitor import QtReConsoleMonitor
+    from livetable.tableModel import BaseLiveTableModel
+
+    app = QApplication.instance() or QApplication([])
+    with contextlib.redirect_stdout(io.StringIO()):
+        model = BaseLiveTableModel()
+        monitor = QtReConsoleMonitor(model, render_mode=render_mode, max_fps=max_fps)
+    monitor.show()
+
+    # Time spent in the GUI thread writing lines, per frame
+    frame_times = []
+    append_lines = monitor._append_lines
+
+    def timed_append_lines(lines):
+        t0 = time.perf_counter()
+        append_lines(lines)
+        frame_times.append(time.perf_counter() - t0)
+
+    monitor._append_lines = timed_append_lines
+
+    callback = LessEffortCallback(out=model.newMsg, row_out=model.newRows)
+    feed = {}
+
+    def feeder():
+        feed["result"] = synthetic.replay(documents, callback, rate)
+        feed["done"] = time.perf_counter()
+
+    def check_finished():
+        idle = not model.queue_depth() and not monitor._pending_lines
+        if ("done" in feed and idle) or time.perf_counter() - started > timeout:
+            feed["drained"] = time.perf_counter()
+            app.quit()
+
+    timer = QTimer()
+    timer.timeout.connect(check_finished)
+    timer.start(10)
+    started = time.perf_counter()
+    thread = threading.Thread(target=feeder, daemon=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        thread.start()
+        app.exec_()
+        timer.stop()
+        model.stop_console_output_monitoring()
+        monitor._stop = True
+    thread.join()
+    if feed["drained"] < feed["done"]:
+        print(f"Display did not catch up within {timeout} s")
+
+    latencies, events, elapsed = feed["result"]
+    metrics = {"events_per_s": events / elapsed}
+    metrics.update(results.latency_percentiles(latencies))
+    metrics.update(results.latency_percentiles(frame_times, prefix="frame"))
+    metrics["frames"] = len(frame_times)
+    metrics["gui_ms_per_s"] = sum(frame_times) * 1e3 / (feed["drained"] - started)
+    metrics["drain_ms"] = (feed["drained"] - feed["done"]) * 1e3
+    metrics["dropped_rows"] = model.dropped_rows()
+    metrics["peak_rss_mb"] = results.peak_rss_mb()
+    return metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    synthetic.add_arguments(parser)
+    parser.add_argument(
+        "--render-mode", choices=("coalesced", "immediate"), default="coalesced"
+    )
+    parser.add_argument("--max-fps", type=float, default=20)
+    parser.add_argument(
+        "--timeout", type=float, default=60, help="give up waiting for the display"
+    )
+    results.add_arguments(parser)
+    args = parser.parse_args()
+
+    params = synthetic.generator_options(args)
+    params.update(render_mode=args.render_mode, max_fps=args.max_fps)
+    documents = list(synthetic.synthetic_documents(**synthetic.generator_options(args)))
+    metrics = run(documents, args.rate, args.render_mode, args.max_fps, args.timeout)
+    results.report(args, "bench_widget", params, metrics)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Reporting helpers shared by the benchmarks: latency percentiles, peak RSS,
+and JSON results that can be compared against a saved baseline.
+"""
+
+import json
+import platform
+import resource
+import sys
+import time
+
+import numpy as np
+
+# Metrics where a larger value is an improvement; everything else is a cost
+HIGHER_IS_BETTER = ("events_per_s",)
+
+
+def latency_percentiles(latencies, prefix="latency"):
+    """p50/p90/p99/max of ``latencies`` (seconds), in microseconds."""
+    if not latencies:
+        return {}
+    values = np.asarray(latencies) * 1e6
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {
+        f"{prefix}_p50_us": float(p50),
+        f"{prefix}_p90_us": float(p90),
+        f"{prefix}_p99_us": float(p99),
+        f"{prefix}_max_us": float(values.max()),
+    }
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process, in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    if sys.platform == "darwin":
+        peak /= 1024
+    return peak / 1024
+
+
+def make_results(benchmark, params, metrics):
+    return {
+        "benchmark": benchmark,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": params,
+        "metrics": metrics,
+    }
+
+
+def print_metrics(metrics, baseline=None):
+    """Print metrics, with the change relative to a baseline's if given."""
+    for name, value in metrics.items():
+        line = f"{name:>28}: {value:12.2f}"
+        if baseline and baseline.get(name):
+            change = (value - baseline[name]) / baseline[name] * 100
+            better = change > 0 if name in HIGHER_IS_BETTER else change < 0
+            line += f"  ({change:+.1f}% vs baseline{'' if better else ' !'})"
+        print(line)
+
+
+def save_results(path, results):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def load_baseline(path, benchmark):
+    """The metrics of a results file written by the same benchmark."""
+    with open(path) as f:
+        results = json.load(f)
+    if results.get("benchmark") != benchmark:
+        print(f"Baseline {path} is from {results.get('benchmark')!r}, not {benchmark!r}")
+        return None
+    return results["metrics"]
+
+
+def add_arguments(parser):
+    """Add the --json and --baseline options to an argparse parser."""
+    parser.add_argument("--json", metavar="PATH", help="save results as JSON")
+    parser.add_argument(
+        "--baseline", metavar="PATH", help="compare against results saved with --json"
+    )
+
+
+def report(args, benchmark, params, metrics):
+    """Print, compare and save results as asked for by ``add_arguments`` options."""
+    baseline = load_baseline(args.baseline, benchmark) if args.baseline else None
+    print_metrics(metrics, baseline)
+    if args.json:
+        save_results(args.json, make_results(benchmark, params, metrics))
@@ -0,0 +1,224 @@
+"""
+Synthetic bluesky document streams for the benchmarks.
+
+``synthetic_documents`` yields ``(name, doc)`` pairs shaped like a step scan:
+a start document with a motor dimension, a primary stream of scalar
+detectors (optionally with array-valued fields and packed into event pages),
+a baseline stream read before and after the scan, and a stop document.
+"""
+
+import time
+
+import numpy as np
+from event_model import compose_run, pack_event_page
+
+
+def _data_keys(prefix, n, source="sim"):
+    return {
+        f"{prefix}{i}": {"dtype": "number", "shape": [], "source": source, "precision": 3}
+        for i in range(n)
+    }
+
+
+def synthetic_run(
+    events=1000,
+    columns=8,
+    page_size=1,
+    baseline_size=10,
+    array_fields=0,
+    array_shape=(64,),
+    rate=None,
+    scan_id=1,
+):
+    """
+    Documents of one run.
+
+    Parameters
+    ----------
+    events : int
+        Number of primary events.
+    columns : int
+        Number of scalar detector fields, besides the motor.
+    page_size : int
+        Events per event_page; 1 emits plain event documents.
+    baseline_size : int
+        Number of baseline fields; 0 omits the baseline stream.
+    array_fields : int
+        Number of array-valued detector fields in the primary stream.
+    array_shape : tuple of int
+        Shape of each array-valued reading.
+    rate : float, optional
+        Events per second used for the event timestamps; None uses the
+        current time for every event.
+    scan_id : int
+
+    Yields
+    ------
+    name, doc : str, dict
+    """
+    t0 = time.time()
+    bundle = compose_run(
+        metadata={
+            "scan_id": scan_id,
+            "plan_name": "synthetic",
+            "plan_type": "generator",
+            "motors": ["motor"],
+            "hints": {"dimensions": [(["motor"], "primary")]},
+        }
+    )
+    yield "start", bundle.start_doc
+
+    baseline = None
+    if baseline_size:
+        baseline_keys = _data_keys("baseline", baseline_size, source="epics")
+        baseline = bundle.compose_descriptor(
+            data_keys=baseline_keys,
+            name="baseline",
+            object_keys={"baseline": list(baseline_keys)},
+        )
+        yield "descriptor", baseline.descriptor_doc
+        yield "event", baseline.compose_event(
+            data={k: float(i) for i, k in enumerate(baseline_keys)},
+            timestamps={k: t0 for k in baseline_keys},
+            seq_num=1,
+        )
+
+    data_keys = _data_keys("det", columns)
+    for i in range(array_fields):
+        data_keys[f"image{i}"] = {
+            "dtype": "array",
+            "shape": list(array_shape),
+            "source": "sim",
+        }
+    det_fields = list(data_keys)
+    data_keys["motor"] = {"dtype": "number", "shape": [], "source": "sim", "precision": 3}
+    primary = bundle.compose_descriptor(
+        data_keys=data_keys,
+        name="primary",
+        object_keys={"det": det_fields, "motor": ["motor"]},
+        hints={"det": {"fields": det_fields}, "motor": {"fields": ["motor"]}},
+    )
+    yield "descriptor", primary.descriptor_doc
+
+    rng = np.random.default_rng(scan_id)
+    arrays = [rng.random(array_shape) for _ in range(array_fields)]
+    page = []
+    for n in range(events):
+        now = t0 + n / rate if rate else time.time()
+        data = {f"det{i}": float(n * 0.5 + i) for i in range(columns)}
+        for i, array in enumerate(arrays):
+            data[f"image{i}"] = array
+        data["motor"] = n * 0.01
+        event = primary.compose_event(
+            data=data, timestamps={k: now for k in data}, seq_num=n + 1, time=now
+        )
+        if page_size <= 1:
+            yield "event", event
+            continue
+        page.append(event)
+        if len(page) == page_size:
+            yield "event_page", pack_event_page(*page)
+            page = []
+    if page:
+        yield "event_page", pack_event_page(*page)
+
+    if baseline is not None:
+        yield "event", baseline.compose_event(
+            data={k: float(i) + 0.5 for i, k in enumerate(baseline_keys)},
+            timestamps={k: time.time() for k in baseline_keys},
+            seq_num=2,
+        )
+    yield "stop", bundle.compose_stop(exit_status="success")
+
+
+def synthetic_documents(runs=1, **kwargs):
+    """Documents of ``runs`` consecutive runs; see ``synthetic_run``."""
+    for scan_id in range(1, runs + 1):
+        yield from synthetic_run(scan_id=scan_id, **kwargs)
+
+
+def event_count(name, doc):
+    """Number of events carried by one document."""
+    if name == "event":
+        return 1
+    if name == "event_page":
+        return len(doc["seq_num"])
+    return 0
+
+
+def add_arguments(parser):
+    """Add the generator's options to an argparse parser."""
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--events", type=int, default=20000, help="events per run")
+    parser.add_argument("--columns", type=int, default=8)
+    parser.add_argument(
+        "--page-size", type=int, default=1, help="events per event_page (1: events)"
+    )
+    parser.add_argument("--baseline-size", type=int, default=10)
+    parser.add_argument("--array-fields", type=int, default=0)
+    parser.add_argument(
+        "--array-shape",
+        type=lambda s: tuple(int(n) for n in s.split("x")),
+        default=(64,),
+        help="shape of array fields, e.g. 64 or 512x512",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=None,
+        help="events per second to replay at (default: as fast as possible)",
+    )
+
+
+def generator_options(args):
+    """The generator's keyword arguments from parsed ``add_arguments`` options."""
+    return {
+        "runs": args.runs,
+        "events": args.events,
+        "columns": args.columns,
+        "page_size": args.page_size,
+        "baseline_size": args.baseline_size,
+        "array_fields": args.array_fields,
+        "array_shape": args.array_shape,
+        "rate": args.rate,
+    }
+
+
+def replay(documents, func, rate=None):
+    """
+    Call ``func(name, doc)`` for every document, timing each call.
+
+    Parameters
+    ----------
+    documents : iterable of (name, doc)
+    func : callable
+    rate : float, optional
+        Events per second to pace the replay at; None replays as fast as
+        possible.
+
+    Returns
+    -------
+    latencies : list of float
+        Seconds per event of every document carrying events (an event
+        page's time is divided by its number of events).
+    events : int
+        Number of events replayed.
+    elapsed : float
+        Wall time of the whole replay, in seconds.
+    """
+    latencies = []
+    events = 0
+    start = time.perf_counter()
+    for name, doc in documents:
+        n = event_count(name, doc)
+        if rate and n:
+            delay = start + events / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        t0 = time.perf_counter()
+        func(name, doc)
+        dt = time.perf_counter() - t0
+        if n:
+            latencies.append(dt / n)
+            events += n
+    return latencies, events, time.perf_counter() - start
@@ -6,96 +6,188 @@ from qtpy.QtWidgets import (
     QMainWindow,
     QCheckBox,
     QHBoxLayout,
+    QStackedWidget,
+    QTabWidget,
 )
 from qtpy.QtCore import QThread, Slot, Signal, QObject, Qt, QTimer
 from qtpy.QtGui import QFontInfo, QFont
 import argparse
-import queue
-import time
-from .kafka_table import qt_kafka_table
+from warnings import warn
+from .kafkaDispatcher import START_FROM
+from .kafkaRegistry import kafka_tables
+from .kafka_table import topic_label
+from .offsetCheckpoint import add_checkpoint_arguments
+from .tableModel import BaseLiveTableModel
 
 # from bluesky_widgets.qt.run_engine_client import QtReConsoleMonitor
 
 from .simpleConsoleMonitor import QtReConsoleMonitor
+from .columnTableView import QtColumnTableView
+from .runHistoryView import QtRunHistory
+from .streamTablesView import QtStreamTables
+from .metricsStatus import QtMetricsStatus
+from .pipelineMetrics import metrics
+from .profiling import add_profile_arguments, start_profiling
 import sys
 
 
-class LiveTableModel(QWidget):
+class LiveTableModel(BaseLiveTableModel):
+    """
+    Table model showing one topic through the shared Kafka registry.
+
+    ``beamline_acronym`` None takes ``topic_string`` as the whole topic, e.g.
+    one reported by KafkaTopicWatcher.
+
+    Construction does not wait for the broker; ``connectionChanged`` emits
+    the consumer's state ("connecting", "connected" or "failed: ...") in the
+    GUI thread.
+
+    Rows are queued by the consumer thread shared by all tables of the
+    config file, so the "block" overflow policy is not available: one slow
+    view would stall every other view. It falls back to "drop-oldest".
+    """
+
+    connectionChanged = Signal(str)
+    # Baseline readings were shown or hidden for every view of the topic
+    baselineChanged = Signal(bool)
+
     def __init__(
         self,
         beamline_acronym,
         config_file,
         topic_string="bluesky.runengine.documents",
+        start_from="latest-start",
+        group_id=None,
+        checkpoint_file=None,
+        checkpoint_interval=5.0,
         parent=None,
+        **kwargs,
     ):
-        super().__init__(parent)
-        self.msg_queue = queue.Queue()
-        self.kafka_dispatcher, self.callback = qt_kafka_table(
+        if kwargs.get("overflow_policy") == "block":
+            warn(
+                "The 'block' overflow policy would stall the shared Kafka "
+                "consumer; using 'drop-oldest'"
+            )  # noqa: B028
+            kwargs["overflow_policy"] = "drop-oldest"
+        super().__init__(parent=parent, **kwargs)
+        if beamline_acronym is None:
+            self.topic = topic_string
+        else:
+            self.topic = f"{beamline_acronym}.{topic_string}"
+        self.connection_state = None
+        self.connectionChanged.connect(self._connection_changed)
+        # Views of the same topic share one consumer and callback
+        self.shared_table = kafka_tables.acquire(
+            self,
             beamline_acronym,
             config_file,
             topic_string,
-            self.newMsg,
+            start_from=start_from,
+            on_state=self.connectionChanged.emit,
+            group_id=group_id,
+            checkpoint_file=checkpoint_file,
+            checkpoint_interval=checkpoint_interval,
         )
-        self.kafka_dispatcher.setParent(self)
-        self.kafka_dispatcher.start()
-
-        label = QLabel("Test")
-        vbox = QVBoxLayout()
-        vbox.addWidget(label)
-        self.setLayout(vbox)
-        self.destroyed.connect(lambda: self.stop_console_output_monitoring)
+        self.callback = self.shared_table.callback
 
-    def newMsg(self, msg):
-        self.msg_queue.put(msg)
-        # print(msg)
+    @property
+    def kafka_dispatcher(self):
+        """The shared KafkaDispatcher, or None while connecting."""
+        return self.shared_table.dispatcher
 
-    def start_console_output_monitoring(self):
-        print("Start Console Output Monitoring")
-        self._stop_console_monitor = False
+    def _connection_changed(self, state):
+        if state == self.connection_state:
+            return
+        self.connection_state = state
+        if state == "connecting":
+            self.newMsg("Connecting to Kafka…")
+        elif state == "connected":
+            self.newMsg(f"Connected, waiting for documents on {self.topic}")
+        else:
+            self.newMsg(f"Kafka connection {state}")
 
     def stop_console_output_monitoring(self):
-        print("Stop Console Monitoring")
-        self.kafka_dispatcher.stop()
-        self._stop_console_monitor = True
+        kafka_tables.release(self.shared_table, self)
+        super().stop_console_output_monitoring()
 
-    def continue_polling(self):
-        return not self._stop_console_monitor
 
-    # def console_monitoring_thread(self, *, callback):
-    def console_monitoring_thread(self):
-        # print("Monitoring")
-        for n in range(5):
-            try:
-                msg = self.msg_queue.get(timeout=0.2)
-                msg = msg.rstrip("\n") + "\n"
-                msgtime = time.time()
-                return msgtime, msg
+class KafkaTopicWatcher(QObject):
+    """
+    Report the topics matching a pattern, through the shared Kafka registry.
 
-            except queue.Empty:
-                pass
-            except Exception as ex:
-                print(f"Exception occurred: {ex}")
+    ``topicFound`` is emitted in the GUI thread with the name of each
+    matching topic once its first document arrives. Its documents are kept
+    from then on, so a LiveTableModel made for it with
+    ``beamline_acronym=None`` starts with the run in progress. The pattern
+    is unsubscribed when the watcher is destroyed.
+    """
+
+    topicFound = Signal(str)
+
+    def __init__(
+        self,
+        config_file,
+        topic_pattern,
+        start_from="latest-start",
+        group_id=None,
+        checkpoint_file=None,
+        checkpoint_interval=5.0,
+        parent=None,
+    ):
+        super().__init__(parent)
+        self.topic_pattern = topic_pattern
+        # The registry keys the watch by this token, which outlives the QObject
+        owner = object()
+        kafka_tables.watch_pattern(
+            owner,
+            config_file,
+            topic_pattern,
+            self.topicFound.emit,
+            start_from=start_from,
+            group_id=group_id,
+            checkpoint_file=checkpoint_file,
+            checkpoint_interval=checkpoint_interval,
+        )
+        self.destroyed.connect(
+            lambda *_: kafka_tables.unwatch_pattern(owner, config_file)
+        )
 
-            if self._stop_console_monitor:
-                print("Stop monitoring!")
-        return None, None
 
+class QtKafkaTopicPanel(QWidget):
+    """
+    Controls and views of one Kafka topic, configured from the ``kafka``
+    section of the nbs_gui config.
 
-class QtKafkaTableTab(QWidget):
-    name = "Live Table"
+    ``beamline_acronym`` None takes ``topic_string`` as the whole topic.
+    """
 
-    def __init__(self, model, parent=None):
+    def __init__(self, beamline_acronym, topic_string, kafka_settings, parent=None):
         super().__init__(parent)
-        self.config = model.settings.gui_config
-        bl_acronym = self.config.get("kafka", {}).get("bl_acronym", "")
-        kafka_config = self.config.get("kafka", {}).get("config_file", "")
-        topic_string = self.config.get("kafka", {}).get(
-            "topic_string", "bluesky.runengine.documents"
-        )
         self.kafkaTable = LiveTableModel(
-            bl_acronym, kafka_config, topic_string=topic_string
+            beamline_acronym,
+            kafka_settings.get("config_file", ""),
+            topic_string=topic_string,
+            start_from=kafka_settings.get("start_from", "latest-start"),
+            group_id=kafka_settings.get("group_id"),
+            checkpoint_file=kafka_settings.get("checkpoint_file"),
+            checkpoint_interval=kafka_settings.get("checkpoint_interval", 5.0),
+            batch_size=kafka_settings.get("batch_size", 1000),
+            batch_time=kafka_settings.get("batch_time", 0.05),
+            queue_size=kafka_settings.get("queue_size", 10000),
+            overflow_policy=kafka_settings.get("overflow_policy", "drop-oldest"),
+            decimate_every=kafka_settings.get("decimate_every", 10),
+        )
+        # The topic's table is rendered once for all its views, so its
+        # settings come from the first view and are shared
+        shared_table = self.kafkaTable.shared_table
+        table_settings = shared_table.configure(
+            **{k: v for k, v in kafka_settings.items() if k in shared_table.SETTINGS}
         )
+        self.connectionLabel = QLabel(self)
+        self.kafkaTable.connectionChanged.connect(self.showConnectionState)
+        self.showConnectionState(self.kafkaTable.connection_state or "connecting")
         self.kafkaMonitor = QtReConsoleMonitor(self.kafkaTable, self)
+        self.columnView = QtColumnTableView(self.kafkaTable.callback, self)
 
         # Set up monospace font
         font = self.kafkaMonitor._text_edit.font()
@@ -103,37 +195,153 @@ class QtKafkaTableTab(QWidget):
         font.setStyleHint(QFont.Monospace)
         self.kafkaMonitor._text_edit.setFont(font)
 
-        # Create baseline control
+        # Create baseline control, shared by every view of the topic
         self.baselineCheck = QCheckBox("Show Baseline", self)
-        self.baselineCheck.setChecked(True)
+        self.baselineCheck.setToolTip("Applies to every view of this topic")
+        self.baselineCheck.setChecked(shared_table.callback.baseline_enabled)
         self.baselineCheck.stateChanged.connect(self.toggleBaseline)
+        self.kafkaTable.baselineChanged.connect(self.showBaselineEnabled)
+
+        # Choose between the text table and the virtualized table view
+        self.viewStack = QStackedWidget(self)
+        self.viewStack.addWidget(self.kafkaMonitor)
+        self.viewStack.addWidget(self.columnView)
+        self.tableViewCheck = QCheckBox("Table View", self)
+        self.tableViewCheck.setChecked(kafka_settings.get("table_view", False))
+        self.tableViewCheck.stateChanged.connect(self.toggleTableView)
+        self.toggleTableView(self.tableViewCheck.isChecked())
+
+        # Past runs are kept compactly and rendered only when selected
+        callback = self.kafkaTable.callback
+        if callback.history is not None:
+            self.historyView = QtRunHistory(callback.history, self.viewStack, self)
+            mainView = self.historyView
+        else:
+            mainView = self.viewStack
+
+        # Tables of the other streams (monitors, flyers, ...) as sub-tabs
+        if table_settings["stream_tables"]:
+            self.streamTabs = QtStreamTables(self.kafkaTable, mainView, self)
+            mainView = self.streamTabs
 
         vbox = QVBoxLayout()
-        vbox.addWidget(QLabel("Kafka Table Monitor"))
+        vbox.setContentsMargins(0, 0, 0, 0)
 
         # Add controls in a horizontal layout
         controls = QHBoxLayout()
         controls.addWidget(self.baselineCheck)
+        controls.addWidget(self.tableViewCheck)
         controls.addStretch()  # Push controls to the left
+        controls.addWidget(self.connectionLabel)
         vbox.addLayout(controls)
 
-        vbox.addWidget(self.kafkaMonitor)
+        vbox.addWidget(mainView)
         self.setLayout(vbox)
 
         font = self.kafkaMonitor._text_edit.font()
         actual_font = QFontInfo(font)
         print(f"Font used: {actual_font.family()}, Font Desired: {font.family()}")
 
+    def showConnectionState(self, state):
+        """Show the Kafka consumer's state next to the controls."""
+        if state.startswith("failed"):
+            self.connectionLabel.setStyleSheet("color: red")
+        else:
+            self.connectionLabel.setStyleSheet("")
+        text = "connecting…" if state == "connecting" else state
+        self.connectionLabel.setText(f"Kafka: {text}")
+
+    def toggleTableView(self, state):
+        """Switch between the text table and the column table view."""
+        self.viewStack.setCurrentIndex(1 if state else 0)
+
     def toggleBaseline(self, state):
-        """Toggle baseline readings on/off."""
-        if hasattr(self.kafkaTable, "callback"):
-            self.kafkaTable.callback.baseline_enabled = bool(state)
+        """Toggle baseline readings on/off, for every view of the topic."""
+        self.kafkaTable.shared_table.set_baseline_enabled(bool(state))
+
+    def showBaselineEnabled(self, enabled):
+        """Follow a baseline toggle made in another view of the topic."""
+        self.baselineCheck.blockSignals(True)
+        self.baselineCheck.setChecked(enabled)
+        self.baselineCheck.blockSignals(False)
+
+
+class QtKafkaTableTab(QWidget):
+    """
+    nbs_gui tab of Kafka live tables.
+
+    Shows the topic of ``kafka.bl_acronym``. With ``kafka.topic_pattern``,
+    every topic matching the pattern gets a sub-tab of its own as it
+    appears, next to the ``bl_acronym`` topic if one is set as well.
+    """
+
+    name = "Live Table"
+
+    def __init__(self, model, parent=None):
+        super().__init__(parent)
+        self.config = model.settings.gui_config
+        kafka_settings = self.config.get("kafka", {})
+        bl_acronym = kafka_settings.get("bl_acronym", "")
+        topic_string = kafka_settings.get(
+            "topic_string", "bluesky.runengine.documents"
+        )
+        topic_pattern = kafka_settings.get("topic_pattern")
+        self.kafka_settings = kafka_settings
+        # Instrumentation must be on before the callbacks are built
+        if kafka_settings.get("metrics", False):
+            metrics.enable()
+
+        vbox = QVBoxLayout()
+        vbox.addWidget(QLabel("Kafka Table Monitor"))
+        if topic_pattern:
+            self.topicTabs = QTabWidget(self)
+            self.topicPanels = {}
+            if bl_acronym:
+                self.addTopic(f"{bl_acronym}.{topic_string}")
+            self.topicWatcher = KafkaTopicWatcher(
+                kafka_settings.get("config_file", ""),
+                topic_pattern,
+                start_from=kafka_settings.get("start_from", "latest-start"),
+                group_id=kafka_settings.get("group_id"),
+                checkpoint_file=kafka_settings.get("checkpoint_file"),
+                checkpoint_interval=kafka_settings.get("checkpoint_interval", 5.0),
+                parent=self,
+            )
+            self.topicWatcher.topicFound.connect(self.addTopic)
+            vbox.addWidget(self.topicTabs)
+        else:
+            self.topicPanel = QtKafkaTopicPanel(
+                bl_acronym, topic_string, kafka_settings, self
+            )
+            self.kafkaTable = self.topicPanel.kafkaTable
+            vbox.addWidget(self.topicPanel)
+
+        if metrics.enabled:
+            self.metricsStatus = QtMetricsStatus(parent=self)
+            vbox.addWidget(self.metricsStatus)
+        self.setLayout(vbox)
+
+    def addTopic(self, topic):
+        """Add a sub-tab for a topic, unless it has one."""
+        if topic in self.topicPanels:
+            return
+        panel = QtKafkaTopicPanel(None, topic, self.kafka_settings, self)
+        self.topicPanels[topic] = panel
+        self.topicTabs.addTab(panel, topic_label(topic))
 
 
 def main():
     parser = argparse.ArgumentParser(description="Kafka LiveTable Monitor")
     parser.add_argument(
-        "--bl", required=True, help="Beamline acronym used for kafka topic"
+        "--bl",
+        nargs="+",
+        default=[],
+        help="Beamline acronym(s) used for kafka topics, one tab each",
+    )
+    parser.add_argument(
+        "--topic-pattern",
+        default=None,
+        help="regular expression matching further topics, one tab each as they appear",
     )
     parser.add_argument(
         "--config-file",
@@ -145,28 +353,75 @@ def main():
         default="bluesky.runengine.documents",
         help="string to be combined with acronym to create topic",
     )
+    parser.add_argument(
+        "--start-from",
+        choices=START_FROM,
+        default="latest-start",
+        help="begin at the most recent run, or at the consumer's committed offsets",
+    )
+    add_profile_arguments(parser)
+    add_checkpoint_arguments(parser)
 
     args = parser.parse_args()
+    if not args.bl and not args.topic_pattern:
+        parser.error("give at least one --bl or a --topic-pattern")
+    start_profiling(args)
     app = QApplication([])
 
     main_window = QMainWindow()
-    # model = LiveTableModel(args.bl, args.config_file, topic_string=args.topic_string)
-    # central_widget = LiveTableModel2(args.bl, args.config_file, topic_string=args.topic_string)
-    model = LiveTableModel(args.bl, args.config_file, topic_string=args.topic_string)
-    # central_widget = LiveTableModel3(args.bl, args.config_file, topic_string=args.topic_string)
-    central_widget = QtReConsoleMonitor(model, main_window)
-    # Ensure the font family is set to a monospace font that exists on the system
-    font = central_widget._text_edit.font()
-    font.setFamily("Monospace")
-    font.setStyleHint(QFont.Monospace)
-    central_widget._text_edit.setFont(font)
-    font = central_widget._text_edit.font()
-    actual_font = QFontInfo(font)
-    print(f"Font used: {actual_font.family()}, Font Desired: {font.family()}")
-    # model.setParent(central_widget)
-    # central_widget.start_console_output_monitoring()
+
+    def make_monitor(bl, topic_string):
+        model = LiveTableModel(
+            bl,
+            args.config_file,
+            topic_string=topic_string,
+            start_from=args.start_from,
+            group_id=args.group_id,
+            checkpoint_file=args.checkpoint,
+            checkpoint_interval=args.checkpoint_interval,
+        )
+        monitor = QtReConsoleMonitor(model, main_window)
+        # Ensure the font family is set to a monospace font that exists on the system
+        font = monitor._text_edit.font()
+        font.setFamily("Monospace")
+        font.setStyleHint(QFont.Monospace)
+        monitor._text_edit.setFont(font)
+        monitor.destroyed.connect(
+            lambda *_, model=model: model.stop_console_output_monitoring()
+        )
+        return monitor
+
+    # One monitor per topic; all of them share a single consumer
+    monitors = [(bl, make_monitor(bl, args.topic_string)) for bl in args.bl]
+    if monitors:
+        font = monitors[0][1]._text_edit.font()
+        actual_font = QFontInfo(font)
+        print(f"Font used: {actual_font.family()}, Font Desired: {font.family()}")
+    if len(monitors) == 1 and not args.topic_pattern:
+        central_widget = monitors[0][1]
+    else:
+        central_widget = QTabWidget(main_window)
+        for bl, monitor in monitors:
+            central_widget.addTab(monitor, bl)
+    if args.topic_pattern:
+        shown = {f"{bl}.{args.topic_string}" for bl in args.bl}
+
+        def add_topic(topic):
+            if topic not in shown:
+                shown.add(topic)
+                central_widget.addTab(make_monitor(None, topic), topic_label(topic))
+
+        watcher = KafkaTopicWatcher(
+            args.config_file,
+            args.topic_pattern,
+            start_from=args.start_from,
+            group_id=args.group_id,
+            checkpoint_file=args.checkpoint,
+            checkpoint_interval=args.checkpoint_interval,
+            parent=main_window,
+        )
+        watcher.topicFound.connect(add_topic)
     main_window.setCentralWidget(central_widget)
-    central_widget.destroyed.connect(lambda: model.stop_console_output_monitoring)
     main_window.show()
     app_ref = app.exec_()
     sys.exit(app_ref)
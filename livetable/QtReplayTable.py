@@ -0,0 +1,62 @@
+from qtpy.QtGui import QFont
+from qtpy.QtWidgets import QApplication, QMainWindow
+import sys
+import threading
+
+from .documentRecorder import replay
+from .lessEffortCallback import LessEffortCallback
+from .simpleConsoleMonitor import QtReConsoleMonitor
+from .tableModel import BaseLiveTableModel
+
+
+class ReplayTableModel(BaseLiveTableModel):
+    """
+    Table model fed from a recording instead of a broker.
+
+    Parameters
+    ----------
+    documents : iterable of (name, doc, receipt time)
+        For example ``RecordingReader.documents(run)``.
+    speed : float, optional
+        Multiple of the recorded pace; None replays as fast as possible.
+    **kwargs
+        Passed to BaseLiveTableModel.
+    """
+
+    def __init__(self, documents, speed=None, parent=None, **kwargs):
+        super().__init__(parent=parent, **kwargs)
+        self.callback = LessEffortCallback(out=self.newMsg, row_out=self.newRows)
+        self._documents = documents
+        self._speed = speed
+        self._thread = threading.Thread(target=self._replay, daemon=True)
+        self._thread.start()
+
+    def _replay(self):
+        try:
+            replay(
+                self._documents,
+                self.callback,
+                speed=self._speed,
+                continue_polling=self.continue_polling,
+            )
+        except Exception as ex:
+            print(f"Exception occurred: {ex}")
+        self.newMsg("— end of replay —")
+
+
+def replay_window(documents, speed=None):
+    """Replay documents into a QtReConsoleMonitor window until it is closed."""
+    app = QApplication.instance() or QApplication([])
+
+    main_window = QMainWindow()
+    model = ReplayTableModel(documents, speed=speed)
+    monitor = QtReConsoleMonitor(model, main_window)
+    font = monitor._text_edit.font()
+    font.setFamily("Monospace")
+    font.setStyleHint(QFont.Monospace)
+    monitor._text_edit.setFont(font)
+    monitor.destroyed.connect(lambda *_: model.stop_console_output_monitoring())
+    main_window.setCentralWidget(monitor)
+    main_window.show()
+    app_ref = app.exec_()
+    sys.exit(app_ref)
@@ -6,76 +6,64 @@ from qtpy.QtWidgets import (
     QMainWindow,
     QCheckBox,
     QHBoxLayout,
+    QStackedWidget,
 )
 from qtpy.QtCore import QThread, Slot, Signal, QObject, Qt, QTimer
 from qtpy.QtGui import QFontInfo, QFont
 
-# import argparse
-import queue
-import time
+import argparse
 
-# from .kafka_table import qt_kafka_table
-from .zmq_table import qt_zmq_table
+from .zmq_table import add_zmq_arguments, qt_zmq_table
+from .tableModel import BaseLiveTableModel
 
 # from bluesky_widgets.qt.run_engine_client import QtReConsoleMonitor
 
 from .simpleConsoleMonitor import QtReConsoleMonitor
+from .columnTableView import QtColumnTableView
+from .lessEffortCallback import STREAM_DISPLAY_RATE
+from .runHistory import RunHistory
+from .runHistoryView import QtRunHistory
+from .streamTablesView import QtStreamTables
+from .metricsStatus import QtMetricsStatus
+from .pipelineMetrics import metrics
+from .profiling import add_profile_arguments, start_profiling
 import sys
 
 
-class LiveTableModel(QWidget):
+class LiveTableModel(BaseLiveTableModel):
+    """
+    Table model fed by one or more 0MQ proxies.
+
+    Documents are received on the Qt event loop (see QtZmqDispatcher);
+    ``address``, ``rcvhwm`` and ``conflate`` are passed to it.
+    """
+
     def __init__(
         self,
+        address="localhost:5578",
+        rcvhwm=None,
+        conflate=False,
         parent=None,
+        **kwargs,
     ):
-        super().__init__(parent)
-        self.msg_queue = queue.Queue()
-        zmq_dispatcher, callback = qt_zmq_table(self.newMsg)
+        super().__init__(parent=parent, **kwargs)
+        zmq_dispatcher, callback = qt_zmq_table(
+            self.newMsg,
+            row_out=self.newRows,
+            stream_out=self.newStreamMsg,
+            stream_row_out=self.newStreamRows,
+            address=address,
+            rcvhwm=rcvhwm,
+            conflate=conflate,
+        )
         self.zmq_dispatcher = zmq_dispatcher
         self.callback = callback
         self.zmq_dispatcher.setParent(self)
         self.zmq_dispatcher.start()
 
-        label = QLabel("Test")
-        vbox = QVBoxLayout()
-        vbox.addWidget(label)
-        self.setLayout(vbox)
-        self.destroyed.connect(lambda: self.stop_console_output_monitoring)
-
-    def newMsg(self, msg):
-        self.msg_queue.put(msg)
-        # print(msg)
-
-    def start_console_output_monitoring(self):
-        print("Start Console Output Monitoring")
-        self._stop_console_monitor = False
-
     def stop_console_output_monitoring(self):
-        print("Stop Console Monitoring")
         self.zmq_dispatcher.stop()
-        self._stop_console_monitor = True
-
-    def continue_polling(self):
-        return not self._stop_console_monitor
-
-    # def console_monitoring_thread(self, *, callback):
-    def console_monitoring_thread(self):
-        # print("Monitoring")
-        for n in range(5):
-            try:
-                msg = self.msg_queue.get(timeout=0.2)
-                msg = msg.rstrip("\n") + "\n"
-                msgtime = time.time()
-                return msgtime, msg
-
-            except queue.Empty:
-                pass
-            except Exception as ex:
-                print(f"Exception occurred: {ex}")
-
-            if self._stop_console_monitor:
-                print("Stop monitoring!")
-        return None, None
+        super().stop_console_output_monitoring()
 
 
 class QtZMQTableTab(QWidget):
@@ -84,8 +72,27 @@ class QtZMQTableTab(QWidget):
     def __init__(self, model, parent=None):
         super().__init__(parent)
         self.config = model.settings.gui_config
-        self.zmqTable = LiveTableModel(self)
+        zmq_settings = self.config.get("zmq", {})
+        # Instrumentation must be on before the callback is built
+        if zmq_settings.get("metrics", False):
+            metrics.enable()
+        self.zmqTable = LiveTableModel(
+            address=zmq_settings.get("address", "localhost:5578"),
+            rcvhwm=zmq_settings.get("rcvhwm"),
+            conflate=zmq_settings.get("conflate", False),
+            parent=self,
+            batch_size=zmq_settings.get("batch_size", 1000),
+            batch_time=zmq_settings.get("batch_time", 0.05),
+            queue_size=zmq_settings.get("queue_size", 10000),
+            overflow_policy=zmq_settings.get("overflow_policy", "drop-oldest"),
+            decimate_every=zmq_settings.get("decimate_every", 10),
+        )
+        self.zmqTable.callback.set_display_rate(
+            zmq_settings.get("display_rate"),
+            zmq_settings.get("display_tolerance", 0.05),
+        )
         self.zmqMonitor = QtReConsoleMonitor(self.zmqTable, self)
+        self.columnView = QtColumnTableView(self.zmqTable.callback, self)
 
         # Printing the font and font family used by self.zmqMonitor
         font = self.zmqMonitor._text_edit.font()
@@ -98,22 +105,70 @@ class QtZMQTableTab(QWidget):
         self.baselineCheck.setChecked(True)
         self.baselineCheck.stateChanged.connect(self.toggleBaseline)
 
+        # Choose between the text table and the virtualized table view
+        self.viewStack = QStackedWidget(self)
+        self.viewStack.addWidget(self.zmqMonitor)
+        self.viewStack.addWidget(self.columnView)
+        self.tableViewCheck = QCheckBox("Table View", self)
+        self.tableViewCheck.setChecked(
+            self.config.get("zmq", {}).get("table_view", False)
+        )
+        self.tableViewCheck.stateChanged.connect(self.toggleTableView)
+        self.toggleTableView(self.tableViewCheck.isChecked())
+
+        # Past runs are kept compactly and rendered only when selected
+        callback = self.zmqTable.callback
+        if zmq_settings.get("history", True) and callback.history is None:
+            callback.history = RunHistory(
+                max_bytes=int(zmq_settings.get("history_max_mb", 256) * 2**20),
+                cache_bytes=int(zmq_settings.get("history_cache_mb", 32) * 2**20),
+            )
+        if callback.history is not None:
+            self.historyView = QtRunHistory(callback.history, self.viewStack, self)
+            mainView = self.historyView
+        else:
+            mainView = self.viewStack
+
+        # Tables of the other streams (monitors, flyers, ...) as sub-tabs
+        if zmq_settings.get("stream_tables", True):
+            callback.set_stream_display_rate(
+                zmq_settings.get("stream_display_rate", STREAM_DISPLAY_RATE),
+                zmq_settings.get("display_tolerance", 0.05),
+            )
+            self.streamTabs = QtStreamTables(self.zmqTable, mainView, self)
+            mainView = self.streamTabs
+        else:
+            callback.disable_stream_tables()
+
         vbox = QVBoxLayout()
-        vbox.addWidget(QLabel("ZMQ Table Monitor"))
+        vbox.addWidget(
+            QLabel(
+                "ZMQ Table Monitor: "
+                + ", ".join(self.zmqTable.zmq_dispatcher.addresses)
+            )
+        )
 
         # Add controls in a horizontal layout
         controls = QHBoxLayout()
         controls.addWidget(self.baselineCheck)
+        controls.addWidget(self.tableViewCheck)
         controls.addStretch()  # Push controls to the left
         vbox.addLayout(controls)
 
-        vbox.addWidget(self.zmqMonitor)
+        vbox.addWidget(mainView)
+        if metrics.enabled:
+            self.metricsStatus = QtMetricsStatus(parent=self)
+            vbox.addWidget(self.metricsStatus)
         self.setLayout(vbox)
 
         font = self.zmqMonitor._text_edit.font()
         actual_font = QFontInfo(font)
         print(f"Font used: {actual_font.family()}, Font Desired: {font.family()}")
 
+    def toggleTableView(self, state):
+        """Switch between the text table and the column table view."""
+        self.viewStack.setCurrentIndex(1 if state else 0)
+
     def toggleBaseline(self, state):
         """Toggle baseline readings on/off."""
         print("Toggle Baseline")
@@ -125,10 +180,17 @@ class QtZMQTableTab(QWidget):
 
 
 def main():
+    parser = argparse.ArgumentParser(description="ZMQ LiveTable Monitor")
+    add_zmq_arguments(parser)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    start_profiling(args)
     app = QApplication([])
 
     main_window = QMainWindow()
-    model = LiveTableModel()
+    model = LiveTableModel(
+        address=args.address, rcvhwm=args.rcvhwm, conflate=args.conflate
+    )
     central_widget = QtReConsoleMonitor(model, main_window)
     # Ensure the font family is set to a monospace font that exists on the system
     font = central_widget._text_edit.font()
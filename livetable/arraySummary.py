@@ -0,0 +1,155 @@
+"""
+Compact summaries of array-valued and externally stored fields.
+
+LiveTable formats the value of every hinted field of every event, so an
+area detector image written inline is converted to text, and an externally
+stored field shows its datum id. ArraySummary classifies the fields of a
+descriptor once, from ``data_keys[...]["shape"]``, ``["dtype"]`` and
+``["external"]``, and rewrites the descriptor and its events:
+
+- arrays stored inline become scalar "number" fields holding one reduction
+  of each reading ("sum" or "max"), computed with NumPy on the array as
+  received, without copying it;
+- externally stored fields become fixed-width "string" fields showing the
+  shape of the data (e.g. "1024x1024"), as the payload is not in the event.
+
+Every other consumer (table, event store, statistics, history) then only
+sees the rewritten documents, so array payloads are dropped as soon as
+their summary has been computed.
+"""
+
+import numpy as np
+
+REDUCERS = ("sum", "max")
+
+
+def _shape_text(shape):
+    return "x".join(str(n) for n in shape) if shape else "scalar"
+
+
+def _reduce(value, reducer):
+    if value is None:
+        return np.nan
+    try:
+        arr = np.asarray(value)
+        if arr.dtype.kind not in "biuf" or not arr.size:
+            return np.nan
+        if reducer == "sum":
+            # Accumulate in float64 without a float copy of the array
+            return float(np.add.reduce(arr, axis=None, dtype=np.float64))
+        return float(arr.max())
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _reduce_rows(values, reducer):
+    """One reduction per row of an event_page column."""
+    if isinstance(values, np.ndarray) and values.ndim > 1 and values.dtype.kind in "biuf":
+        # A block of same-shaped rows: reduce every row in one call
+        rows = values.reshape(len(values), -1)
+        if reducer == "sum":
+            return np.add.reduce(rows, axis=1, dtype=np.float64).tolist()
+        return rows.max(axis=1).astype(np.float64).tolist()
+    return [_reduce(value, reducer) for value in values]
+
+
+class ArraySummary:
+    """
+    Rewrites one descriptor's array and external fields into summaries.
+
+    Use ``from_descriptor``, which returns None for descriptors without
+    such fields.
+
+    Attributes
+    ----------
+    descriptor : dict
+        The rewritten descriptor.
+    arrays : dict
+        Inline array fields, mapped to their declared shape.
+    external : dict
+        Externally stored fields, mapped to their shape text.
+    reducer : str
+    """
+
+    def __init__(self, descriptor, arrays, external, reducer="sum"):
+        if reducer not in REDUCERS:
+            raise ValueError(f"Unknown array summary {reducer!r}, use {REDUCERS}")
+        self.arrays = arrays
+        self.external = external
+        self.reducer = reducer
+        data_keys = dict(descriptor["data_keys"])
+        for key in arrays:
+            data_keys[key] = {
+                "dtype": "number",
+                "shape": [],
+                "source": data_keys[key].get("source", ""),
+                "precision": 3,
+            }
+        for key in external:
+            data_keys[key] = {
+                "dtype": "string",
+                "shape": [],
+                "source": data_keys[key].get("source", ""),
+            }
+        self.descriptor = {**descriptor, "data_keys": data_keys}
+
+    @classmethod
+    def from_descriptor(cls, descriptor, reducer="sum"):
+        arrays = {}
+        external = {}
+        for key, data_key in descriptor.get("data_keys", {}).items():
+            shape = data_key.get("shape") or []
+            if data_key.get("external"):
+                external[key] = _shape_text(shape)
+            elif shape or data_key.get("dtype") == "array":
+                arrays[key] = shape
+        if not arrays and not external:
+            return None
+        return cls(descriptor, arrays, external, reducer=reducer)
+
+    def describe(self):
+        """One line naming the summarized fields, for the table output."""
+        parts = []
+        if self.arrays:
+            fields = ", ".join(
+                f"{key} ({_shape_text(shape)})" for key, shape in self.arrays.items()
+            )
+            parts.append(f"{fields} shown as {self.reducer}")
+        if self.external:
+            parts.append(f"{', '.join(self.external)} stored externally")
+        return "Array fields: " + "; ".join(parts)
+
+    def _summarize(self, doc, data, summaries):
+        data = {**data, **summaries}
+        doc = {**doc, "data": data}
+        if "filled" in doc:
+            filled = {
+                k: v
+                for k, v in doc["filled"].items()
+                if k not in self.arrays and k not in self.external
+            }
+            doc["filled"] = filled
+        return doc
+
+    def event(self, doc):
+        """The event with its array fields replaced by their summaries."""
+        data = doc["data"]
+        summaries = {
+            key: _reduce(data[key], self.reducer) for key in self.arrays if key in data
+        }
+        summaries.update({key: text for key, text in self.external.items() if key in data})
+        return self._summarize(doc, data, summaries)
+
+    def event_page(self, doc):
+        """The event_page with its array fields replaced by their summaries."""
+        data = doc["data"]
+        n = len(doc["seq_num"])
+        summaries = {
+            key: _reduce_rows(data[key], self.reducer)
+            for key in self.arrays
+            if key in data
+        }
+        summaries.update(
+            {key: [text] * n for key, text in self.external.items() if key in data}
+        )
+        return self._summarize(doc, data, summaries)
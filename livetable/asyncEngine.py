@@ -0,0 +1,260 @@
+"""
+asyncio engine for the console entry points.
+
+Instead of blocking in a dispatcher's polling loop and printing from inside
+the callback, the engine runs everything as cooperative tasks on one event
+loop::
+
+    source (Kafka / ZMQ) --docs--> renderer (LessEffortCallback) --lines--> writer
+
+Each arrow is a bounded asyncio.Queue, so a slow terminal slows rendering
+and consumption instead of growing memory. The writer writes lines in
+batches, a flush task flushes ``out`` every ``flush_interval`` seconds, and
+an optional metrics task reports throughput and queue depths on the same
+loop. Any number of sources can be added; with more than one, lines are
+prefixed with the source's label.
+
+A Kafka poll can block well beyond its timeout: a rebalance seeks every new
+partition to its latest start, and checkpoints are written to disk. Each
+Kafka source therefore polls in a thread of its own, and the loop only
+waits for the result, so the other sources and tasks keep running.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import pickle
+import sys
+import time
+
+from .kafka_table import labelled, make_kafka_dispatcher, topic_label
+from .lessEffortCallback import LessEffortCallback
+from .pipelineMetrics import metrics
+
+# Marker in place of a document name: the "document" is the new catch-up state
+CATCHUP = None
+
+
+class AsyncEngine:
+    """
+    Run live tables for several sources on one asyncio loop.
+
+    Parameters
+    ----------
+    out : file-like
+        Where table lines are written.
+    queue_size : int
+        Bound of every document and line queue.
+    flush_interval : float
+        Seconds between flushes of ``out``.
+    metrics_interval : float, optional
+        Seconds between throughput reports on stderr; None disables them.
+    recorder : callable, optional
+        Called with every document before it is rendered, e.g. a
+        DocumentRecorder.
+    """
+
+    def __init__(
+        self,
+        out=sys.stdout,
+        queue_size=1000,
+        flush_interval=0.1,
+        metrics_interval=None,
+        recorder=None,
+    ):
+        self.out = out
+        self.queue_size = queue_size
+        self.flush_interval = flush_interval
+        self.metrics_interval = metrics_interval
+        self.recorder = recorder
+        self._sources = []
+        self._lines = None
+        self._doc_queues = []
+        self.docs = 0
+        self.lines = 0
+
+    def add_kafka(
+        self,
+        beamline_acronym,
+        config_file,
+        topic_string="bluesky.documents",
+        start_from="latest-start",
+        topic_pattern=None,
+        group_id=None,
+        checkpoint=None,
+    ):
+        """
+        Add one consumer for one or more beamlines or a topic pattern; see
+        make_kafka_dispatcher for ``group_id`` and ``checkpoint``.
+        """
+        dispatcher = make_kafka_dispatcher(
+            beamline_acronym,
+            config_file,
+            topic_string,
+            start_from=start_from,
+            topic_pattern=topic_pattern,
+            group_id=group_id,
+            checkpoint=checkpoint,
+        )
+        self._sources.append(("kafka", dispatcher))
+
+    def add_zmq(self, address="localhost:5578", prefix=b"", deserializer=pickle.loads):
+        """Add a 0MQ proxy, given as ``host:port``."""
+        self._sources.append(("zmq", (address, prefix, deserializer)))
+
+    async def _kafka_source(self, dispatcher, docs):
+        pending = []
+
+        def add_topic(topic):
+            dispatcher.subscribe_topic(
+                topic,
+                lambda name, doc: pending.append(
+                    (topic, name, doc, metrics.receipt_time(doc))
+                ),
+            )
+            dispatcher.subscribe_catchup(
+                lambda state: pending.append((topic, CATCHUP, state, None)),
+                topic=topic,
+            )
+
+        dispatcher.on_new_topic(add_topic)
+        loop = asyncio.get_running_loop()
+        # One thread, as the consumer must only be used from one thread; the
+        # callbacks above run in it and only append to ``pending``
+        executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            while True:
+                await loop.run_in_executor(executor, dispatcher.poll)
+                for item in pending:
+                    await docs.put(item)
+                pending.clear()
+        finally:
+            # After any poll still running in the thread
+            await asyncio.shield(loop.run_in_executor(executor, dispatcher.stop))
+            executor.shutdown(wait=False)
+
+    async def _zmq_source(self, address, prefix, deserializer, docs):
+        import zmq
+        import zmq.asyncio
+
+        context = zmq.asyncio.Context.instance()
+        socket = context.socket(zmq.SUB)
+        socket.connect(f"tcp://{address}")
+        socket.setsockopt_string(zmq.SUBSCRIBE, "")
+        try:
+            while True:
+                message = await socket.recv()
+                received = None
+                if metrics.enabled:
+                    received = time.time()
+                    metrics.add_bytes(len(message))
+                try:
+                    msg_prefix, name, doc = message.split(b" ", 2)
+                    if prefix and msg_prefix != prefix:
+                        continue
+                    item = (address, name.decode(), deserializer(doc), received)
+                except Exception as ex:
+                    print(f"Exception occurred: {ex}")
+                    continue
+                await docs.put(item)
+        finally:
+            socket.close(linger=0)
+
+    async def _render(self, docs, label=None):
+        """
+        Feed documents to one LessEffortCallback per source key (e.g. topic),
+        prefixing lines with ``label(key)`` if given.
+        """
+        callbacks = {}
+        rendered = []
+
+        while True:
+            key, name, doc, received = await docs.get()
+            callback = callbacks.get(key)
+            if callback is None:
+                out = rendered.append
+                if label is not None:
+                    out = labelled(out, label(key))
+                callback = LessEffortCallback(
+                    out=out, row_out=lambda msg, *args, out=out, **kwargs: out(msg)
+                )
+                callbacks[key] = callback
+            if name is CATCHUP:
+                callback.set_catching_up(doc)
+            else:
+                self.docs += 1
+                if self.recorder is not None:
+                    self.recorder(name, doc)
+                if received is not None:
+                    # Time spent in the document queue is not transport
+                    metrics.receipt(doc, received)
+                callback(name, doc)
+            for line in rendered:
+                await self._lines.put(line)
+            rendered.clear()
+
+    async def _write(self):
+        while True:
+            batch = [await self._lines.get()]
+            while not self._lines.empty():
+                batch.append(self._lines.get_nowait())
+            self.lines += len(batch)
+            self.out.write("\n".join(batch) + "\n")
+
+    async def _flush(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.out.flush()
+
+    async def _report(self):
+        last_time, last_docs, last_lines = time.monotonic(), 0, 0
+        while True:
+            await asyncio.sleep(self.metrics_interval)
+            now = time.monotonic()
+            elapsed = now - last_time
+            depths = " ".join(str(q.qsize()) for q in self._doc_queues)
+            print(
+                f"[metrics] docs {(self.docs - last_docs) / elapsed:.1f}/s "
+                f"lines {(self.lines - last_lines) / elapsed:.1f}/s "
+                f"queues docs=[{depths}] lines={self._lines.qsize()}",
+                file=sys.stderr,
+            )
+            last_time, last_docs, last_lines = now, self.docs, self.lines
+
+    async def run(self):
+        """Run until cancelled."""
+        self._lines = asyncio.Queue(self.queue_size)
+        tasks = [
+            asyncio.create_task(self._write()),
+            asyncio.create_task(self._flush()),
+        ]
+        if self.metrics_interval:
+            tasks.append(asyncio.create_task(self._report()))
+        for kind, source in self._sources:
+            docs = asyncio.Queue(self.queue_size)
+            self._doc_queues.append(docs)
+            if kind == "kafka":
+                topics = source.topics
+                single = len(topics) == 1 and not topics[0].startswith("^")
+                label = topic_label
+                tasks.append(asyncio.create_task(self._kafka_source(source, docs)))
+            else:
+                single = True
+                label = str
+                tasks.append(asyncio.create_task(self._zmq_source(*source, docs)))
+            if single and len(self._sources) == 1:
+                label = None
+            tasks.append(asyncio.create_task(self._render(docs, label)))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def run_engine(engine):
+    """Run an AsyncEngine until interrupted."""
+    try:
+        asyncio.run(engine.run())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,436 @@
+"""
+Columnar storage for event data.
+
+A ColumnStore keeps the readings of one event stream as one typed NumPy array
+per field, plus the event ``seq_num`` and ``time``. Arrays are preallocated
+and grow geometrically; once ``max_rows`` is reached the store becomes a ring
+buffer and the oldest rows are overwritten.
+
+An EventStore holds one ColumnStore per descriptor for the most recent runs.
+
+Memory
+------
+A stream stores 16 bytes per row for ``seq_num`` and ``time`` plus the item
+size of each field (8 bytes for float64/int64, 1 for bool). Object columns
+(strings, arrays) add an 8 byte pointer per row plus the Python objects they
+reference. Because arrays double when full, allocated capacity is at most
+twice the number of rows, and never more than ``max_rows``. A run with S
+streams of F numeric fields is therefore bounded by roughly
+``S * max_rows * (16 + 8 * F)`` bytes, and an EventStore by ``max_runs``
+times that.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+# Map from event-model dtype names to the NumPy dtype used for storage
+_DTYPE_MAP = {
+    "number": np.float64,
+    "integer": np.int64,
+    "boolean": np.bool_,
+    "string": object,
+    "array": object,
+}
+
+
+def field_dtype(data_key):
+    """
+    Choose a storage dtype for one entry of a descriptor's ``data_keys``.
+
+    Parameters
+    ----------
+    data_key : dict
+        Entry from ``descriptor["data_keys"]``
+
+    Returns
+    -------
+    numpy.dtype
+    """
+    if data_key.get("shape"):
+        return np.dtype(object)
+    dtype_numpy = data_key.get("dtype_numpy")
+    if dtype_numpy:
+        try:
+            dtype = np.dtype(dtype_numpy)
+        except TypeError:
+            pass
+        else:
+            if dtype.kind in "biuf":
+                return dtype
+    return np.dtype(_DTYPE_MAP.get(data_key.get("dtype"), object))
+
+
+def _missing_value(dtype):
+    if dtype.kind == "f":
+        return np.nan
+    if dtype.kind in "iub":
+        return 0
+    return None
+
+
+class ColumnStore:
+    """
+    Growable, optionally bounded, columnar buffer for one event stream.
+
+    Parameters
+    ----------
+    fields : list of str
+        Data keys to store.
+    dtypes : dict, optional
+        Map of field name to dtype; fields not listed are stored as float64.
+    capacity : int
+        Number of rows to preallocate.
+    max_rows : int, optional
+        Maximum number of rows kept. When reached, the oldest rows are
+        overwritten. ``None`` means unbounded.
+    precisions : dict, optional
+        Map of field name to display precision, as found in ``data_keys``.
+    """
+
+    def __init__(
+        self, fields, dtypes=None, capacity=1024, max_rows=None, precisions=None
+    ):
+        dtypes = dtypes or {}
+        self.fields = list(fields)
+        self.dtypes = {f: np.dtype(dtypes.get(f, np.float64)) for f in self.fields}
+        self.precisions = dict(precisions or {})
+        self.max_rows = max_rows
+        if max_rows is not None:
+            capacity = min(capacity, max_rows)
+        self._capacity = max(1, capacity)
+        self._seq_num = np.zeros(self._capacity, dtype=np.int64)
+        self._time = np.zeros(self._capacity, dtype=np.float64)
+        self._data = {
+            f: np.empty(self._capacity, dtype=self.dtypes[f]) for f in self.fields
+        }
+        # Physical index of logical row 0, and number of rows held
+        self._start = 0
+        self._len = 0
+        # Rows ever appended, including those overwritten by the ring
+        self.total_rows = 0
+
+    @classmethod
+    def from_descriptor(cls, descriptor, fields, **kwargs):
+        """
+        Build a store for the given fields of an event descriptor.
+
+        Fields that are not data keys of the descriptor (e.g. "time") are
+        skipped.
+        """
+        data_keys = descriptor["data_keys"]
+        fields = [f for f in fields if f in data_keys]
+        dtypes = {f: field_dtype(data_keys[f]) for f in fields}
+        precisions = {
+            f: data_keys[f]["precision"]
+            for f in fields
+            if data_keys[f].get("precision") is not None
+        }
+        return cls(fields, dtypes=dtypes, precisions=precisions, **kwargs)
+
+    def __len__(self):
+        return self._len
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def nbytes(self):
+        """Bytes held by the preallocated arrays (object payloads excluded)."""
+        return (
+            self._seq_num.nbytes
+            + self._time.nbytes
+            + sum(col.nbytes for col in self._data.values())
+        )
+
+    def _grow(self, new_capacity):
+        n = self._len
+
+        def resized(arr):
+            new = np.empty(new_capacity, dtype=arr.dtype)
+            new[:n] = arr[:n]
+            return new
+
+        self._seq_num = resized(self._seq_num)
+        self._time = resized(self._time)
+        self._data = {f: resized(col) for f, col in self._data.items()}
+        self._capacity = new_capacity
+
+    def _promote(self, field):
+        """Fall back to object storage for a field whose values do not fit."""
+        self.dtypes[field] = np.dtype(object)
+        self._data[field] = self._data[field].astype(object)
+
+    def _next_slot(self):
+        if self._len == self._capacity:
+            if self.max_rows is None or self._capacity < self.max_rows:
+                new_capacity = self._capacity * 2
+                if self.max_rows is not None:
+                    new_capacity = min(new_capacity, self.max_rows)
+                self._grow(new_capacity)
+            else:
+                # Full ring: overwrite the oldest row
+                slot = self._start
+                self._start = (self._start + 1) % self._capacity
+                return slot
+        slot = (self._start + self._len) % self._capacity
+        self._len += 1
+        return slot
+
+    def append(self, seq_num, time, data):
+        """
+        Append one event.
+
+        Parameters
+        ----------
+        seq_num : int
+        time : float
+        data : dict
+            Event ``data``; fields missing from it are stored as NaN, 0 or
+            None depending on the column dtype.
+        """
+        slot = self._next_slot()
+        self._seq_num[slot] = seq_num
+        self._time[slot] = time
+        for field, col in self._data.items():
+            value = data.get(field, _missing_value(col.dtype))
+            try:
+                col[slot] = value
+            except (TypeError, ValueError):
+                self._promote(field)
+                self._data[field][slot] = value
+        self.total_rows += 1
+
+    def extend(self, seq_nums, times, data):
+        """
+        Append a block of events, e.g. the contents of an event_page.
+
+        Parameters
+        ----------
+        seq_nums, times : array_like
+            One entry per row.
+        data : dict
+            Map of field name to one value per row; missing fields are filled
+            as in ``append``.
+        """
+        seq_nums = np.asarray(seq_nums, dtype=np.int64)
+        n = len(seq_nums)
+        if n == 0:
+            return
+        self.total_rows += n
+        needed = self._len + n
+        if needed > self._capacity and (
+            self.max_rows is None or self._capacity < self.max_rows
+        ):
+            new_capacity = self._capacity
+            while new_capacity < needed:
+                new_capacity *= 2
+            if self.max_rows is not None:
+                new_capacity = min(new_capacity, self.max_rows)
+            self._grow(new_capacity)
+
+        # Only the newest rows survive if the block is larger than the ring
+        skip = max(0, n - self._capacity)
+        rows = slice(skip, n)
+        m = n - skip
+        slots = (self._start + self._len + np.arange(m)) % self._capacity
+        overflow = max(0, self._len + m - self._capacity)
+        self._start = (self._start + overflow) % self._capacity
+        self._len = min(self._capacity, self._len + m)
+
+        self._seq_num[slots] = seq_nums[rows]
+        self._time[slots] = np.asarray(times, dtype=np.float64)[rows]
+        for field, col in self._data.items():
+            if field not in data:
+                col[slots] = _missing_value(col.dtype)
+                continue
+            values = data[field][skip:]
+            if col.dtype.kind != "O":
+                try:
+                    col[slots] = np.asarray(values, dtype=col.dtype)
+                    continue
+                except (TypeError, ValueError):
+                    self._promote(field)
+                    col = self._data[field]
+            # Element-wise so that array values stay one object per row
+            for slot, value in zip(slots, values):
+                col[slot] = value
+
+    def _physical(self, rows):
+        return (self._start + np.asarray(rows)) % self._capacity
+
+    def _array(self, name):
+        if name == "seq_num":
+            return self._seq_num
+        if name == "time":
+            return self._time
+        return self._data[name]
+
+    def column(self, name):
+        """
+        Return the stored values of one column in row order.
+
+        ``name`` may be "seq_num", "time" or any stored field. The result is
+        a view when the ring has not wrapped, and a copy otherwise.
+        """
+        arr = self._array(name)
+        if self._start == 0:
+            return arr[: self._len]
+        return np.concatenate(
+            (arr[self._start : self._capacity], arr[: self._start])
+        )[: self._len]
+
+    def value(self, row, name):
+        """Return a single stored value by logical row index."""
+        return self._array(name)[(self._start + row) % self._capacity]
+
+    def take(self, name, rows):
+        """Return the values of one column at the given logical rows."""
+        return self._array(name)[self._physical(rows)]
+
+
+class RunStore:
+    """
+    Columnar data of one run, with a ColumnStore per event descriptor.
+
+    Attributes
+    ----------
+    uid : str
+        Run start uid.
+    start_doc, stop_doc : dict
+    descriptors : dict
+        Descriptor documents keyed by uid.
+    tables : dict
+        ColumnStore keyed by descriptor uid.
+    """
+
+    def __init__(self, start_doc):
+        self.uid = start_doc["uid"]
+        self.start_doc = start_doc
+        self.stop_doc = None
+        self.descriptors = {}
+        self.tables = {}
+
+    def table(self, descriptor_uid):
+        """Return the ColumnStore of a descriptor, or None."""
+        return self.tables.get(descriptor_uid)
+
+    def stream(self, name):
+        """Return the ColumnStore of the first descriptor of a stream, or None."""
+        for uid, descriptor in self.descriptors.items():
+            if descriptor.get("name") == name and uid in self.tables:
+                return self.tables[uid]
+        return None
+
+    @property
+    def stream_names(self):
+        return [d.get("name") for d in self.descriptors.values()]
+
+    @property
+    def nbytes(self):
+        return sum(table.nbytes for table in self.tables.values())
+
+
+class EventStore:
+    """
+    Columnar event data for the most recent runs.
+
+    Feed it documents through ``start``, ``add_descriptor``, ``append_event``
+    and ``stop``; read it through ``current_run``, ``get_run`` and
+    ``get_table``. See the module docstring for memory bounds.
+
+    Parameters
+    ----------
+    max_runs : int
+        Number of runs kept. The oldest run is evicted when a new run starts.
+    max_rows : int, optional
+        Maximum rows per descriptor; older rows are overwritten beyond this.
+    capacity : int
+        Rows preallocated for each new descriptor.
+    """
+
+    def __init__(self, max_runs=5, max_rows=1_000_000, capacity=1024):
+        self.max_runs = max_runs
+        self.max_rows = max_rows
+        self.capacity = capacity
+        self._runs = OrderedDict()
+        self._descriptor_runs = {}
+
+    def start(self, doc):
+        run = RunStore(doc)
+        self._runs[run.uid] = run
+        while len(self._runs) > self.max_runs:
+            _, evicted = self._runs.popitem(last=False)
+            for uid in evicted.descriptors:
+                self._descriptor_runs.pop(uid, None)
+        return run
+
+    def add_descriptor(self, doc, fields):
+        """
+        Create the ColumnStore for a descriptor.
+
+        Parameters
+        ----------
+        doc : dict
+            Event descriptor.
+        fields : list of str
+            Fields to store, usually the hinted fields.
+        """
+        run = self._runs.get(doc["run_start"])
+        if run is None:
+            return None
+        table = ColumnStore.from_descriptor(
+            doc, fields, capacity=self.capacity, max_rows=self.max_rows
+        )
+        run.descriptors[doc["uid"]] = doc
+        run.tables[doc["uid"]] = table
+        self._descriptor_runs[doc["uid"]] = run
+        return table
+
+    def append_event(self, doc):
+        table = self.get_table(doc["descriptor"])
+        if table is not None:
+            table.append(doc["seq_num"], doc["time"], doc["data"])
+        return table
+
+    def append_page(self, doc):
+        table = self.get_table(doc["descriptor"])
+        if table is not None:
+            table.extend(doc["seq_num"], doc["time"], doc["data"])
+        return table
+
+    def stop(self, doc):
+        run = self._runs.get(doc["run_start"])
+        if run is not None:
+            run.stop_doc = doc
+
+    def get_run(self, uid):
+        """Return the RunStore for a run start uid, or None if evicted."""
+        return self._runs.get(uid)
+
+    def get_table(self, descriptor_uid):
+        """Return the ColumnStore for a descriptor uid, or None."""
+        run = self._descriptor_runs.get(descriptor_uid)
+        if run is None:
+            return None
+        return run.table(descriptor_uid)
+
+    @property
+    def current_run(self):
+        """The most recently started run, or None."""
+        if not self._runs:
+            return None
+        return next(reversed(self._runs.values()))
+
+    def run_uids(self):
+        """Uids of the stored runs, oldest first."""
+        return list(self._runs)
+
+    @property
+    def nbytes(self):
+        return sum(run.nbytes for run in self._runs.values())
+
+    def clear(self):
+        self._runs.clear()
+        self._descriptor_runs.clear()
@@ -0,0 +1,513 @@
+from qtpy.QtCore import QAbstractTableModel, QModelIndex, Qt, QTimer
+from qtpy.QtGui import QFont
+from qtpy.QtWidgets import (
+    QAbstractItemView,
+    QCheckBox,
+    QComboBox,
+    QHBoxLayout,
+    QHeaderView,
+    QLabel,
+    QLineEdit,
+    QTableView,
+    QVBoxLayout,
+    QWidget,
+)
+from contextlib import nullcontext
+from datetime import datetime
+import time as ttime
+import numpy as np
+
+from .rowFilter import FilterIndex, parse_filter
+
+
+def _stable_order(keys, descending=False):
+    """Stable argsort of ``keys``; descending too keeps ties in row order."""
+    if not descending:
+        return np.argsort(keys, kind="stable")
+    n = len(keys)
+    return (n - 1 - np.argsort(keys[::-1], kind="stable"))[::-1]
+
+
+def _str_keys(values):
+    # Sort keys of a column whose values cannot be compared with each other
+    return np.array([str(v) for v in values], dtype=np.str_)
+
+
+def _merge(order, keys, rows, new_keys, descending=False):
+    """
+    Merge rows with sort keys ``new_keys``, already in display order, into
+    ``order`` and its ``keys``; each goes after the rows with equal keys.
+    """
+    if descending:
+        pos = len(keys) - np.searchsorted(keys[::-1], new_keys, side="left")
+    else:
+        pos = np.searchsorted(keys, new_keys, side="right")
+    at = pos + np.arange(len(pos))
+    rest = np.ones(len(order) + len(rows), dtype=bool)
+    rest[at] = False
+    merged = []
+    for old, new in ((order, rows), (keys, new_keys)):
+        out = np.empty(len(rest), dtype=np.result_type(old, new))
+        out[at] = new
+        out[rest] = old
+        merged.append(out)
+    return merged
+
+
+class ColumnTableModel(QAbstractTableModel):
+    """
+    Table model that reads directly from a ColumnStore.
+
+    Values are formatted only when the view asks for them, so the cost of a
+    repaint depends on the number of visible rows, not on the size of the
+    run. Sorting keeps a permutation of row indices computed with NumPy, with
+    the sorted keys; new rows are merged into it with a binary search, so
+    the history is neither sorted nor formatted again. A RowFilter limits
+    the rows to those it matches, kept up to date by a FilterIndex.
+
+    When the store is written by another thread, pass the writer's ``lock``
+    (e.g. ``LessEffortCallback.lock``); every read of the store holds it.
+    """
+
+    def __init__(self, default_prec=3, parent=None, lock=None):
+        super().__init__(parent)
+        self._lock = nullcontext() if lock is None else lock
+        self._store = None
+        self._columns = []
+        self._rows = 0
+        self._total_rows = 0
+        self._order = None
+        # Sort keys in display order, while sorted
+        self._sort_keys = None
+        # Absolute number of the store's oldest row, to follow evictions
+        self._oldest = 0
+        self._sort_column = None
+        self._sort_order = Qt.AscendingOrder
+        self._default_prec = default_prec
+        self._filter = None
+        self._filter_index = None
+        # Logical rows matching the filter, or None without one
+        self._visible = None
+        self.filter_error = None
+        # Seconds taken by the last filter evaluation
+        self.filter_time = 0.0
+
+    @property
+    def store(self):
+        return self._store
+
+    @property
+    def is_sorted(self):
+        return self._order is not None
+
+    @property
+    def row_filter(self):
+        return self._filter
+
+    def set_store(self, store):
+        """Display a new store, e.g. at the start of a run."""
+        with self._lock:
+            self._set_store(store)
+
+    def _set_store(self, store):
+        self.beginResetModel()
+        self._store = store
+        self._columns = [] if store is None else ["seq_num", "time"] + store.fields
+        self._total_rows = 0 if store is None else store.total_rows
+        self._oldest = 0 if store is None else store.total_rows - len(store)
+        self._order = None
+        self._sort_keys = None
+        self._apply_filter()
+        self.endResetModel()
+        if self._sort_column is not None:
+            self.sort(self._sort_column, self._sort_order)
+
+    def set_filter(self, row_filter):
+        """
+        Show only the rows matching a RowFilter; None shows every row.
+
+        An error evaluating the filter against the store is left in
+        ``filter_error``, and no rows are shown.
+        """
+        self._filter = row_filter
+        self.set_store(self._store)
+
+    def _apply_filter(self):
+        store = self._store
+        self._filter_index = None
+        self._visible = None
+        self.filter_error = None
+        if store is None:
+            self._rows = 0
+            return
+        if self._filter is None:
+            self._rows = len(store)
+            return
+        t0 = ttime.perf_counter()
+        try:
+            self._filter_index = FilterIndex(store, self._filter)
+        except ValueError as ex:
+            self.filter_error = str(ex)
+            self._visible = np.empty(0, dtype=np.intp)
+        else:
+            self._visible = self._filter_index.rows()
+        self.filter_time = ttime.perf_counter() - t0
+        self._rows = len(self._visible)
+
+    def _refresh_filtered(self, shift):
+        if self._filter_index is None:
+            return False
+        t0 = ttime.perf_counter()
+        try:
+            forgotten, added = self._filter_index.update()
+        except ValueError as ex:
+            self.filter_error = str(ex)
+            return False
+        self.filter_time = ttime.perf_counter() - t0
+        visible = self._filter_index.rows()
+
+        if self._order is not None:
+            self._visible = visible
+            self._merge_rows(visible[len(visible) - added :], shift)
+            return True
+
+        # Matches leave from the top as the ring moves, and arrive at the end
+        if forgotten:
+            self.beginRemoveRows(QModelIndex(), 0, forgotten - 1)
+            self._visible = visible[: self._rows - forgotten]
+            self._rows -= forgotten
+            self.endRemoveRows()
+        if added:
+            self.beginInsertRows(QModelIndex(), self._rows, len(visible) - 1)
+            self._rows = len(visible)
+            self.endInsertRows()
+        self._visible = visible
+        return bool(forgotten or added)
+
+    def refresh(self):
+        """
+        Announce rows appended to (or evicted from) the store since the last call.
+
+        Returns
+        -------
+        bool
+            True if the number of rows changed.
+        """
+        with self._lock:
+            return self._refresh()
+
+    def _refresh(self):
+        store = self._store
+        if store is None or store.total_rows == self._total_rows:
+            return False
+        n = len(store)
+        added = store.total_rows - self._total_rows
+        # Logical rows of the ring buffer shift down as the oldest are evicted
+        oldest = store.total_rows - n
+        shift = oldest - self._oldest
+        self._oldest = oldest
+        if self._filter is not None:
+            self._total_rows = store.total_rows
+            return self._refresh_filtered(shift)
+        # Rows overwritten by the ring buffer leave from the top
+        evicted = min(self._rows, self._rows + added - n)
+        self._total_rows = store.total_rows
+
+        if self._order is not None:
+            self._merge_rows(np.arange(max(0, n - added), n), shift)
+            return True
+
+        if evicted > 0:
+            self.beginRemoveRows(QModelIndex(), 0, evicted - 1)
+            self._rows -= evicted
+            self.endRemoveRows()
+        if n > self._rows:
+            self.beginInsertRows(QModelIndex(), self._rows, n - 1)
+            self._rows = n
+            self.endInsertRows()
+        return True
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self._rows
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._columns)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self._columns[section]
+        return None
+
+    def _format(self, name, value):
+        if name == "time":
+            return str(datetime.fromtimestamp(value).time())[:10]
+        if isinstance(value, (float, np.floating)):
+            prec = self._store.precisions.get(name, self._default_prec)
+            try:
+                return f"{value:.{int(prec)}f}"
+            except (TypeError, ValueError):
+                return f"{value:.{self._default_prec}f}"
+        if value is None:
+            return ""
+        return str(value)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or self._store is None:
+            return None
+        if role == Qt.TextAlignmentRole:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        if role != Qt.DisplayRole:
+            return None
+        row = index.row()
+        if self._order is not None:
+            row = self._order[row]
+        elif self._visible is not None:
+            row = self._visible[row]
+        name = self._columns[index.column()]
+        with self._lock:
+            value = self._store.value(row, name)
+        return self._format(name, value)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self._sort_column = column
+        self._sort_order = order
+        if self._store is None or column is None or column < 0:
+            self.layoutAboutToBeChanged.emit()
+            self._order = None
+            self.layoutChanged.emit()
+            return
+        name = self._columns[column]
+        with self._lock:
+            if self._visible is None:
+                values = self._store.column(name).copy()
+            else:
+                values = self._store.take(name, self._visible)
+        descending = order == Qt.DescendingOrder
+        try:
+            order_idx = _stable_order(values, descending)
+        except TypeError:
+            values = _str_keys(values)
+            order_idx = _stable_order(values, descending)
+        keys = values[order_idx]
+        if self._visible is not None:
+            order_idx = self._visible[order_idx]
+        self._set_order(order_idx, keys)
+
+    def _set_order(self, order, keys):
+        self.layoutAboutToBeChanged.emit()
+        self._order = order
+        self._sort_keys = keys
+        self._rows = len(order)
+        self.layoutChanged.emit()
+
+    def _merge_rows(self, rows, shift):
+        """
+        Update the sorted order for a refresh: drop the ``shift`` rows the
+        ring buffer evicted and merge the new logical ``rows`` in.
+        """
+        order, keys = self._order, self._sort_keys
+        if shift:
+            kept = order >= shift
+            order = order[kept] - shift
+            keys = keys[kept]
+        if len(rows):
+            descending = self._sort_order == Qt.DescendingOrder
+            new_keys = self._store.take(self._columns[self._sort_column], rows)
+            try:
+                if keys.dtype.kind == "U":
+                    new_keys = _str_keys(new_keys)
+                new_order = _stable_order(new_keys, descending)
+                order, keys = _merge(
+                    order,
+                    keys,
+                    rows[new_order],
+                    new_keys[new_order],
+                    descending,
+                )
+            except TypeError:
+                # Values that no longer compare: sort again by their text
+                self.sort(self._sort_column, self._sort_order)
+                return
+        self._set_order(order, keys)
+
+
+class QtColumnTableView(QWidget):
+    """
+    Virtualized QTableView of the current run, fed by a LessEffortCallback.
+
+    The callback must have its store enabled; the view follows
+    ``callback.primary_store`` and picks up new runs automatically. The run
+    chooser also shows the primary stream of the earlier runs still held by
+    ``callback.event_store``, and the filter bar limits the rows to a
+    RowFilter expression such as ``I0 > 1e5 and energy between 280 and 290``.
+    The footer shows the callback's running statistics of the live run.
+
+    Parameters
+    ----------
+    callback : LessEffortCallback
+    parent : QWidget, optional
+    refresh_interval : int
+        Milliseconds between checks for new rows.
+    """
+
+    def __init__(self, callback, parent=None, refresh_interval=100):
+        super().__init__(parent)
+        self.callback = callback
+        self.callback.enable_store()
+
+        self._model = ColumnTableModel(parent=self, lock=callback.lock)
+        self._view = QTableView()
+        self._view.setModel(self._model)
+        self._view.setFont(QFont("Monospace"))
+        self._view.setSortingEnabled(True)
+        self._view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self._view.setHorizontalScrollMode(QAbstractItemView.ScrollPerPixel)
+        # Fixed row heights and header widths keep layout independent of
+        # the number of rows
+        vheader = self._view.verticalHeader()
+        vheader.setSectionResizeMode(QHeaderView.Fixed)
+        vheader.setDefaultSectionSize(self._view.fontMetrics().height() + 4)
+        vheader.setVisible(False)
+        self._view.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+        self._view.horizontalHeader().setDefaultSectionSize(110)
+        self._view.sortByColumn(-1, Qt.AscendingOrder)
+
+        self._autoscroll_enabled = True
+        self._cb_autoscroll = QCheckBox("Autoscroll")
+        self._cb_autoscroll.setChecked(True)
+        self._cb_autoscroll.stateChanged.connect(self._cb_autoscroll_state_changed)
+        self._lb_rows = QLabel("")
+
+        # None follows the live run, otherwise a run start uid
+        self._run_uid = None
+        self._run_uids = []
+        self._cb_run = QComboBox()
+        self._cb_run.addItem("Live")
+        self._cb_run.setSizeAdjustPolicy(QComboBox.AdjustToContents)
+        self._cb_run.currentIndexChanged.connect(self._cb_run_index_changed)
+
+        self._le_filter = QLineEdit()
+        self._le_filter.setPlaceholderText(
+            "Filter rows, e.g. I0 > 1e5 and energy between 280 and 290"
+        )
+        self._le_filter.setClearButtonEnabled(True)
+        self._le_filter.returnPressed.connect(self._le_filter_return_pressed)
+        self._le_filter.textChanged.connect(self._le_filter_text_changed)
+
+        hbox = QHBoxLayout()
+        hbox.addWidget(self._cb_autoscroll)
+        hbox.addWidget(QLabel("Run:"))
+        hbox.addWidget(self._cb_run)
+        hbox.addStretch()
+        hbox.addWidget(self._lb_rows)
+        vbox = QVBoxLayout()
+        vbox.addLayout(hbox)
+        vbox.addWidget(self._le_filter)
+        vbox.addWidget(self._view)
+        self._lb_stats = QLabel("")
+        self._lb_stats.setWordWrap(True)
+        vbox.addWidget(self._lb_stats)
+        self.setLayout(vbox)
+
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self._refresh)
+        self._timer.start(refresh_interval)
+
+    def _cb_autoscroll_state_changed(self, state):
+        self._autoscroll_enabled = state == Qt.Checked
+
+    def _le_filter_return_pressed(self):
+        try:
+            row_filter = parse_filter(self._le_filter.text())
+        except ValueError as ex:
+            self._show_filter_error(str(ex))
+            return
+        self._model.set_filter(row_filter)
+        self._update_rows_label()
+
+    def _le_filter_text_changed(self, text):
+        # Clearing the field (e.g. with its clear button) removes the filter
+        if not text.strip() and self._model.row_filter is not None:
+            self._model.set_filter(None)
+            self._update_rows_label()
+
+    def _show_filter_error(self, message):
+        self._lb_rows.setStyleSheet("color: red")
+        self._lb_rows.setText(message)
+
+    def _update_rows_label(self):
+        store = self._model.store
+        if self._model.filter_error:
+            self._show_filter_error(self._model.filter_error)
+            return
+        self._lb_rows.setStyleSheet("")
+        if store is None:
+            self._lb_rows.setText("")
+        elif self._model.row_filter is None:
+            self._lb_rows.setText(f"Rows: {len(store)}")
+        else:
+            self._lb_rows.setText(
+                f"Rows: {self._model.rowCount()} of {len(store)} "
+                f"({self._model.filter_time * 1e3:.1f} ms)"
+            )
+
+    def _cb_run_index_changed(self, index):
+        if index <= 0 or index > len(self._run_uids):
+            self._run_uid = None
+        else:
+            self._run_uid = self._run_uids[index - 1]
+        self._refresh()
+
+    def _update_run_choices(self):
+        """List the runs held by the event store, newest first."""
+        uids = self.callback.event_store.run_uids()[::-1]
+        if uids == self._run_uids:
+            return
+        self._run_uids = uids
+        self._cb_run.blockSignals(True)
+        self._cb_run.clear()
+        self._cb_run.addItem("Live")
+        for uid in uids:
+            run = self.callback.event_store.get_run(uid)
+            self._cb_run.addItem(
+                f"scan {run.start_doc.get('scan_id', '?')} ({uid[:8]})"
+            )
+        if self._run_uid in uids:
+            self._cb_run.setCurrentIndex(uids.index(self._run_uid) + 1)
+        else:
+            self._run_uid = None
+            self._cb_run.setCurrentIndex(0)
+        self._cb_run.blockSignals(False)
+
+    def _selected_store(self):
+        if self._run_uid is None:
+            return self.callback.primary_store
+        run = self.callback.event_store.get_run(self._run_uid)
+        return None if run is None else run.stream("primary")
+
+    def _refresh(self):
+        # The callback may be writing the stores from a dispatcher thread
+        with self.callback.lock:
+            self._refresh_locked()
+
+    def _refresh_locked(self):
+        self._update_run_choices()
+        store = self._selected_store()
+        if store is not self._model.store:
+            self._model.set_store(store)
+            changed = True
+        else:
+            changed = self._model.refresh()
+        if not changed or store is None:
+            return
+        stats = self.callback.stats if self._run_uid is None else None
+        self._lb_stats.setText("" if stats is None else stats.summary_line())
+        self._update_rows_label()
+        if self._autoscroll_enabled and not self._model.is_sorted:
+            self._view.scrollToBottom()
@@ -0,0 +1,225 @@
+"""
+Display-rate limiting for the primary table.
+
+DisplayThrottle decides which rows of a fast stream are worth rendering. While
+events arrive faster than the target display rate it keeps the first row, a
+row every ``1/rate`` seconds, and any row where a dimension field moves by a
+significant fraction of the range seen so far. The last suppressed row is held
+so it can be shown when the run stops. When the arrival rate falls back below
+the target, every row is rendered again.
+"""
+
+import time
+
+import numpy as np
+from event_model import unpack_event_page
+
+
+def page_subset(doc, indices):
+    """Return a copy of an event_page holding only the rows at ``indices``."""
+    indices = list(indices)
+
+    def pick(values):
+        return [values[i] for i in indices]
+
+    subset = dict(doc)
+    for key in ("seq_num", "time", "uid"):
+        if key in doc:
+            subset[key] = pick(doc[key])
+    for key in ("data", "timestamps", "filled"):
+        if key in doc:
+            subset[key] = {k: pick(v) for k, v in doc[key].items()}
+    return subset
+
+
+class DisplayThrottle:
+    """
+    Choose the table rows to render for a target display rate.
+
+    Parameters
+    ----------
+    rate : float
+        Target number of rendered rows per second.
+    tolerance : float
+        A row is always shown when a dimension field crosses into a new bin
+        of this fraction of its range so far.
+    window : float
+        Seconds over which the arrival rate is estimated.
+    """
+
+    def __init__(self, rate, tolerance=0.05, window=0.5):
+        self.rate = rate
+        self.tolerance = tolerance
+        self.window = window
+        self.reset()
+
+    def reset(self, dim_fields=()):
+        """Start a new table, e.g. on a new descriptor."""
+        self.dim_fields = list(dim_fields)
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self._last_rate = 0.0
+        self._last_shown = None
+        self._last_dims = {}
+        self._dim_range = {}
+        self._pending = None
+        self.total_rows = 0
+        self.shown_rows = 0
+
+    def _arrival_rate(self, now):
+        elapsed = now - self._window_start
+        current = self._window_count / max(elapsed, self.window)
+        return max(self._last_rate, current)
+
+    @property
+    def arrival_rate(self):
+        """Estimated rows per second arriving, over the last window or two."""
+        return self._arrival_rate(time.monotonic())
+
+    @property
+    def throttling(self):
+        return self.arrival_rate > self.rate
+
+    def _count(self, n):
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed >= self.window:
+            self._last_rate = self._window_count / elapsed
+            self._window_start = now
+            self._window_count = 0
+        self._window_count += n
+        self.total_rows += n
+        return now
+
+    def _dim_arrays(self, data, times):
+        return {
+            field: np.atleast_1d(
+                np.asarray(times if field == "time" else data[field], dtype=float)
+            )
+            for field in self.dim_fields
+            if field == "time" or field in data
+        }
+
+    def _update_range(self, dims):
+        for field, values in dims.items():
+            if not len(values):
+                continue
+            lo, hi = np.nanmin(values), np.nanmax(values)
+            old = self._dim_range.get(field)
+            if old is not None:
+                lo, hi = min(lo, old[0]), max(hi, old[1])
+            self._dim_range[field] = (lo, hi)
+
+    def _moved(self, dims):
+        """
+        Boolean mask of rows where a dimension moved significantly.
+
+        Movement is counted from the last shown row in steps of ``tolerance``
+        times the range seen so far; a row is flagged when it enters a new
+        step, so a monotonic scan forces only about ``1 / tolerance`` rows
+        per traversal of its range.
+        """
+        n = len(next(iter(dims.values()))) if dims else 0
+        moved = np.zeros(n, dtype=bool)
+        for field, values in dims.items():
+            lo, hi = self._dim_range.get(field, (0.0, 0.0))
+            step = self.tolerance * (hi - lo)
+            last = self._last_dims.get(field)
+            if step <= 0 or last is None:
+                continue
+            steps = np.trunc((values - last) / step)
+            prev = np.empty_like(steps)
+            prev[0] = 0
+            prev[1:] = steps[:-1]
+            moved |= steps != prev
+        return moved
+
+    def accept(self, doc):
+        """
+        Decide whether to render one event.
+
+        Uses plain floats rather than NumPy, since this runs for every event.
+
+        Returns
+        -------
+        bool
+        """
+        now = self._count(1)
+        show = (
+            self._last_shown is None
+            or self._arrival_rate(now) <= self.rate
+            or now - self._last_shown >= 1 / self.rate
+        )
+        data = doc["data"]
+        dims = {}
+        for field in self.dim_fields:
+            value = doc["time"] if field == "time" else data.get(field)
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                continue
+            if value != value:
+                continue
+            dims[field] = value
+            lo, hi = self._dim_range.get(field, (value, value))
+            lo, hi = min(lo, value), max(hi, value)
+            self._dim_range[field] = (lo, hi)
+            last = self._last_dims.get(field)
+            if not show and last is not None and hi > lo:
+                show = abs(value - last) >= self.tolerance * (hi - lo)
+        if show:
+            self._last_shown = now
+            self._last_dims.update(dims)
+            self._pending = None
+            self.shown_rows += 1
+        else:
+            self._pending = doc
+        return show
+
+    def accept_page(self, doc):
+        """
+        Decide which rows of an event_page to render.
+
+        Returns
+        -------
+        numpy.ndarray
+            Indices of the rows to render, in order.
+        """
+        n = len(doc["seq_num"])
+        if not n:
+            return np.arange(0)
+        now = self._count(n)
+        try:
+            dims = self._dim_arrays(doc["data"], doc["time"])
+        except (TypeError, ValueError):
+            dims = {}
+        self._update_range(dims)
+        if self._arrival_rate(now) <= self.rate:
+            keep = np.arange(n)
+        else:
+            keep = np.flatnonzero(self._moved(dims))
+            # Spread the remaining display budget evenly over the page
+            since = now - self._last_shown if self._last_shown is not None else 1.0
+            budget = int(self.rate * since)
+            if self._last_shown is None:
+                budget = max(budget, 1)
+            if budget > 0:
+                stride = max(1, n // budget)
+                keep = np.union1d(keep, np.arange(0, n, stride)[:budget])
+        if len(keep):
+            self._last_shown = now
+            for field, values in dims.items():
+                self._last_dims[field] = float(values[keep[-1]])
+            self.shown_rows += len(keep)
+        if not len(keep) or keep[-1] != n - 1:
+            self._pending = next(iter(unpack_event_page(page_subset(doc, [n - 1]))))
+        else:
+            self._pending = None
+        return keep
+
+    def take_pending(self):
+        """Return the last suppressed event, if any, and forget it."""
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            self.shown_rows += 1
+        return pending
@@ -0,0 +1,463 @@
+"""
+Append-only local recording and replay of document streams.
+
+DocumentRecorder is a callback that writes every document it receives to a
+directory of segment files, so "what did the table show at 03:12" can be
+answered without going back to the broker. Each segment ``*.docs`` is a
+sequence of frames::
+
+    [4-byte big-endian length][msgpack [name, doc, receipt time]]
+
+and is accompanied by an index ``*.idx`` with the same framing, holding
+``["start", uid, time, scan_id, plan_name, offset]``,
+``["stop", run_start, time, exit_status, offset]`` and periodic
+``["time", time, offset]`` checkpoints. A segment is closed and a new one
+begun once it exceeds ``max_bytes``, so a run may continue in later
+segments.
+
+RecordingReader reads segments through mmap, one frame at a time, and
+``replay`` feeds a run back through any callback at recorded speed or as
+fast as possible. ``livetable-replay`` lists and replays recordings in the
+terminal or, with ``--qt``, in a QtReConsoleMonitor.
+"""
+
+from datetime import datetime
+import argparse
+import mmap
+import os
+import struct
+import threading
+import time
+
+import msgpack
+
+FRAME = struct.Struct("!I")
+
+# Documents tied to their run through another document
+_RUN_KEYS = {
+    "descriptor": "run_start",
+    "stop": "run_start",
+    "resource": "run_start",
+}
+
+
+def _default(obj):
+    # numpy scalars and arrays in event data
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError(f"Cannot serialize {type(obj)}")
+
+
+def pack_frame(obj):
+    """One length-prefixed msgpack frame."""
+    payload = msgpack.packb(obj, default=_default)
+    return FRAME.pack(len(payload)) + payload
+
+
+class DocumentRecorder:
+    """
+    Write documents to append-only segment files.
+
+    Subscribe it to a dispatcher like any callback.
+
+    Parameters
+    ----------
+    directory : str
+        Where segments are written; created if needed.
+    max_bytes : int
+        Size after which a new segment is begun.
+    max_segments : int, optional
+        Number of segments kept; the oldest are deleted. None keeps all.
+    checkpoint_interval : float
+        Seconds between time checkpoints in the index. Both files are
+        flushed at every checkpoint and at the end of every run, so readers
+        of a live recording lag by at most about this long.
+    """
+
+    def __init__(
+        self,
+        directory,
+        max_bytes=256 * 2**20,
+        max_segments=None,
+        checkpoint_interval=10.0,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_segments = max_segments
+        self.checkpoint_interval = checkpoint_interval
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._file = None
+        self._index = None
+        self._size = 0
+        self._counter = 0
+        self._last_checkpoint = 0.0
+
+    def __call__(self, name, doc):
+        name = getattr(name, "name", name)
+        now = time.time()
+        frame = pack_frame([name, doc, now])
+        with self._lock:
+            if self._file is None or self._size >= self.max_bytes:
+                self._rotate()
+            offset = self._size
+            checkpoint = now - self._last_checkpoint >= self.checkpoint_interval
+            if checkpoint:
+                self._index.write(pack_frame(["time", now, offset]))
+                self._last_checkpoint = now
+            if name == "start":
+                self._index.write(
+                    pack_frame(
+                        [
+                            "start",
+                            doc["uid"],
+                            doc.get("time", now),
+                            doc.get("scan_id"),
+                            doc.get("plan_name"),
+                            offset,
+                        ]
+                    )
+                )
+            elif name == "stop":
+                self._index.write(
+                    pack_frame(
+                        [
+                            "stop",
+                            doc.get("run_start"),
+                            doc.get("time", now),
+                            doc.get("exit_status"),
+                            offset,
+                        ]
+                    )
+                )
+            self._file.write(frame)
+            self._size += len(frame)
+            if checkpoint or name == "stop":
+                self._flush()
+
+    def _rotate(self):
+        self._close()
+        self._counter += 1
+        base = os.path.join(
+            self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{self._counter:04d}"
+        )
+        self._file = open(f"{base}.docs", "ab")
+        self._index = open(f"{base}.idx", "ab")
+        self._size = self._file.tell()
+        self._last_checkpoint = 0.0
+        if self.max_segments:
+            for path in segments(self.directory)[: -self.max_segments]:
+                for p in (path, path[: -len(".docs")] + ".idx"):
+                    try:
+                        os.remove(p)
+                    except OSError as ex:
+                        print(f"Exception occurred: {ex}")
+
+    def _flush(self):
+        self._file.flush()
+        self._index.flush()
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._index.close()
+            self._file = self._index = None
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._flush()
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+
+def segments(directory):
+    """Segment files of a recording, oldest first."""
+    return sorted(
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.endswith(".docs")
+    )
+
+
+def read_frames(path, offset=0):
+    """
+    Yield ``(offset, obj)`` for every complete frame of a file from
+    ``offset``, reading it through mmap. A partly written last frame is
+    left out.
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size <= offset:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield from unpack_frames(mm, offset)
+
+
+def unpack_frames(buffer, offset=0):
+    """
+    Yield ``(offset, obj)`` for every complete frame of ``buffer`` from
+    ``offset``; an incomplete last frame is left out.
+    """
+    size = len(buffer)
+    while offset + FRAME.size <= size:
+        (n,) = FRAME.unpack_from(buffer, offset)
+        end = offset + FRAME.size + n
+        if end > size:
+            return
+        yield offset, msgpack.unpackb(buffer[offset + FRAME.size : end])
+        offset = end
+
+
+class RecordingReader:
+    """
+    Runs and documents of a DocumentRecorder directory.
+
+    Parameters
+    ----------
+    directory : str
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def runs(self):
+        """
+        Recorded runs, oldest first.
+
+        Returns
+        -------
+        list of dict
+            With keys uid, time, scan_id, plan_name, segment, offset and,
+            once the run has stopped, stop_time and exit_status.
+        """
+        runs = {}
+        for segment in segments(self.directory):
+            index = segment[: -len(".docs")] + ".idx"
+            if not os.path.exists(index):
+                continue
+            for _, entry in read_frames(index):
+                if entry[0] == "start":
+                    _, uid, t, scan_id, plan_name, offset = entry
+                    runs[uid] = {
+                        "uid": uid,
+                        "time": t,
+                        "scan_id": scan_id,
+                        "plan_name": plan_name,
+                        "segment": segment,
+                        "offset": offset,
+                    }
+                elif entry[0] == "stop" and entry[1] in runs:
+                    runs[entry[1]].update(stop_time=entry[2], exit_status=entry[3])
+        return sorted(runs.values(), key=lambda run: run["time"])
+
+    def find_run(self, uid):
+        """The run whose uid starts with ``uid``."""
+        matches = [run for run in self.runs() if run["uid"].startswith(uid)]
+        if len(matches) != 1:
+            raise KeyError(f"{len(matches)} recorded runs match {uid!r}")
+        return matches[0]
+
+    def run_at(self, t):
+        """The last run started at or before ``t`` (seconds since the epoch)."""
+        started = [run for run in self.runs() if run["time"] <= t]
+        if not started:
+            raise KeyError(f"No run recorded before {datetime.fromtimestamp(t)}")
+        return started[-1]
+
+    def frames(self, segment=None, offset=0):
+        """
+        Yield ``(name, doc, receipt time)`` from ``segment`` and ``offset``
+        (by default the oldest segment) to the end of the recording.
+        """
+        paths = segments(self.directory)
+        if segment is not None:
+            paths = paths[paths.index(segment) :]
+        for path in paths:
+            for _, (name, doc, t) in read_frames(path, offset):
+                yield name, doc, t
+            offset = 0
+
+    def since(self, t):
+        """Yield every document received at or after ``t``."""
+        segment, offset = None, 0
+        for path in segments(self.directory):
+            index = path[: -len(".docs")] + ".idx"
+            if not os.path.exists(index):
+                continue
+            for _, entry in read_frames(index):
+                if entry[0] == "time" and entry[1] <= t:
+                    segment, offset = path, entry[2]
+        for name, doc, received in self.frames(segment, offset):
+            if received >= t:
+                yield name, doc, received
+
+    def documents(self, run, until=None):
+        """
+        Yield ``(name, doc, receipt time)`` of one run, from its start to
+        its stop, or to the end of the recording or ``until``.
+
+        Parameters
+        ----------
+        run : dict
+            As returned by ``runs``.
+        until : float, optional
+            Stop at the first document received after this time.
+        """
+        uid = run["uid"]
+        descriptors, resources = set(), set()
+        for name, doc, t in self.frames(run["segment"], run["offset"]):
+            if until is not None and t > until:
+                return
+            if name == "start":
+                belongs = doc["uid"] == uid
+            elif name in _RUN_KEYS:
+                belongs = doc.get(_RUN_KEYS[name]) == uid
+            elif name in ("event", "event_page"):
+                belongs = doc["descriptor"] in descriptors
+            elif name in ("datum", "datum_page"):
+                belongs = doc["resource"] in resources
+            else:
+                belongs = False
+            if not belongs:
+                continue
+            if name == "descriptor":
+                descriptors.add(doc["uid"])
+            elif name == "resource":
+                resources.add(doc["uid"])
+            yield name, doc, t
+            if name == "stop":
+                return
+
+
+def replay(documents, callback, speed=None, continue_polling=None):
+    """
+    Feed recorded documents to ``callback(name, doc)``.
+
+    Parameters
+    ----------
+    documents : iterable of (name, doc, receipt time)
+    callback : callable
+    speed : float, optional
+        Replay at this multiple of the recorded pace; None replays as fast
+        as possible.
+    continue_polling : callable, optional
+        Checked before every document; replay ends when it returns False.
+    """
+    first = None
+    t0 = time.monotonic()
+    for name, doc, t in documents:
+        if continue_polling is not None and not continue_polling():
+            return
+        if speed:
+            if first is None:
+                first = t
+            delay = (t - first) / speed - (time.monotonic() - t0)
+            if delay > 0:
+                time.sleep(delay)
+        callback(name, doc)
+
+
+def parse_time(text):
+    """An ISO date and time, or a time of day today, as seconds since the epoch."""
+    try:
+        return datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        pass
+    t = datetime.strptime(text, "%H:%M:%S" if text.count(":") == 2 else "%H:%M")
+    return datetime.combine(datetime.now().date(), t.time()).timestamp()
+
+
+def add_record_arguments(parser):
+    """Add the --record options to an argparse parser."""
+    parser.add_argument(
+        "--record", metavar="DIR", default=None, help="record all documents to DIR"
+    )
+    parser.add_argument(
+        "--record-max-mb",
+        type=float,
+        default=256,
+        help="size of each recording segment in MiB",
+    )
+    parser.add_argument(
+        "--record-max-segments",
+        type=int,
+        default=None,
+        help="number of recording segments kept (default: all)",
+    )
+
+
+def make_recorder(args):
+    """A DocumentRecorder from ``add_record_arguments`` options, or None."""
+    if not args.record:
+        return None
+    return DocumentRecorder(
+        args.record,
+        max_bytes=int(args.record_max_mb * 2**20),
+        max_segments=args.record_max_segments,
+    )
+
+
+def _list_runs(reader):
+    for run in reader.runs():
+        started = datetime.fromtimestamp(run["time"]).strftime("%Y-%m-%d %H:%M:%S")
+        if "stop_time" in run:
+            status = f"{run['stop_time'] - run['time']:.0f} s, {run['exit_status']}"
+        else:
+            status = "no stop"
+        print(
+            f"{started}  {str(run['scan_id']):>6}  {run['uid'][:8]}  "
+            f"{str(run['plan_name']):<20}  {status}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded documents")
+    parser.add_argument("directory", help="recording directory")
+    choice = parser.add_mutually_exclusive_group()
+    choice.add_argument("--run", help="replay the run with this uid (or uid prefix)")
+    choice.add_argument(
+        "--at",
+        help="show the table as it was at this time (e.g. 03:12 or 2024-05-01T03:12)",
+    )
+    choice.add_argument(
+        "--since", help="replay every document recorded from this time on"
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=None,
+        help="replay at this multiple of real time (default: as fast as possible)",
+    )
+    parser.add_argument(
+        "--qt", action="store_true", help="replay into a QtReConsoleMonitor window"
+    )
+    args = parser.parse_args()
+
+    reader = RecordingReader(args.directory)
+    if args.run:
+        documents = reader.documents(reader.find_run(args.run))
+    elif args.at:
+        t = parse_time(args.at)
+        documents = reader.documents(reader.run_at(t), until=t)
+    elif args.since:
+        documents = reader.since(parse_time(args.since))
+    else:
+        _list_runs(reader)
+        return
+
+    if args.qt:
+        from .QtReplayTable import replay_window
+
+        replay_window(documents, speed=args.speed)
+        return
+
+    from .lessEffortCallback import LessEffortCallback
+
+    replay(documents, LessEffortCallback(), speed=args.speed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Display client for a fan-out server (see fanoutServer).
+
+FanoutTableModel receives lines already rendered by the server, so a client
+neither connects to the broker nor formats tables; it only queues the lines
+for QtReConsoleMonitor. On connect it loads a snapshot of the current run, so
+a client opened mid-scan starts with the heading and header.
+"""
+
+import argparse
+import sys
+import threading
+
+import msgpack
+import zmq
+from qtpy.QtGui import QFont
+from qtpy.QtWidgets import QApplication, QMainWindow
+
+from .fanoutServer import HEADER
+from .simpleConsoleMonitor import QtReConsoleMonitor
+from .tableModel import BaseLiveTableModel
+
+
+class FanoutTableModel(BaseLiveTableModel):
+    """
+    Table model fed by a FanoutPublisher.
+
+    Parameters
+    ----------
+    address : str
+        host:port of the server's PUB socket.
+    snapshot_address : str
+        host:port of the server's snapshot socket.
+    snapshot_timeout : float
+        Seconds to wait for a snapshot before showing live lines only.
+    **kwargs
+        Passed to BaseLiveTableModel.
+    """
+
+    def __init__(
+        self,
+        address="localhost:5590",
+        snapshot_address="localhost:5591",
+        snapshot_timeout=2.0,
+        parent=None,
+        **kwargs,
+    ):
+        super().__init__(parent=parent, **kwargs)
+        # No local callback: tables are rendered by the server
+        self.callback = None
+        self.address = address
+        self.snapshot_address = snapshot_address
+        self.snapshot_timeout = snapshot_timeout
+        self._epoch = None
+        self._last_seq = 0
+        self._thread = None
+        self._start_receiving()
+
+    def _start_receiving(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._receive, daemon=True)
+            self._thread.start()
+
+    def start_console_output_monitoring(self):
+        super().start_console_output_monitoring()
+        self._start_receiving()
+
+    def _handle(self, kind, payload):
+        if kind == b"msg":
+            self.newMsg(msgpack.unpackb(payload))
+        elif kind == b"rows":
+            msg, first_seq, last_seq, nrows = msgpack.unpackb(payload)
+            self.newRows(msg, first_seq, last_seq, nrows)
+
+    def _load_snapshot(self, context):
+        req = context.socket(zmq.REQ)
+        req.setsockopt(zmq.LINGER, 0)
+        req.connect(f"tcp://{self.snapshot_address}")
+        try:
+            req.send(b"snapshot")
+            if not req.poll(int(self.snapshot_timeout * 1000)):
+                self.newMsg("Snapshot unavailable, showing live lines only")
+                return
+            snapshot = msgpack.unpackb(req.recv())
+        finally:
+            req.close()
+        self._epoch = snapshot["epoch"]
+        self._last_seq = snapshot["seq"]
+        for kind, payload in snapshot["items"]:
+            self._handle(kind, payload)
+
+    def _receive(self):
+        context = zmq.Context.instance()
+        sub = context.socket(zmq.SUB)
+        sub.connect(f"tcp://{self.address}")
+        sub.setsockopt(zmq.SUBSCRIBE, b"msg")
+        sub.setsockopt(zmq.SUBSCRIBE, b"rows")
+        # Subscribe before asking for the snapshot, so nothing published in
+        # between is lost; duplicates are dropped by sequence number
+        self._load_snapshot(context)
+        try:
+            while not self._stop_console_monitor:
+                if not sub.poll(200):
+                    continue
+                kind, header, payload = sub.recv_multipart()
+                epoch, seq = HEADER.unpack(header)
+                if epoch != self._epoch:
+                    if self._epoch is not None:
+                        self.newMsg("— fan-out server restarted —")
+                    self._epoch = epoch
+                    self._last_seq = seq - 1
+                if seq <= self._last_seq:
+                    continue
+                if seq > self._last_seq + 1:
+                    self.newMsg(f"… {seq - self._last_seq - 1} messages missed")
+                self._last_seq = seq
+                self._handle(kind, payload)
+        finally:
+            sub.close(linger=0)
+
+
+def fanout_console_monitor(
+    address="localhost:5590", snapshot_address="localhost:5591", parent=None, **kwargs
+):
+    """QtReConsoleMonitor in client mode, showing a fan-out server's table."""
+    model = FanoutTableModel(address, snapshot_address, **kwargs)
+    monitor = QtReConsoleMonitor(model, parent)
+    font = monitor._text_edit.font()
+    font.setFamily("Monospace")
+    font.setStyleHint(QFont.Monospace)
+    monitor._text_edit.setFont(font)
+    monitor.destroyed.connect(lambda *_: model.stop_console_output_monitoring())
+    return monitor
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LiveTable fan-out client")
+    parser.add_argument(
+        "--address", default="localhost:5590", help="server's publish host:port"
+    )
+    parser.add_argument(
+        "--snapshot-address",
+        default="localhost:5591",
+        help="server's snapshot host:port",
+    )
+    args = parser.parse_args()
+    app = QApplication([])
+
+    main_window = QMainWindow()
+    central_widget = fanout_console_monitor(
+        args.address, args.snapshot_address, parent=main_window
+    )
+    main_window.setCentralWidget(central_widget)
+    main_window.show()
+    app_ref = app.exec_()
+    sys.exit(app_ref)
+
+
+if __name__ == "__main__":
+    main()
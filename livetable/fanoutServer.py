@@ -0,0 +1,284 @@
+"""
+Render once, display many times.
+
+A headless server consumes documents from Kafka or ZMQ once, renders them
+through one LessEffortCallback, and republishes the rendered lines on a ZMQ
+PUB socket. Any number of display clients (see fanoutClient) subscribe to it,
+so broker egress and rendering cost do not grow with the number of screens.
+
+Every published message is a three-frame multipart message::
+
+    [kind, header, payload]
+
+where ``kind`` is ``b"msg"`` (a line that must not be dropped), ``b"rows"``
+(table rows: ``[text, first_seq, last_seq, nrows]``) or ``b"data"`` (the
+primary stream's columnar rows as an event_page, only with
+``publish_data``), ``header`` packs the server epoch and a sequence number
+as ``"!IQ"``, and ``payload`` is msgpack. Sequence numbers are consecutive
+over ``msg`` and ``rows`` messages, so clients can spot gaps; ``data``
+messages carry sequence number 0.
+
+A REP socket serves snapshots of the current run to late-joining clients:
+``{"epoch": ..., "seq": ..., "items": [[kind, payload], ...]}``. A client
+subscribes first, then asks for a snapshot and ignores published messages
+up to the snapshot's ``seq``.
+"""
+
+from collections import deque
+import argparse
+import random
+import struct
+import threading
+
+import msgpack
+import zmq
+from event_model import pack_event_page
+
+from .documentRecorder import add_record_arguments, make_recorder
+from .kafkaDispatcher import START_FROM
+from .lessEffortCallback import LessEffortCallback
+from .offsetCheckpoint import add_checkpoint_arguments, make_checkpoint
+from .pipelineMetrics import add_metrics_arguments, start_metrics
+from .profiling import add_profile_arguments, start_profiling
+
+HEADER = struct.Struct("!IQ")
+
+
+def _default(obj):
+    # numpy scalars and arrays in event data
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError(f"Cannot serialize {type(obj)}")
+
+
+def pack(obj):
+    return msgpack.packb(obj, default=_default)
+
+
+class FanoutPublisher:
+    """
+    Publish rendered lines to display clients.
+
+    Use ``out`` and ``row_out`` as the outputs of a LessEffortCallback, and
+    subscribe the publisher itself to the dispatcher *before* the callback,
+    so the snapshot is reset before a new run is rendered.
+
+    Parameters
+    ----------
+    publish_address : str
+        Address the PUB socket binds to.
+    snapshot_address : str
+        Address the snapshot REP socket binds to.
+    max_rows : int
+        Maximum number of messages kept in the snapshot from the run's
+        first row on, in order, including repeated table headers. The lines
+        before it (heading, first header, baseline) are always kept.
+    publish_data : bool
+        Also publish the primary stream's data as event pages.
+    """
+
+    def __init__(
+        self,
+        publish_address="tcp://*:5590",
+        snapshot_address="tcp://*:5591",
+        max_rows=10000,
+        publish_data=False,
+    ):
+        self._context = zmq.Context.instance()
+        self._pub = self._context.socket(zmq.PUB)
+        self._pub.bind(publish_address)
+        self.publish_data = publish_data
+        self.epoch = random.getrandbits(32)
+        self._seq = 0
+        self._lock = threading.Lock()
+        # (seq, kind, payload) of the current run: its preamble, then the
+        # latest rows and the lines between them
+        self._messages = []
+        self._rows = deque(maxlen=max_rows)
+        self._rows_started = False
+        self._data_descriptors = set()
+        self._stopped = threading.Event()
+        self._snapshot_thread = threading.Thread(
+            target=self._serve_snapshots, args=(snapshot_address,), daemon=True
+        )
+        self._snapshot_thread.start()
+
+    def __call__(self, name, doc):
+        if name == "start":
+            with self._lock:
+                self._messages.clear()
+                self._rows.clear()
+                self._rows_started = False
+            self._data_descriptors.clear()
+        if not self.publish_data:
+            return
+        if name == "descriptor" and doc.get("name", "primary") == "primary":
+            self._data_descriptors.add(doc["uid"])
+        elif name == "event" and doc["descriptor"] in self._data_descriptors:
+            self._publish_data(pack_event_page(doc))
+        elif name == "event_page" and doc["descriptor"] in self._data_descriptors:
+            self._publish_data(doc)
+
+    def out(self, msg):
+        self._publish(b"msg", pack(msg))
+
+    def row_out(self, msg, first_seq=None, last_seq=None, nrows=1):
+        self._publish(b"rows", pack([msg, first_seq, last_seq, nrows]))
+
+    def _publish(self, kind, payload):
+        with self._lock:
+            self._seq += 1
+            item = (self._seq, kind, payload)
+            if kind == b"rows":
+                self._rows_started = True
+            if self._rows_started:
+                self._rows.append(item)
+            else:
+                self._messages.append(item)
+            self._pub.send_multipart([kind, HEADER.pack(self.epoch, self._seq), payload])
+
+    def _publish_data(self, page):
+        page = {
+            key: page[key] for key in ("descriptor", "seq_num", "time", "data", "uid")
+        }
+        with self._lock:
+            self._pub.send_multipart(
+                [b"data", HEADER.pack(self.epoch, 0), pack(page)]
+            )
+
+    def snapshot(self):
+        """Everything a late-joining client needs to show the current run."""
+        with self._lock:
+            items = self._messages + list(self._rows)
+            seq = self._seq
+        return {
+            "epoch": self.epoch,
+            "seq": seq,
+            "items": [[kind, payload] for _, kind, payload in items],
+        }
+
+    def _serve_snapshots(self, address):
+        rep = self._context.socket(zmq.REP)
+        rep.bind(address)
+        try:
+            while not self._stopped.is_set():
+                if not rep.poll(200):
+                    continue
+                rep.recv()
+                rep.send(pack(self.snapshot()))
+        finally:
+            rep.close(linger=0)
+
+    def close(self):
+        self._stopped.set()
+        self._snapshot_thread.join()
+        self._pub.close(linger=0)
+
+
+def fanout_server(
+    source="kafka",
+    beamline_acronym=None,
+    config_file="/etc/bluesky/kafka.yml",
+    topic_string="bluesky.runengine.documents",
+    zmq_address="localhost:5578",
+    publish_address="tcp://*:5590",
+    snapshot_address="tcp://*:5591",
+    publish_data=False,
+    start_from="latest-start",
+    recorder=None,
+    group_id=None,
+    checkpoint=None,
+):
+    """Consume, render once and publish until interrupted."""
+    publisher = FanoutPublisher(
+        publish_address, snapshot_address, publish_data=publish_data
+    )
+    callback = LessEffortCallback(out=publisher.out, row_out=publisher.row_out)
+    if source == "kafka":
+        from .kafka_table import make_kafka_dispatcher
+
+        dispatcher = make_kafka_dispatcher(
+            beamline_acronym,
+            config_file,
+            topic_string,
+            start_from=start_from,
+            group_id=group_id,
+            checkpoint=checkpoint,
+        )
+        dispatcher.subscribe_catchup(callback.set_catching_up)
+    else:
+        from bluesky.callbacks.zmq import RemoteDispatcher
+
+        dispatcher = RemoteDispatcher(zmq_address)
+    if recorder is not None:
+        dispatcher.subscribe(recorder)
+    dispatcher.subscribe(publisher)
+    dispatcher.subscribe(callback)
+    try:
+        dispatcher.start()
+    finally:
+        publisher.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LiveTable fan-out server")
+    parser.add_argument("--source", choices=("kafka", "zmq"), default="kafka")
+    parser.add_argument("--bl", help="Beamline acronym used for kafka topic")
+    parser.add_argument(
+        "--config-file",
+        default="/etc/bluesky/kafka.yml",
+        help="kafka config file location",
+    )
+    parser.add_argument(
+        "--topic-string",
+        default="bluesky.runengine.documents",
+        help="string to be combined with acronym to create topic",
+    )
+    parser.add_argument(
+        "--start-from",
+        choices=START_FROM,
+        default="latest-start",
+        help="begin at the most recent run, or at the consumer's committed offsets",
+    )
+    parser.add_argument(
+        "--zmq-address", default="localhost:5578", help="0MQ proxy to read from"
+    )
+    parser.add_argument(
+        "--publish", default="tcp://*:5590", help="address to publish lines on"
+    )
+    parser.add_argument(
+        "--snapshot", default="tcp://*:5591", help="address to serve snapshots on"
+    )
+    parser.add_argument(
+        "--data",
+        action="store_true",
+        help="also publish the primary stream's data as event pages",
+    )
+    add_metrics_arguments(parser)
+    add_profile_arguments(parser)
+    add_record_arguments(parser)
+    add_checkpoint_arguments(parser)
+    args = parser.parse_args()
+    if args.source == "kafka" and not args.bl:
+        parser.error("--bl is required with --source kafka")
+    start_metrics(args)
+    start_profiling(args)
+
+    fanout_server(
+        source=args.source,
+        beamline_acronym=args.bl,
+        config_file=args.config_file,
+        topic_string=args.topic_string,
+        zmq_address=args.zmq_address,
+        publish_address=args.publish,
+        snapshot_address=args.snapshot,
+        publish_data=args.data,
+        start_from=args.start_from,
+        recorder=make_recorder(args),
+        group_id=args.group_id,
+        checkpoint=make_checkpoint(args),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,564 @@
+"""
+Kafka document dispatcher for the live table.
+
+KafkaDispatcher polls a confluent_kafka Consumer directly instead of going
+through bluesky_kafka.RemoteDispatcher, so that it can position the consumer
+before the first document is read.
+
+With ``start_from="latest-start"`` each assigned partition is moved to the
+most recent ``start`` document, so the table opens on the run in progress
+instead of replaying the topic's retention or waiting for the next run. The
+documents between that ``start`` and the end of the partition at assignment
+time are replayed at full speed as a catch-up; functions registered with
+``subscribe_catchup`` are called with True when it begins and False once it
+is done, so renderers can skip intermediate rows. A partition's catch-up
+ends when the consumer has passed that end offset; empty polls do not end
+it, since the first fetch after seeking can take longer than a poll. Only
+if no progress is made for ``catchup_idle_timeout`` seconds (e.g. the end
+offset is a transaction marker the consumer never reports) is it ended
+anyway.
+
+With an OffsetCheckpoint, partitions the checkpoint knows resume where the
+previous process stopped, moved back to the ``start`` of the run that was
+in progress, and the gap is replayed as the same catch-up, without
+searching the partition. A gap longer than ``max_lookback`` messages falls
+back to the most recent ``start``, so the time to go live after a restart
+is bounded by one run rather than by the topic's retention.
+
+One dispatcher can serve several topics, or a topic pattern (a regular
+expression starting with ``^``). ``subscribe`` receives the documents of
+every topic; ``subscribe_topic`` and ``on_new_topic`` route each topic to its
+own callbacks, so N beamlines share one consumer and one broker connection.
+"""
+
+import re
+import threading
+import time
+
+import msgpack
+from bluesky.run_engine import Dispatcher, DocumentNames
+
+from .pipelineMetrics import metrics
+from .profiling import profiler
+
+START_FROM = ("latest-start", "committed")
+
+
+def document_name(value):
+    """
+    Read the document name from a msgpack-encoded (name, doc) message.
+
+    Only the name is decoded, which makes scanning a partition for ``start``
+    documents cheap even when events are large.
+    """
+    unpacker = msgpack.Unpacker(raw=False)
+    unpacker.feed(value)
+    unpacker.read_array_header()
+    return unpacker.unpack()
+
+
+class KafkaDispatcher(Dispatcher):
+    """
+    Dispatch documents from Kafka topics to bluesky callbacks.
+
+    Parameters
+    ----------
+    topics : list of str
+        Topics to subscribe to. Entries starting with ``^`` are regular
+        expressions matched against all topics on the broker.
+    bootstrap_servers : str
+        Comma-delimited list of Kafka server addresses.
+    group_id : str
+        Kafka consumer group id.
+    consumer_config : dict, optional
+        Additional confluent_kafka.Consumer configuration.
+    polling_duration : float
+        Seconds to wait for messages in each poll.
+    deserializer : callable
+        Turns a message value into a (name, doc) pair.
+    start_from : str
+        "latest-start" to begin each partition at its most recent ``start``
+        document, or "committed" to leave positioning to Kafka (committed
+        offsets, then ``auto.offset.reset``).
+    max_lookback : int
+        Maximum number of messages per partition searched backwards for a
+        ``start`` document. If none is found the partition starts at its end.
+    batch_size : int
+        Maximum number of messages fetched per poll.
+    checkpoint : OffsetCheckpoint, optional
+        Where positions are saved, and resumed from with "latest-start".
+    catchup_idle_timeout : float
+        Seconds without progress after which a catch-up is ended although
+        its end offset was not reached.
+
+    ``connected`` is False until the broker has answered: a partition
+    assignment, a message or, without topics, a metadata request. Errors
+    reported by the consumer's ``error_cb`` reset it; see ``on_connected``
+    and ``on_error``.
+    """
+
+    def __init__(
+        self,
+        topics,
+        bootstrap_servers,
+        group_id,
+        consumer_config=None,
+        polling_duration=0.05,
+        deserializer=msgpack.loads,
+        start_from="latest-start",
+        max_lookback=100_000,
+        batch_size=500,
+        checkpoint=None,
+        catchup_idle_timeout=10.0,
+    ):
+        from confluent_kafka import Consumer
+
+        super().__init__()
+        if start_from not in START_FROM:
+            raise ValueError(
+                f"Unknown start_from {start_from!r}, use one of {START_FROM}"
+            )
+        config = dict(consumer_config or {})
+        servers = bootstrap_servers.split(",")
+        if "bootstrap.servers" in config:
+            servers.extend(config.pop("bootstrap.servers").split(","))
+        config["bootstrap.servers"] = ",".join(servers)
+        config["group.id"] = group_id
+        # Without error_cb: errors of the short-lived scout consumers of
+        # _seek_to_latest_start are raised by their calls instead
+        self._config = dict(config)
+        self._error_cb = config.get("error_cb")
+        config["error_cb"] = self._on_error
+        self.topics = list(topics)
+        self.polling_duration = polling_duration
+        self.start_from = start_from
+        self.max_lookback = max_lookback
+        self.batch_size = batch_size
+        self._deserializer = deserializer
+        # (topic, partition) -> offset of the last message to replay
+        self._catchup = {}
+        self.catchup_idle_timeout = catchup_idle_timeout
+        # monotonic time of the last progress of a catch-up
+        self._catchup_progress = time.monotonic()
+        # topic, or None for all topics -> functions called on catch-up
+        self._catchup_callbacks = {}
+        # topic -> Dispatcher for the callbacks of that topic only
+        self._routes = {}
+        self._new_topic_callbacks = []
+        self._topics_seen = set()
+        # (topic, partition) -> next offset, kept across rebalances so a
+        # subscription change does not replay partitions already consumed
+        self._positions = {}
+        # (topic, partition) -> offset of the start of the run in progress
+        self._run_starts = {}
+        self.checkpoint = checkpoint
+        self._pending_topics = None
+        self._topics_lock = threading.Lock()
+        self._running = False
+        self.closed = False
+        self.connected = False
+        self._connected_callbacks = []
+        self._error_callbacks = []
+        self._consumer = Consumer(config)
+        if self.topics:
+            self._consumer.subscribe(self.topics, on_assign=self._on_assign)
+
+    def subscribe_topic(self, topic, func):
+        """
+        Send documents from ``topic`` only to ``func(name, doc)``.
+
+        Returns
+        -------
+        int
+            Token for ``unsubscribe_topic``.
+        """
+        route = self._routes.get(topic)
+        if route is None:
+            route = self._routes[topic] = Dispatcher()
+        return route.subscribe(func)
+
+    def unsubscribe_topic(self, topic, token=None):
+        """
+        Remove one routed callback, or if ``token`` is None all callbacks
+        and catch-up functions of the topic. The topic then counts as new
+        again for ``on_new_topic``.
+        """
+        if token is None:
+            self._routes.pop(topic, None)
+            self._catchup_callbacks.pop(topic, None)
+            self._topics_seen.discard(topic)
+        elif topic in self._routes:
+            self._routes[topic].unsubscribe(token)
+
+    def on_new_topic(self, func):
+        """
+        Call ``func(topic)`` before the first document of a topic without
+        routed callbacks is dispatched, e.g. to create a callback for it.
+        """
+        self._new_topic_callbacks.append(func)
+
+    def on_connected(self, func):
+        """
+        Call ``func()`` once the broker has answered, and again after it
+        answers following an error.
+        """
+        self._connected_callbacks.append(func)
+
+    def on_error(self, func):
+        """Call ``func(error)`` with every error reported by the consumer."""
+        self._error_callbacks.append(func)
+
+    def _set_connected(self):
+        if self.connected:
+            return
+        self.connected = True
+        for func in self._connected_callbacks:
+            try:
+                func()
+            except Exception as ex:
+                print(f"Exception occurred: {ex}")
+
+    def _on_error(self, error):
+        # Called by the consumer from within consume(), in the polling thread
+        self.connected = False
+        for func in self._error_callbacks:
+            try:
+                func(error)
+            except Exception as ex:
+                print(f"Exception occurred: {ex}")
+        if self._error_cb is not None:
+            self._error_cb(error)
+
+    def set_topics(self, topics):
+        """
+        Change the subscription.
+
+        The change is applied by the polling loop, because the consumer must
+        only be used from one thread.
+        """
+        with self._topics_lock:
+            self._pending_topics = list(topics)
+
+    def subscribe_catchup(self, func, topic=None):
+        """
+        Call ``func(catching_up)`` when a catch-up of ``topic`` (or of all
+        topics, if None) begins and ends. If that catch-up is already under
+        way ``func(True)`` is called immediately.
+        """
+        self._catchup_callbacks.setdefault(topic, []).append(func)
+        if self._topic_catching_up(topic):
+            self._call_catchup(func, True)
+
+    @property
+    def catching_up(self):
+        return bool(self._catchup)
+
+    def _topic_catching_up(self, topic):
+        if topic is None:
+            return bool(self._catchup)
+        return any(t == topic for t, _ in list(self._catchup))
+
+    def _call_catchup(self, func, catching_up):
+        try:
+            func(catching_up)
+        except Exception as ex:
+            print(f"Exception occurred: {ex}")
+
+    def _set_catching_up(self, topic, catching_up):
+        for func in self._catchup_callbacks.get(topic, ()):
+            self._call_catchup(func, catching_up)
+
+    def _on_assign(self, consumer, partitions):
+        from confluent_kafka import OFFSET_INVALID
+
+        new = []
+        for tp in partitions:
+            position = self._positions.get((tp.topic, tp.partition))
+            if position is not None:
+                tp.offset = position
+            else:
+                tp.offset = OFFSET_INVALID
+                new.append(tp)
+        if new and self.start_from == "latest-start":
+            was_catching_up = bool(self._catchup)
+            self._seek_to_latest_start(new)
+            self._catchup_progress = time.monotonic()
+            for topic in {t for t, _ in self._catchup}:
+                self._set_catching_up(topic, True)
+            if self._catchup and not was_catching_up:
+                self._set_catching_up(None, True)
+        consumer.assign(partitions)
+        self._set_connected()
+
+    def _seek_to_latest_start(self, partitions):
+        """Set each partition's offset to its most recent ``start`` document."""
+        from confluent_kafka import OFFSET_END, Consumer
+
+        # A separate consumer reads backwards without disturbing the group
+        config = dict(self._config)
+        config["group.id"] = f"{config['group.id']}-scout"
+        config["enable.auto.commit"] = False
+        scout = Consumer(config)
+        try:
+            for tp in partitions:
+                low, high = scout.get_watermark_offsets(tp, timeout=5.0)
+                offset = self._checkpoint_offset(tp, low, high)
+                if offset is None:
+                    offset = self._find_latest_start(scout, tp, low, high)
+                if offset is None:
+                    tp.offset = OFFSET_END
+                    continue
+                tp.offset = offset
+                if offset < high:
+                    self._catchup[(tp.topic, tp.partition)] = high - 1
+        finally:
+            scout.close()
+
+    def _checkpoint_offset(self, tp, low, high):
+        """Checkpointed offset of a partition, if it is still worth replaying."""
+        if self.checkpoint is None:
+            return None
+        offset = self.checkpoint.resume_offset(tp.topic, tp.partition)
+        if offset is None or not low <= offset <= high:
+            # Unknown, expired from the topic, or from a recreated topic
+            return None
+        if high - offset > self.max_lookback:
+            return None
+        return offset
+
+    def _find_latest_start(self, scout, tp, low, high):
+        """Offset of the last ``start`` document in [low, high), or None."""
+        end = high
+        window = min(self.batch_size, self.max_lookback)
+        while end > low and high - end < self.max_lookback:
+            begin = max(low, end - window, high - self.max_lookback)
+            found = None
+            for msg in self._read_range(scout, tp, begin, end):
+                if self._name(msg.value()) == "start":
+                    found = msg.offset()
+            if found is not None:
+                return found
+            end = begin
+            window *= 2
+        return None
+
+    def _read_range(self, scout, tp, begin, end):
+        from confluent_kafka import TopicPartition
+
+        scout.assign([TopicPartition(tp.topic, tp.partition, begin)])
+        while True:
+            msgs = scout.consume(num_messages=self.batch_size, timeout=1.0)
+            if not msgs:
+                return
+            for msg in msgs:
+                if msg.error():
+                    continue
+                if msg.offset() >= end:
+                    return
+                yield msg
+                if msg.offset() >= end - 1:
+                    return
+
+    def _name(self, value):
+        if self._deserializer is msgpack.loads:
+            return document_name(value)
+        return self._deserializer(value)[0]
+
+    def _advance_catchup(self, msg):
+        key = (msg.topic(), msg.partition())
+        self._catchup_progress = time.monotonic()
+        target = self._catchup.get(key)
+        if target is not None and msg.offset() >= target:
+            self._end_catchup(key)
+
+    def _end_catchup(self, key):
+        del self._catchup[key]
+        if not self._topic_catching_up(key[0]):
+            self._set_catching_up(key[0], False)
+        if not self._catchup:
+            self._set_catching_up(None, False)
+
+    def _check_catchup(self):
+        """
+        After an empty poll: end the catch-up of partitions the consumer has
+        moved past (it skips transaction markers without returning them), and
+        of all partitions if there was no progress for too long.
+        """
+        from confluent_kafka import KafkaException, TopicPartition
+
+        keys = list(self._catchup)
+        try:
+            positions = self._consumer.position(
+                [TopicPartition(topic, partition) for topic, partition in keys]
+            )
+        except KafkaException as ex:
+            print(f"Exception occurred: {ex}")
+            positions = []
+        for tp in positions:
+            key = (tp.topic, tp.partition)
+            target = self._catchup.get(key)
+            if target is not None and tp.offset > target:
+                self._end_catchup(key)
+        if (
+            self._catchup
+            and time.monotonic() - self._catchup_progress > self.catchup_idle_timeout
+        ):
+            print("Catch-up made no progress, showing live documents")
+            self._finish_catchup()
+
+    def _finish_catchup(self):
+        topics = {t for t, _ in self._catchup}
+        self._catchup.clear()
+        for topic in topics:
+            self._set_catching_up(topic, False)
+        self._set_catching_up(None, False)
+
+    def subscribed(self, topic, topics=None):
+        """Whether ``topic`` is one of ``topics`` or matches one of their patterns."""
+        for t in self.topics if topics is None else topics:
+            if t == topic or (t.startswith("^") and re.match(t, topic)):
+                return True
+        return False
+
+    def _apply_pending_topics(self):
+        with self._topics_lock:
+            topics, self._pending_topics = self._pending_topics, None
+        if topics is None or topics == self.topics:
+            return
+        self.topics = topics
+        if topics:
+            self._consumer.subscribe(topics, on_assign=self._on_assign)
+        else:
+            self._consumer.unsubscribe()
+        for key in list(self._catchup):
+            if not self.subscribed(key[0], topics):
+                del self._catchup[key]
+        # A topic subscribed again later starts over from its latest run,
+        # with a catch-up, instead of replaying everything since its removal
+        for key in list(self._positions):
+            if not self.subscribed(key[0], topics):
+                del self._positions[key]
+                self._run_starts.pop(key, None)
+        self._topics_seen = {t for t in self._topics_seen if self.subscribed(t, topics)}
+
+    def _route(self, topic):
+        route = self._routes.get(topic)
+        if route is None and topic not in self._topics_seen:
+            self._topics_seen.add(topic)
+            for func in self._new_topic_callbacks:
+                try:
+                    func(topic)
+                except Exception as ex:
+                    print(f"Exception occurred: {ex}")
+            route = self._routes.get(topic)
+        return route
+
+    def poll(self, timeout=None):
+        """
+        Fetch and dispatch one batch of messages.
+
+        Returns
+        -------
+        int
+            Number of messages received.
+        """
+        if profiler.cprofile and not profiler.profiling():
+            return profiler.call(self.poll, timeout)
+        if timeout is None:
+            timeout = self.polling_duration
+        if self._pending_topics is not None:
+            self._apply_pending_topics()
+        if not self.topics:
+            if self.connected:
+                time.sleep(timeout)
+            else:
+                self._check_connection(timeout)
+            return 0
+        msgs = self._consumer.consume(num_messages=self.batch_size, timeout=timeout)
+        if not msgs:
+            if not self.connected:
+                self._check_connection(timeout)
+            if self._catchup:
+                self._check_catchup()
+            return 0
+        self._set_connected()
+        received = time.time() if metrics.enabled else None
+        for msg in msgs:
+            if msg.error():
+                print(f"Kafka consumer error: {msg.error()}")
+                continue
+            topic = msg.topic()
+            if metrics.enabled:
+                metrics.add_bytes(len(msg.value()))
+            try:
+                name, doc = self._deserializer(msg.value())
+                name = DocumentNames[name]
+                if received is not None:
+                    metrics.receipt(doc, received)
+                if name is DocumentNames.start:
+                    self._run_starts[(topic, msg.partition())] = msg.offset()
+                elif name is DocumentNames.stop:
+                    self._run_starts.pop((topic, msg.partition()), None)
+                self.process(name, doc)
+                route = self._route(topic)
+                if route is not None:
+                    route.process(name, doc)
+            except Exception as ex:
+                print(f"Exception occurred: {ex}")
+            self._positions[(topic, msg.partition())] = msg.offset() + 1
+            if self._catchup:
+                self._advance_catchup(msg)
+        if self.checkpoint is not None:
+            self.checkpoint.save(self._positions, self._run_starts)
+        return len(msgs)
+
+    def _check_connection(self, timeout):
+        """Ask the broker for metadata, waiting at most ``timeout`` seconds."""
+        from confluent_kafka import KafkaException
+
+        try:
+            self._consumer.list_topics(timeout=timeout)
+        except KafkaException:
+            return
+        self._set_connected()
+
+    def start(self, continue_polling=None):
+        """
+        Run the polling loop until ``continue_polling()`` is False or
+        ``stop()`` is called, then close the consumer.
+        """
+        if self.closed:
+            raise RuntimeError(
+                "This KafkaDispatcher has already been "
+                "started and interrupted. Create a fresh "
+                f"instance with {repr(self)}"
+            )
+        if continue_polling is None:
+
+            def continue_polling():
+                return True
+
+        self._running = True
+        try:
+            while not self.closed and continue_polling():
+                self.poll()
+        finally:
+            self._running = False
+            self.closed = True
+            self._save_checkpoint()
+            self._consumer.close()
+
+    def _save_checkpoint(self):
+        if self.checkpoint is not None and self._positions:
+            self.checkpoint.save(self._positions, self._run_starts, force=True)
+
+    def stop(self):
+        """Stop the polling loop; the consumer is closed by the loop itself."""
+        self.closed = True
+        if not self._running:
+            self._save_checkpoint()
+            try:
+                self._consumer.close()
+            except RuntimeError:
+                # already closed
+                pass
@@ -0,0 +1,667 @@
+"""
+Process-wide sharing of Kafka live tables.
+
+Every table view used to build its own consumer and LessEffortCallback, so a
+session with several views of the same topic decoded and formatted every
+document once per view. The registry keeps one SharedKafkaTable per
+(config file, topic): a callback whose rendered lines are fanned out to
+every attached view. All tables using the same config file share one
+consumer, whose subscription grows and shrinks with them, so views of N
+beamlines cost one broker connection. Views are reference counted; the
+consumer starts with the first table and stops when the last one is
+released.
+
+Acquiring a table never waits for the broker: the consumer reads the config
+file, builds its dispatcher and connects in its own thread, and subscribes
+the tables once it is ready. Views can follow its ``state`` to show that
+they are still connecting.
+
+``watch_pattern`` subscribes a topic pattern instead: every matching topic
+gets a table as soon as its first document arrives, kept for as long as the
+pattern is watched, and the watcher is told so it can attach a view.
+"""
+
+from collections import deque
+from warnings import warn
+import os
+import re
+import threading
+
+from .kafka_table import kafka_topics, make_kafka_dispatcher
+from .lessEffortCallback import STREAM_DISPLAY_RATE, LessEffortCallback
+from .offsetCheckpoint import OffsetCheckpoint
+from .runHistory import RunHistory
+
+
+class SharedKafkaConsumer:
+    """
+    One KafkaDispatcher for all tables using the same config file, running
+    in its own thread.
+
+    ``state`` is "connecting" until the broker has answered the dispatcher,
+    then "connected", or "failed: <reason>" if the dispatcher could not be
+    built or the consumer reported an error. The consumer keeps retrying
+    after an error, and the state returns to "connected" once it succeeds.
+
+    Parameters
+    ----------
+    config_file : str
+        bluesky kafka config file.
+    start_from : str
+        Where new partitions start; see KafkaDispatcher.
+    group_id : str, optional
+        Stable consumer group id; by default a new group per start.
+    checkpoint_file : str, optional
+        File the consumer's offsets are saved to and resumed from.
+    checkpoint_interval : float
+        Seconds between checkpoint writes.
+    """
+
+    def __init__(
+        self,
+        config_file,
+        start_from="latest-start",
+        group_id=None,
+        checkpoint_file=None,
+        checkpoint_interval=5.0,
+    ):
+        self.config_file = config_file
+        self.start_from = start_from
+        self.group_id = group_id
+        self.checkpoint_file = checkpoint_file
+        self.checkpoint_interval = checkpoint_interval
+        self.dispatcher = None
+        self.state = "connecting"
+        self.topics = []
+        self._tables = []
+        # owner -> (pattern, on_topic) of watched topic patterns
+        self._patterns = {}
+        self._watchers = {}
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._thread = None
+
+    def _update_topics(self):
+        # Patterns, then the topics of tables no pattern covers, so a table
+        # created for a matched topic does not change the subscription
+        patterns = []
+        for pattern, _ in self._patterns.values():
+            if pattern not in patterns:
+                patterns.append(pattern)
+        topics = list(patterns)
+        for table in self._tables:
+            if table.topic not in topics and not any(
+                re.match(p, table.topic) for p in patterns
+            ):
+                topics.append(table.topic)
+        changed = topics != self.topics
+        self.topics = topics
+        return changed
+
+    def add_table(self, table):
+        """Subscribe a table's topic, now or once connected."""
+        with self._lock:
+            self._tables.append(table)
+            changed = self._update_topics()
+            dispatcher = self.dispatcher
+            topics = list(self.topics)
+        if dispatcher is not None:
+            table.connect(dispatcher)
+            if changed:
+                dispatcher.set_topics(topics)
+
+    def remove_table(self, table):
+        """Drop a table; returns the number of tables and patterns left."""
+        with self._lock:
+            if table in self._tables:
+                self._tables.remove(table)
+            changed = self._update_topics()
+            dispatcher = self.dispatcher
+            topics = list(self.topics)
+            left = len(self._tables) + len(self._patterns)
+        table.close()
+        if dispatcher is not None and changed:
+            dispatcher.set_topics(topics)
+        return left
+
+    def add_pattern(self, owner, pattern, on_topic):
+        """
+        Subscribe a topic pattern; ``on_topic(topic)`` is called from the
+        consumer's thread before the first document of each matching topic
+        that has no table yet.
+        """
+        with self._lock:
+            self._patterns[owner] = (pattern, on_topic)
+            changed = self._update_topics()
+            dispatcher = self.dispatcher
+            topics = list(self.topics)
+        if dispatcher is not None and changed:
+            dispatcher.set_topics(topics)
+
+    def remove_pattern(self, owner):
+        """Drop a pattern; returns the number of tables and patterns left."""
+        with self._lock:
+            self._patterns.pop(owner, None)
+            changed = self._update_topics()
+            dispatcher = self.dispatcher
+            topics = list(self.topics)
+            left = len(self._tables) + len(self._patterns)
+        if dispatcher is not None and changed:
+            dispatcher.set_topics(topics)
+        return left
+
+    def _new_topic(self, topic):
+        with self._lock:
+            funcs = [
+                on_topic
+                for pattern, on_topic in self._patterns.values()
+                if re.match(pattern, topic)
+            ]
+        for on_topic in funcs:
+            try:
+                on_topic(topic)
+            except Exception as ex:
+                print(f"Exception occurred: {ex}")
+
+    def watch(self, key, func):
+        """Call ``func(state)`` now and on every change, until ``unwatch(key)``."""
+        with self._lock:
+            self._watchers[key] = func
+            state = self.state
+        func(state)
+
+    def unwatch(self, key):
+        with self._lock:
+            self._watchers.pop(key, None)
+
+    def _set_state(self, state):
+        with self._lock:
+            self.state = state
+            watchers = list(self._watchers.values())
+        for func in watchers:
+            func(state)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    @property
+    def failed(self):
+        return self.state.startswith("failed")
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def options(self):
+        """The options this consumer was created with, as keyword arguments."""
+        return {
+            "start_from": self.start_from,
+            "group_id": self.group_id,
+            "checkpoint_file": self.checkpoint_file,
+            "checkpoint_interval": self.checkpoint_interval,
+        }
+
+    def restart(self):
+        """Connect again after a failure, keeping the tables."""
+        with self._lock:
+            dispatcher, self.dispatcher = self.dispatcher, None
+            self._thread = None
+            self._stopped = False
+        if dispatcher is not None:
+            dispatcher.stop()
+        self._set_state("connecting")
+        self.start()
+
+    def _run(self):
+        try:
+            checkpoint = None
+            if self.checkpoint_file:
+                checkpoint = OffsetCheckpoint(
+                    self.checkpoint_file, interval=self.checkpoint_interval
+                )
+            dispatcher = make_kafka_dispatcher(
+                [],
+                self.config_file,
+                start_from=self.start_from,
+                group_id=self.group_id,
+                checkpoint=checkpoint,
+            )
+        except Exception as ex:
+            print(f"Kafka connection failed: {ex}")
+            self._set_state(f"failed: {ex}")
+            return
+        with self._lock:
+            if self._stopped:
+                dispatcher.stop()
+                return
+            self.dispatcher = dispatcher
+            tables = list(self._tables)
+            topics = list(self.topics)
+        dispatcher.on_new_topic(self._new_topic)
+        dispatcher.on_connected(lambda: self._set_state("connected"))
+        dispatcher.on_error(lambda error: self._set_state(f"failed: {error}"))
+        for table in tables:
+            table.connect(dispatcher)
+        dispatcher.set_topics(topics)
+        try:
+            dispatcher.start()
+        except Exception as ex:
+            print(f"Kafka dispatcher stopped: {ex}")
+            self._set_state(f"failed: {ex}")
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            dispatcher = self.dispatcher
+        if dispatcher is not None:
+            dispatcher.stop()
+
+
+class SharedKafkaTable:
+    """
+    One LessEffortCallback for a topic, serving any number of views.
+
+    Views are objects with ``newMsg(msg)``,
+    ``newRows(msg, first_seq, last_seq, nrows)``, ``newStreamMsg(stream, msg)``
+    and ``newStreamRows(stream, msg, first_seq, last_seq, nrows)`` methods,
+    such as BaseLiveTableModel. Each keeps its own queue, so a slow view sheds rows
+    without slowing the others.
+
+    Lines of the current run are kept, up to ``history_size``, and replayed
+    to views attached mid-run so they start with the heading and header.
+    The table receives documents once its consumer calls ``connect``.
+
+    Because the table is rendered once for all views, its settings (see
+    ``SETTINGS``, ``configure`` and ``set_baseline_enabled``) are shared by
+    every view of the topic.
+
+    A table may also be pinned, e.g. by the pattern that matched its topic,
+    to keep it, and the lines of the run in progress, while it has no view.
+    """
+
+    # Settings of the shared callback, with their defaults
+    SETTINGS = {
+        "display_rate": None,
+        "display_tolerance": 0.05,
+        "history": True,
+        "history_max_mb": 256,
+        "history_cache_mb": 32,
+        "stream_tables": True,
+        "stream_display_rate": STREAM_DISPLAY_RATE,
+    }
+
+    def __init__(self, key, history_size=1000):
+        self.key = key
+        self.topic = key[1]
+        self._lock = threading.Lock()
+        self._views = ()
+        self._pins = set()
+        self._history = deque(maxlen=history_size)
+        self.dispatcher = None
+        self.settings = None
+        self.callback = LessEffortCallback(
+            out=self._out,
+            row_out=self._row_out,
+            stream_out=self._stream_out,
+            stream_row_out=self._stream_row_out,
+        )
+
+    def configure(self, **settings):
+        """
+        Apply the settings of the first view to configure the table.
+
+        Later calls cannot change them: values that differ from the
+        settings in effect are ignored with a warning.
+
+        Returns
+        -------
+        dict
+            The settings in effect, keyed as ``SETTINGS``.
+        """
+        unknown = set(settings) - set(self.SETTINGS)
+        if unknown:
+            raise ValueError(f"Unknown table setting(s) {', '.join(sorted(unknown))}")
+        with self._lock:
+            if self.settings is not None:
+                conflicts = {
+                    k: v for k, v in settings.items() if self.settings[k] != v
+                }
+                if conflicts:
+                    warn(
+                        f"{self.topic} is shared with a view configured with "
+                        f"{ {k: self.settings[k] for k in conflicts} }; "
+                        f"ignoring {conflicts}"
+                    )  # noqa: B028
+                return dict(self.settings)
+            self.settings = {**self.SETTINGS, **settings}
+            settings = dict(self.settings)
+        callback = self.callback
+        callback.set_display_rate(
+            settings["display_rate"], settings["display_tolerance"]
+        )
+        if settings["history"] and callback.history is None:
+            callback.history = RunHistory(
+                max_bytes=int(settings["history_max_mb"] * 2**20),
+                cache_bytes=int(settings["history_cache_mb"] * 2**20),
+            )
+        if settings["stream_tables"]:
+            callback.set_stream_display_rate(
+                settings["stream_display_rate"], settings["display_tolerance"]
+            )
+        else:
+            callback.disable_stream_tables()
+        return settings
+
+    def set_baseline_enabled(self, enabled):
+        """
+        Show or hide baseline readings, in every view of the topic. Views
+        with a ``baselineChanged`` signal are told.
+        """
+        enabled = bool(enabled)
+        self.callback.baseline_enabled = enabled
+        for view in self._views:
+            signal = getattr(view, "baselineChanged", None)
+            if signal is not None:
+                signal.emit(enabled)
+
+    def connect(self, dispatcher):
+        """Route the topic's documents from ``dispatcher`` to this table."""
+        self.dispatcher = dispatcher
+        # Reset the history before the callback renders the new run
+        dispatcher.subscribe_topic(self.topic, self._on_document)
+        dispatcher.subscribe_topic(self.topic, self.callback)
+        dispatcher.subscribe_catchup(self.callback.set_catching_up, topic=self.topic)
+
+    def _on_document(self, name, doc):
+        if name == "start":
+            with self._lock:
+                self._history.clear()
+
+    def _out(self, msg):
+        with self._lock:
+            self._history.append((None, msg, None, None, 0))
+            views = self._views
+        for view in views:
+            view.newMsg(msg)
+
+    def _row_out(self, msg, first_seq=None, last_seq=None, nrows=1):
+        with self._lock:
+            self._history.append((None, msg, first_seq, last_seq, nrows))
+            views = self._views
+        for view in views:
+            view.newRows(msg, first_seq, last_seq, nrows)
+
+    def _stream_out(self, stream, msg):
+        with self._lock:
+            self._history.append((stream, msg, None, None, 0))
+            views = self._views
+        for view in views:
+            view.newStreamMsg(stream, msg)
+
+    def _stream_row_out(self, stream, msg, first_seq=None, last_seq=None, nrows=1):
+        with self._lock:
+            self._history.append((stream, msg, first_seq, last_seq, nrows))
+            views = self._views
+        for view in views:
+            view.newStreamRows(stream, msg, first_seq, last_seq, nrows)
+
+    def attach(self, view):
+        """Add a view, replaying the current run's lines to it."""
+        with self._lock:
+            if view in self._views:
+                return
+            for stream, msg, first_seq, last_seq, nrows in self._history:
+                if stream is not None:
+                    if nrows:
+                        view.newStreamRows(stream, msg, first_seq, last_seq, nrows)
+                    else:
+                        view.newStreamMsg(stream, msg)
+                elif nrows:
+                    view.newRows(msg, first_seq, last_seq, nrows)
+                else:
+                    view.newMsg(msg)
+            self._views = self._views + (view,)
+
+    def detach(self, view):
+        """
+        Remove a view.
+
+        Returns
+        -------
+        bool
+            Whether the view was attached.
+        """
+        with self._lock:
+            if view not in self._views:
+                return False
+            self._views = tuple(v for v in self._views if v is not view)
+            return True
+
+    @property
+    def view_count(self):
+        return len(self._views)
+
+    def pin(self, owner):
+        with self._lock:
+            self._pins.add(owner)
+
+    def unpin(self, owner):
+        with self._lock:
+            self._pins.discard(owner)
+
+    @property
+    def in_use(self):
+        """Whether the table has views or pins."""
+        return bool(self._views or self._pins)
+
+    def close(self):
+        """Stop routing the topic's documents to this table."""
+        if self.dispatcher is not None:
+            self.dispatcher.unsubscribe_topic(self.topic)
+
+
+class KafkaTableRegistry:
+    """
+    Reference-counted SharedKafkaTables keyed by (config file, topic), and
+    the SharedKafkaConsumer of each config file.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tables = {}
+        self._consumers = {}
+
+    def acquire(
+        self,
+        view,
+        beamline_acronym,
+        config_file,
+        topic_string="bluesky.runengine.documents",
+        start_from="latest-start",
+        on_state=None,
+        **consumer_options,
+    ):
+        """
+        Attach ``view`` to the shared table for a topic, creating it if
+        this is the first view. The table joins the consumer for its config
+        file, which is created and started if needed. Returns at once; the
+        consumer connects in the background.
+
+        Parameters
+        ----------
+        beamline_acronym : str or None
+            Combined with ``topic_string`` as ``f"{acronym}.{topic_string}"``;
+            if None, ``topic_string`` is the whole topic, e.g. one reported
+            by ``watch_pattern``.
+        on_state : callable, optional
+            Called as ``on_state(state)`` with the consumer's state now and
+            whenever it changes, from the consumer's thread, until the view
+            is released.
+        **consumer_options
+            ``group_id``, ``checkpoint_file`` and ``checkpoint_interval``
+            of the consumer (see SharedKafkaConsumer). They and
+            ``start_from`` are set by the first table of a config file;
+            later values that differ are ignored with a warning.
+
+        Returns
+        -------
+        SharedKafkaTable
+        """
+        config_key = os.path.abspath(config_file)
+        if beamline_acronym is None:
+            topic = topic_string
+        else:
+            topic = f"{beamline_acronym}.{topic_string}"
+        key = (config_key, topic)
+        with self._lock:
+            consumer = self._consumer(config_file, start_from, consumer_options)
+            table = self._tables.get(key)
+            if table is None:
+                table = SharedKafkaTable(key)
+                self._tables[key] = table
+                consumer.add_table(table)
+            table.attach(view)
+            if on_state is not None:
+                consumer.watch(view, on_state)
+        return table
+
+    def _consumer(self, config_file, start_from, consumer_options):
+        """The consumer for a config file, created and started if needed."""
+        config_key = os.path.abspath(config_file)
+        consumer = self._consumers.get(config_key)
+        if consumer is None:
+            consumer = SharedKafkaConsumer(config_file, start_from, **consumer_options)
+            self._consumers[config_key] = consumer
+            consumer.start()
+            return consumer
+        options = consumer.options()
+        requested = {"start_from": start_from, **consumer_options}
+        conflicts = {k: v for k, v in requested.items() if options.get(k) != v}
+        if conflicts:
+            warn(
+                f"The Kafka consumer for {config_file} already runs with "
+                f"{ {k: options.get(k) for k in conflicts} }; "
+                f"ignoring {conflicts}"
+            )  # noqa: B028
+        if consumer.failed and not consumer.running:
+            # e.g. the config could not be read: try again for the new view;
+            # a running consumer retries by itself
+            consumer.restart()
+        return consumer
+
+    def release(self, table, view):
+        """
+        Detach ``view``. A table without views or pins leaves its consumer,
+        and a consumer without tables or patterns is stopped.
+        """
+        with self._lock:
+            config_key, topic = table.key
+            consumer = self._consumers.get(config_key)
+            if consumer is not None:
+                consumer.unwatch(view)
+            if not table.detach(view):
+                return
+            consumer = self._drop_table(table)
+        if consumer is not None:
+            consumer.stop()
+
+    def _drop_table(self, table):
+        """
+        Forget a table that is no longer in use. Returns its consumer if that
+        is left without tables or patterns, for the caller to stop.
+        """
+        if table.in_use or self._tables.get(table.key) is not table:
+            return None
+        del self._tables[table.key]
+        config_key = table.key[0]
+        consumer = self._consumers[config_key]
+        if consumer.remove_table(table):
+            return None
+        del self._consumers[config_key]
+        return consumer
+
+    def watch_pattern(
+        self,
+        owner,
+        config_file,
+        topic_pattern,
+        on_topic,
+        start_from="latest-start",
+        on_state=None,
+        **consumer_options,
+    ):
+        """
+        Subscribe the consumer for ``config_file`` to a topic pattern.
+
+        When the first document of a matching topic without a table
+        arrives, a table is created for it, pinned by ``owner``, and
+        ``on_topic(topic)`` is called from the consumer's thread. The
+        documents of the topic reach the table from then on, so a view
+        acquired later with ``beamline_acronym=None`` and
+        ``topic_string=topic`` starts with the run in progress.
+
+        Parameters
+        ----------
+        owner : hashable
+            Identifies the watch for ``unwatch_pattern``.
+        topic_pattern : str
+            Regular expression; a leading ``^`` is added if missing.
+        on_state, **consumer_options
+            As for ``acquire``.
+        """
+        (pattern,) = kafka_topics(None, None, topic_pattern)
+        config_key = os.path.abspath(config_file)
+
+        def pattern_topic(topic):
+            with self._lock:
+                consumer = self._consumers.get(config_key)
+                if consumer is None:
+                    return
+                key = (config_key, topic)
+                table = self._tables.get(key)
+                if table is None:
+                    table = SharedKafkaTable(key)
+                    self._tables[key] = table
+                    consumer.add_table(table)
+                table.pin(owner)
+            on_topic(topic)
+
+        with self._lock:
+            consumer = self._consumer(config_file, start_from, consumer_options)
+            consumer.add_pattern(owner, pattern, pattern_topic)
+            if on_state is not None:
+                consumer.watch(owner, on_state)
+
+    def unwatch_pattern(self, owner, config_file):
+        """
+        Stop watching a pattern; its tables are dropped unless views still
+        use them.
+        """
+        config_key = os.path.abspath(config_file)
+        with self._lock:
+            consumer = self._consumers.get(config_key)
+            if consumer is None:
+                return
+            consumer.unwatch(owner)
+            left = consumer.remove_pattern(owner)
+            for table in [t for k, t in self._tables.items() if k[0] == config_key]:
+                table.unpin(owner)
+                if self._drop_table(table) is not None:
+                    left = 0
+            if left:
+                return
+            if self._consumers.get(config_key) is consumer:
+                del self._consumers[config_key]
+        consumer.stop()
+
+    def __len__(self):
+        return len(self._tables)
+
+    @property
+    def consumer_count(self):
+        return len(self._consumers)
+
+
+kafka_tables = KafkaTableRegistry()
@@ -1,71 +1,197 @@
-import nslsii.kafka_utils
-from bluesky_kafka import RemoteDispatcher
-from bluesky_widgets.qt.kafka_dispatcher import QtRemoteDispatcher
-from bluesky.callbacks.best_effort import BestEffortCallback
+from .documentRecorder import add_record_arguments, make_recorder
+from .kafkaDispatcher import KafkaDispatcher, START_FROM
 from .lessEffortCallback import LessEffortCallback
+from .offsetCheckpoint import add_checkpoint_arguments, make_checkpoint
+from .pipelineMetrics import add_metrics_arguments, start_metrics
+from .profiling import add_profile_arguments, start_profiling
 import uuid
 import argparse
 
 
-def kafka_table(
+def read_kafka_config(config_file):
+    """
+    Read a bluesky kafka config file.
+
+    Returns
+    -------
+    tuple
+        (bootstrap servers as a comma-delimited string, consumer config)
+    """
+    # nslsii pulls in much of the bluesky stack; only load it to connect
+    import nslsii.kafka_utils
+
+    kafka_config = nslsii.kafka_utils._read_bluesky_kafka_config_file(
+        config_file_path=config_file
+    )
+    return (
+        ",".join(kafka_config["bootstrap_servers"]),
+        kafka_config["runengine_producer_config"],
+    )
+
+
+def kafka_topics(beamline_acronym, topic_string, topic_pattern=None):
+    """
+    Topics for one or several beamline acronyms, plus an optional pattern.
+
+    Parameters
+    ----------
+    beamline_acronym : str or list of str
+    topic_string : str
+        Combined with each acronym as ``f"{acronym}.{topic_string}"``.
+    topic_pattern : str, optional
+        Regular expression for further topics; a leading ``^`` is added if
+        missing, as Kafka requires.
+    """
+    if not beamline_acronym:
+        acronyms = []
+    elif isinstance(beamline_acronym, str):
+        acronyms = [beamline_acronym]
+    else:
+        acronyms = list(beamline_acronym)
+    topics = [f"{bl}.{topic_string}" for bl in acronyms]
+    if topic_pattern:
+        if not topic_pattern.startswith("^"):
+            topic_pattern = "^" + topic_pattern
+        topics.append(topic_pattern)
+    return topics
+
+
+def topic_label(topic):
+    """Short name of a topic for display, i.e. its beamline acronym."""
+    return topic.split(".", 1)[0]
+
+
+def labelled(out, label):
+    """Wrap ``out`` so every line it prints starts with ``[label]``."""
+
+    def labelled_out(msg):
+        out("\n".join(f"[{label}] {line}" for line in str(msg).split("\n")))
+
+    return labelled_out
+
+
+def _is_single_topic(topics):
+    return len(topics) == 1 and not topics[0].startswith("^")
+
+
+def make_kafka_dispatcher(
     beamline_acronym,
     config_file,
     topic_string="bluesky.documents",
-    out=print,
-    continue_polling=None,
+    start_from="latest-start",
+    topic_pattern=None,
+    group_id=None,
+    checkpoint=None,
 ):
-    bec = LessEffortCallback(out=out)
-    # bec = BestEffortCallback()
-    kafka_config = nslsii.kafka_utils._read_bluesky_kafka_config_file(
-        config_file_path=config_file
-    )
+    """
+    Build a KafkaDispatcher for the topics of one or more beamlines, in a
+    consumer group of its own.
 
-    # this consumer should not be in a group with other consumers
-    #   so generate a unique consumer group id for it
-    unique_group_id = f"echo-{beamline_acronym}-{str(uuid.uuid4())[:8]}"
+    ``group_id`` gives the consumer a stable identity across restarts;
+    by default a new group is made for every start. ``checkpoint`` is an
+    OffsetCheckpoint to save positions to and resume from.
+    """
+    bootstrap_servers, consumer_config = read_kafka_config(config_file)
+    topics = kafka_topics(beamline_acronym, topic_string, topic_pattern)
 
-    kafka_dispatcher = RemoteDispatcher(
-        topics=[f"{beamline_acronym}.{topic_string}"],
-        bootstrap_servers=",".join(kafka_config["bootstrap_servers"]),
-        group_id=unique_group_id,
-        consumer_config=kafka_config["runengine_producer_config"],
+    if group_id is None:
+        # this consumer should not be in a group with other consumers
+        #   so generate a unique consumer group id for it
+        names = [topic_label(t) for t in topics if not t.startswith("^")]
+        group_name = "-".join(names) or "livetable"
+        group_id = f"echo-{group_name}-{str(uuid.uuid4())[:8]}"
+
+    return KafkaDispatcher(
+        topics=topics,
+        bootstrap_servers=bootstrap_servers,
+        group_id=group_id,
+        consumer_config=consumer_config,
+        start_from=start_from,
+        checkpoint=checkpoint,
     )
 
-    kafka_dispatcher.subscribe(bec)
-    kafka_dispatcher.start(continue_polling=continue_polling)
+
+def route_topics(kafka_dispatcher, make_callback):
+    """
+    Give every topic its own callback.
+
+    ``make_callback(topic)`` is called when the first document of a topic
+    arrives, so topics matched by a pattern are picked up as they appear.
+
+    Returns
+    -------
+    dict
+        topic -> callback, filled in as topics appear.
+    """
+    callbacks = {}
+
+    def add_topic(topic):
+        callback = callbacks[topic] = make_callback(topic)
+        kafka_dispatcher.subscribe_topic(topic, callback)
+        kafka_dispatcher.subscribe_catchup(callback.set_catching_up, topic=topic)
+
+    kafka_dispatcher.on_new_topic(add_topic)
+    return callbacks
 
 
-def qt_kafka_table(
+def kafka_table(
     beamline_acronym,
     config_file,
     topic_string="bluesky.documents",
     out=print,
+    continue_polling=None,
+    start_from="latest-start",
+    topic_pattern=None,
+    recorder=None,
+    group_id=None,
+    checkpoint=None,
 ):
-    bec = LessEffortCallback(out=out)
-    # bec = BestEffortCallback()
-    kafka_config = nslsii.kafka_utils._read_bluesky_kafka_config_file(
-        config_file_path=config_file
-    )
-
-    # this consumer should not be in a group with other consumers
-    #   so generate a unique consumer group id for it
-    unique_group_id = f"echo-{beamline_acronym}-{str(uuid.uuid4())[:8]}"
+    """
+    Print live tables from one or more Kafka topics.
 
-    kafka_dispatcher = QtRemoteDispatcher(
-        topics=[f"{beamline_acronym}.{topic_string}"],
-        bootstrap_servers=",".join(kafka_config["bootstrap_servers"]),
-        group_id=unique_group_id,
-        consumer_config=kafka_config["runengine_producer_config"],
+    With several beamline acronyms, or a topic pattern, a single consumer
+    reads every topic and each topic gets its own LessEffortCallback, whose
+    lines are prefixed with the beamline acronym. Every document is also
+    passed to ``recorder``, if given. See make_kafka_dispatcher for
+    ``group_id`` and ``checkpoint``.
+    """
+    kafka_dispatcher = make_kafka_dispatcher(
+        beamline_acronym,
+        config_file,
+        topic_string,
+        start_from=start_from,
+        topic_pattern=topic_pattern,
+        group_id=group_id,
+        checkpoint=checkpoint,
     )
+    if recorder is not None:
+        kafka_dispatcher.subscribe(recorder)
 
-    kafka_dispatcher.subscribe(bec)
-    return kafka_dispatcher, bec
+    if _is_single_topic(kafka_dispatcher.topics):
+        bec = LessEffortCallback(out=out)
+        # bec = BestEffortCallback()
+        kafka_dispatcher.subscribe(bec)
+        kafka_dispatcher.subscribe_catchup(bec.set_catching_up)
+    else:
+        route_topics(
+            kafka_dispatcher,
+            lambda topic: LessEffortCallback(out=labelled(out, topic_label(topic))),
+        )
+    kafka_dispatcher.start(continue_polling=continue_polling)
 
 
 def main():
     parser = argparse.ArgumentParser(description="Kafka LiveTable Monitor")
     parser.add_argument(
-        "--bl", required=True, help="Beamline acronym used for kafka topic"
+        "--bl",
+        nargs="+",
+        default=[],
+        help="Beamline acronym(s) used for kafka topics",
+    )
+    parser.add_argument(
+        "--topic-pattern",
+        default=None,
+        help="regular expression matching further topics to monitor",
     )
     parser.add_argument(
         "--config-file",
@@ -77,10 +203,63 @@ def main():
         default="bluesky.runengine.documents",
         help="string to be combined with acronym to create topic",
     )
+    parser.add_argument(
+        "--start-from",
+        choices=START_FROM,
+        default="latest-start",
+        help="begin at the most recent run, or at the consumer's committed offsets",
+    )
+    parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="run receipt, rendering and output as asyncio tasks",
+    )
+    parser.add_argument(
+        "--metrics-interval",
+        type=float,
+        default=None,
+        help="with --async, report throughput on stderr every N seconds",
+    )
+    add_metrics_arguments(parser)
+    add_profile_arguments(parser)
+    add_record_arguments(parser)
+    add_checkpoint_arguments(parser)
 
     args = parser.parse_args()
+    if not args.bl and not args.topic_pattern:
+        parser.error("give at least one --bl or a --topic-pattern")
+    start_metrics(args)
+    start_profiling(args)
 
-    kafka_table(args.bl, args.config_file, args.topic_string)
+    if args.use_async:
+        from .asyncEngine import AsyncEngine, run_engine
+
+        engine = AsyncEngine(
+            metrics_interval=args.metrics_interval, recorder=make_recorder(args)
+        )
+        engine.add_kafka(
+            args.bl,
+            args.config_file,
+            args.topic_string,
+            start_from=args.start_from,
+            topic_pattern=args.topic_pattern,
+            group_id=args.group_id,
+            checkpoint=make_checkpoint(args),
+        )
+        run_engine(engine)
+        return
+
+    kafka_table(
+        args.bl,
+        args.config_file,
+        args.topic_string,
+        start_from=args.start_from,
+        topic_pattern=args.topic_pattern,
+        recorder=make_recorder(args),
+        group_id=args.group_id,
+        checkpoint=make_checkpoint(args),
+    )
 
 
 if __name__ == "__main__":
@@ -6,33 +6,31 @@ For instructions on how to test in a simulated environment please see:
 
 import logging
 import sys
+import threading
 import time
 from datetime import datetime
 from io import StringIO
 from warnings import warn
 
 
-from bluesky.callbacks.core import LiveTable, make_class_safe, CallbackBase
+from bluesky.callbacks.core import make_class_safe, CallbackBase
+from event_model import unpack_event_page
 
-logger = logging.getLogger(__name__)
+from .arraySummary import REDUCERS, ArraySummary
+from .columnStore import EventStore
+from .displayRate import DisplayThrottle, page_subset
+from .pagedLiveTable import PagedLiveTable
+from .pipelineMetrics import metrics
+from .profiling import profiler
+from .renderPlan import get_baseline_plan, hinted_fields
+from .runningStats import RunningStats
 
+logger = logging.getLogger(__name__)
 
-def hinted_fields(descriptor):
-    # Figure out which columns to put in the table.
-    obj_names = list(descriptor["object_keys"])
-    # We will see if these objects hint at whether
-    # a subset of their data keys ('fields') are interesting. If they
-    # did, we'll use those. If these didn't, we know that the RunEngine
-    # *always* records their complete list of fields, so we can use
-    # them all unselectively.
-    columns = []
-    for obj_name in obj_names:
-        try:
-            fields = descriptor.get("hints", {}).get(obj_name, {})["fields"]
-        except KeyError:
-            fields = descriptor["object_keys"][obj_name]
-        columns.extend(fields)
-    return columns
+# Rows per second rendered in each table of a non-primary stream. Stream
+# tables are formatted in the same thread as the primary table, so a fast
+# monitor stream must not render every row by default.
+STREAM_DISPLAY_RATE = 10
 
 
 @make_class_safe(logger=logger)
@@ -43,6 +41,19 @@ class LessEffortCallback(CallbackBase):
         fig_factory=None,
         table_enabled=True,
         out=print,
+        row_out=None,
+        store_enabled=False,
+        store_max_rows=1_000_000,
+        store_max_runs=5,
+        display_rate=None,
+        display_tolerance=0.05,
+        history=None,
+        stream_out=None,
+        stream_row_out=None,
+        stream_display_rate=STREAM_DISPLAY_RATE,
+        stats_enabled=True,
+        stats_out=None,
+        array_summary="sum",
         **kwargs,
     ):
         super().__init__(**kwargs)
@@ -50,10 +61,51 @@ class LessEffortCallback(CallbackBase):
         self._start_doc = None
         self._descriptors = {}
         self._table = None
+        self._store_enabled = store_enabled
+        # Columnar copy of hinted readings, for exports, statistics and
+        # renderers that read columns instead of documents
+        self.event_store = EventStore(max_runs=store_max_runs, max_rows=store_max_rows)
+        # Held while a document is dispatched; views reading event_store or
+        # stats from another thread (e.g. the GUI while a dispatcher runs in
+        # a worker) take it too
+        self.lock = threading.RLock()
+        # Optional RunHistory given every document, for browsing past runs
+        self.history = history
+        # Array and externally stored fields are replaced by summaries
+        # ("sum" or "max" of each array) as documents arrive, by descriptor
+        # uid, so no consumer formats or keeps the payloads
+        if array_summary not in REDUCERS:
+            raise ValueError(f"Unknown array summary {array_summary!r}, use {REDUCERS}")
+        self._array_summary = array_summary
+        self._summaries = {}
+        # Running statistics of the current table's columns, updated with
+        # every event (shown or not) and printed below the table at stop;
+        # stats_out is called with their snapshot at stop
+        self._stats_enabled = stats_enabled
+        self._stats_out = stats_out
+        self.stats = None
+        self._table_descriptor = None
+        # Optional limit on rendered primary rows per second
+        self._throttle = None
+        self.set_display_rate(display_rate, display_tolerance)
+        # Tables of the other streams (not dim_stream or baseline), by
+        # descriptor uid: (stream name, PagedLiveTable, DisplayThrottle)
+        self._stream_out = stream_out
+        self._stream_row_out = stream_row_out
+        self._stream_tables_enabled = stream_out is not None
+        self._stream_tables = {}
+        self._stream_rate = (stream_display_rate, display_tolerance)
+        # Rows held back while replaying documents already on the topic
+        self._catching_up = False
+        self._catchup_pending = None
+        self._catchup_rows = 0
         self._heading_enabled = True
         self._table_enabled = table_enabled
         self._baseline_enabled = True
-        self._out = out
+        # Instrumented only if metrics were enabled before the callback was built
+        self._metrics = metrics if metrics.enabled else None
+        self._out = metrics.wrap_out(out)
+        self._row_out = metrics.wrap_row_out(row_out)
         self._cleanup_motor_heuristic = False
         self._stream_names_seen = set()
         self._started = False
@@ -88,16 +140,119 @@ class LessEffortCallback(CallbackBase):
         "Opposite of enable_table()"
         self._table_enabled = False
 
+    def enable_stream_tables(self):
+        """
+        Render a table for every other stream too, from the next descriptor.
+
+        Lines of stream ``name`` go to ``stream_out(name, msg)`` and
+        ``stream_row_out(name, msg, first_seq, last_seq, nrows)``, which
+        must have been given.
+        """
+        if self._stream_out is None:
+            raise ValueError("Stream tables need stream_out")
+        self._stream_tables_enabled = True
+
+    def disable_stream_tables(self):
+        "Opposite of enable_stream_tables()"
+        self._stream_tables_enabled = False
+
+    def set_stream_display_rate(self, rate, tolerance=0.05):
+        """
+        Limit the rows per second rendered in each stream table, from the
+        next descriptor; see set_display_rate. The default is
+        STREAM_DISPLAY_RATE; ``None`` renders every row.
+        """
+        self._stream_rate = (rate, tolerance)
+
+    def enable_stats(self):
+        "Keep running statistics of the table columns, from the next run."
+        self._stats_enabled = True
+
+    def disable_stats(self):
+        "Opposite of enable_stats()"
+        self._stats_enabled = False
+
+    def enable_store(self):
+        "Keep hinted readings of every stream in event_store, from the next run."
+        self._store_enabled = True
+
+    def disable_store(self):
+        "Opposite of enable_store()"
+        self._store_enabled = False
+
+    def set_display_rate(self, rate, tolerance=0.05):
+        """
+        Limit how many primary rows per second are rendered.
+
+        While events arrive faster than ``rate``, only the first row, a row
+        every ``1/rate`` seconds, rows where a dimension field moves by more
+        than ``tolerance`` of its range, and the last row are rendered. The
+        event store still receives every event. ``None`` renders every row.
+        """
+        if rate is None:
+            self._throttle = None
+        else:
+            self._throttle = DisplayThrottle(rate, tolerance=tolerance)
+
+    def set_catching_up(self, catching_up):
+        """
+        Hold back primary rows while replaying documents already published.
+
+        While catching up, headings, headers and baseline readings are shown
+        and rows still reach the event store, but table rows are not
+        rendered. When catch-up ends the most recent row is rendered, so the
+        table resumes at the live position.
+        """
+        catching_up = bool(catching_up)
+        with self.lock:
+            if self._catching_up and not catching_up:
+                self._finish_catchup()
+            self._catching_up = catching_up
+
+    def _finish_catchup(self):
+        pending, self._catchup_pending = self._catchup_pending, None
+        replayed, self._catchup_rows = self._catchup_rows, 0
+        if self._table is None or pending is None:
+            return
+        if replayed > 1:
+            self._out(f"… {replayed - 1} rows replayed while catching up")
+        self._table("event", pending)
+
+    @property
+    def primary_store(self):
+        """ColumnStore of the current run's table stream, or None."""
+        return self.event_store.get_table(self._table_descriptor)
+
     def __call__(self, name, doc, *args, **kwargs):
+        if profiler.cprofile and not profiler.profiling():
+            return profiler.call(self.__call__, name, doc, *args, **kwargs)
+        if self._metrics is not None:
+            self._metrics.received(name, doc)
+        if name == "start":
+            self._summaries.clear()
+        elif name == "descriptor":
+            summary = ArraySummary.from_descriptor(doc, self._array_summary)
+            if summary is not None:
+                self._summaries[doc["uid"]] = summary
+                doc = summary.descriptor
+        elif name in ("event", "event_page") and self._summaries:
+            summary = self._summaries.get(doc["descriptor"])
+            if summary is not None:
+                doc = getattr(summary, name)(doc)
+        if self.history is not None:
+            self.history(name, doc)
         if not (self._table_enabled or self._baseline_enabled):
             return
-        super().__call__(name, doc, *args, **kwargs)
+        with self.lock:
+            super().__call__(name, doc, *args, **kwargs)
 
     def start(self, doc):
         self.clear()
-        print("Start Doc Received")
+        logger.debug("Start Doc Received")
         self._start_doc = doc
         self.plan_hints = doc.get("hints", {})
+        if self._store_enabled:
+            self.event_store.start(doc)
 
         # Prepare a guess about the dimensions (independent variables) in case
         # we need it.
@@ -187,55 +342,186 @@ class LessEffortCallback(CallbackBase):
         # duplicated here.
         columns = [c for c in columns if c not in self.all_dim_fields]
 
+        # ## STORE ## #
+        if self._store_enabled:
+            if stream_name == self.dim_stream:
+                self._table_descriptor = doc["uid"]
+                self.event_store.add_descriptor(
+                    doc, list(self.all_dim_fields) + columns
+                )
+            else:
+                self.event_store.add_descriptor(doc, hinted_fields(doc))
+
+        # ## STATISTICS ## #
+        if stream_name == self.dim_stream and self._stats_enabled:
+            self.stats = RunningStats.from_descriptor(
+                doc,
+                self.dim_fields[0] if self.dim_fields else None,
+                columns,
+                time_origin=self._start_doc["time"],
+            )
+
         # ## TABLE ## #
         if stream_name == self.dim_stream:
+            if self._throttle is not None:
+                self._throttle.reset(self.dim_fields)
             if self._table_enabled:
                 # plot everything, independent or dependent variables
-                self._table = LiveTable(
+                summary = self._summaries.get(doc["uid"])
+                if summary is not None:
+                    self._out(summary.describe())
+                self._table = PagedLiveTable(
                     list(self.all_dim_fields) + columns,
                     separator_lines=False,
                     out=self._out,
+                    row_out=self._row_out,
                 )
                 self._table("start", self._start_doc)
                 self._table("descriptor", doc)
+        elif stream_name != "baseline" and self._stream_tables_enabled:
+            self._add_stream_table(stream_name, doc)
+
+    def _add_stream_table(self, stream_name, doc):
+        def out(msg):
+            self._stream_out(stream_name, msg)
+
+        def row_out(msg, first_seq=None, last_seq=None, nrows=1):
+            self._stream_row_out(stream_name, msg, first_seq, last_seq, nrows)
+
+        table = PagedLiveTable(
+            hinted_fields(doc),
+            stream_name=stream_name,
+            separator_lines=False,
+            out=out,
+            row_out=row_out if self._stream_row_out is not None else None,
+        )
+        rate, tolerance = self._stream_rate
+        throttle = None
+        if rate is not None:
+            throttle = DisplayThrottle(rate, tolerance=tolerance)
+        table("start", self._start_doc)
+        table("descriptor", doc)
+        self._stream_tables[doc["uid"]] = (stream_name, table, throttle)
 
     def event(self, doc):
         if not self._started:
             return
         descriptor = self._descriptors[doc["descriptor"]]
+        self.event_store.append_event(doc)
+        if self.stats is not None and descriptor.get("name") == self.dim_stream:
+            self.stats.add_event(doc)
         if descriptor.get("name") == "primary":
             if self._table is not None:
-                self._table("event", doc)
+                if self._catching_up:
+                    self._catchup_pending = doc
+                    self._catchup_rows += 1
+                elif self._throttle is None or self._throttle.accept(doc):
+                    self._table("event", doc)
 
         # Show the baseline readings.
         if descriptor.get("name") == "baseline":
-            columns = hinted_fields(descriptor)
-            self._baseline_toggle = not self._baseline_toggle
-            if self._baseline_enabled:
-                border = "+" + "-" * 32 + "+" + "-" * 32 + "+"
-                if self._baseline_toggle:
-                    print("End-of-run baseline readings:", file=self._buffer)
-                    print(border, file=self._buffer)
+            self._baseline_event(descriptor, doc)
+
+        stream_table = self._stream_tables.get(doc["descriptor"])
+        if stream_table is not None and not self._catching_up:
+            _, table, throttle = stream_table
+            if throttle is None or throttle.accept(doc):
+                table("event", doc)
+
+    def event_page(self, doc):
+        if not self._started:
+            return
+        descriptor = self._descriptors[doc["descriptor"]]
+        self.event_store.append_page(doc)
+        if self.stats is not None and descriptor.get("name") == self.dim_stream:
+            self.stats.add_page(doc)
+        if descriptor.get("name") == "primary":
+            if self._table is not None:
+                if self._catching_up:
+                    n = len(doc["seq_num"])
+                    if n:
+                        last = page_subset(doc, [n - 1])
+                        self._catchup_pending = next(iter(unpack_event_page(last)))
+                        self._catchup_rows += n
+                elif self._throttle is None:
+                    self._table("event_page", doc)
                 else:
-                    self._out("Start-of-run baseline readings:")
-                    self._out(border)
-                for k, v in doc["data"].items():
-                    if k not in columns:
-                        continue
-                    if self._baseline_toggle:
-                        print(f"| {k:>30} | {v:<30} |", file=self._buffer)
-                    else:
-                        self._out(f"| {k:>30} | {v:<30} |")
+                    keep = self._throttle.accept_page(doc)
+                    if len(keep) == len(doc["seq_num"]):
+                        self._table("event_page", doc)
+                    elif len(keep):
+                        self._table("event_page", page_subset(doc, keep))
+
+        if descriptor.get("name") == "baseline":
+            for event in unpack_event_page(doc):
+                self._baseline_event(descriptor, event)
+
+        stream_table = self._stream_tables.get(doc["descriptor"])
+        if stream_table is not None and not self._catching_up:
+            _, table, throttle = stream_table
+            if throttle is None:
+                table("event_page", doc)
+            else:
+                keep = throttle.accept_page(doc)
+                if len(keep):
+                    table("event_page", page_subset(doc, keep))
+
+    def _baseline_event(self, descriptor, doc):
+        self._baseline_toggle = not self._baseline_toggle
+        if self._baseline_enabled:
+            plan = get_baseline_plan(descriptor)
+            columns = plan.columns
+            border = plan.border
+            if self._baseline_toggle:
+                print("End-of-run baseline readings:", file=self._buffer)
+                print(border, file=self._buffer)
+            else:
+                self._out("Start-of-run baseline readings:")
+                self._out(border)
+            for k, v in doc["data"].items():
+                if k not in columns:
+                    continue
                 if self._baseline_toggle:
-                    print(border, file=self._buffer)
+                    print(plan.row_template.format(k, v), file=self._buffer)
                 else:
-                    self._out(border)
+                    self._out(plan.row_template.format(k, v))
+            if self._baseline_toggle:
+                print(border, file=self._buffer)
+            else:
+                self._out(border)
 
     def stop(self, doc):
         if not self._started:
             return
+        self.event_store.stop(doc)
         if self._table is not None:
+            if self._catching_up:
+                self._finish_catchup()
+            if self._throttle is not None:
+                # Always finish on the last row
+                pending = self._throttle.take_pending()
+                if pending is not None:
+                    self._table("event", pending)
             self._table("stop", doc)
+            if self._throttle is not None:
+                skipped = self._throttle.total_rows - self._throttle.shown_rows
+                if skipped > 0:
+                    self._out(
+                        f"Display limited to {self._throttle.rate:g} rows/s: "
+                        f"{skipped} of {self._throttle.total_rows} rows not shown"
+                    )
+            if self.stats is not None:
+                for line in self.stats.format_table():
+                    self._out(line)
+        if self.stats is not None and self._stats_out is not None:
+            self._stats_out(self.stats.snapshot())
+
+        for _, table, throttle in self._stream_tables.values():
+            if throttle is not None:
+                pending = throttle.take_pending()
+                if pending is not None:
+                    table("event", pending)
+            table("stop", doc)
 
         if self._baseline_enabled:
             # Print baseline below bottom border of table.
@@ -249,5 +535,9 @@ class LessEffortCallback(CallbackBase):
         self._descriptors.clear()
         self._stream_names_seen.clear()
         self._table = None
+        self.stats = None
+        self._stream_tables = {}
+        self._catchup_pending = None
+        self._catchup_rows = 0
         self._buffer = StringIO()
         self._baseline_toggle = True
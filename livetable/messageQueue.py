@@ -0,0 +1,222 @@
+"""
+Bounded queue between a LessEffortCallback and the Qt display.
+
+Table rows are queued with ``put_rows`` and may be shed under load according
+to the overload policy. Everything else (headings, table headers, baseline
+readings, stop output) is queued with ``put`` and is never dropped.
+"""
+
+from collections import deque
+import queue
+import threading
+import time
+
+POLICIES = ("block", "drop-oldest", "decimate", "collapse")
+
+
+class BoundedMessageQueue:
+    """
+    Queue of console lines holding at most ``maxsize`` table rows.
+
+    Parameters
+    ----------
+    maxsize : int
+        Maximum number of table rows waiting for display. Other messages do
+        not count towards the limit.
+    policy : str
+        What to do with rows when full:
+
+        - "block": wait for the display to catch up; a producer running in
+          the thread that reads the queue, or in the main (GUI) thread,
+          cannot wait for it and discards the oldest rows instead. The
+          waiting thread stalls everything it feeds, so this only suits a
+          producer serving this one queue
+        - "drop-oldest": discard the oldest queued rows
+        - "decimate": keep only every ``decimate_every``-th new row, also
+          within a block of rows, then discard the oldest rows if still
+          needed
+        - "collapse": discard new rows and queue a single
+          "... N rows skipped (seq a-b)" line in their place
+    decimate_every : int
+        Keep one row in this many while decimating.
+    block_timeout : float
+        Seconds ``put_rows`` waits with the "block" policy before dropping
+        the oldest rows instead, so a stalled display cannot hang the
+        producer forever.
+    """
+
+    def __init__(
+        self, maxsize=10000, policy="drop-oldest", decimate_every=10, block_timeout=5.0
+    ):
+        if policy not in POLICIES:
+            raise ValueError(
+                f"Unknown overload policy {policy!r}, use one of {POLICIES}"
+            )
+        self.maxsize = maxsize
+        self.policy = policy
+        self.decimate_every = max(1, int(decimate_every))
+        self.block_timeout = block_timeout
+        # Items are (msg, nrows, first_seq, last_seq); nrows == 0 marks a
+        # message that is never dropped
+        self._items = deque()
+        self._rows = 0
+        self._mutex = threading.Lock()
+        self._not_empty = threading.Condition(self._mutex)
+        self._not_full = threading.Condition(self._mutex)
+        # Rows seen while decimating
+        self._decimate_count = 0
+        # Thread that last read the queue
+        self._reader = None
+        self._skipped = None
+        self.dropped_rows = 0
+
+    def qsize(self):
+        """Number of queued messages."""
+        with self._mutex:
+            return len(self._items)
+
+    def rows_queued(self):
+        """Number of queued table rows."""
+        with self._mutex:
+            return self._rows
+
+    def put(self, msg):
+        """Queue a message that must never be dropped."""
+        with self._mutex:
+            self._flush_skipped()
+            self._items.append((msg, 0, None, None))
+            self._not_empty.notify()
+
+    def put_rows(self, msg, first_seq=None, last_seq=None, nrows=1):
+        """
+        Queue one or more table rows, applying the overload policy.
+
+        Parameters
+        ----------
+        msg : str
+            The rows, joined by newlines.
+        first_seq, last_seq : int, optional
+            Sequence numbers of the first and last row.
+        nrows : int
+            Number of rows in ``msg``.
+        """
+        with self._mutex:
+            if self._rows + nrows > self.maxsize:
+                if self.policy == "block" and self._can_block():
+                    deadline = time.monotonic() + self.block_timeout
+                    while self._rows and self._rows + nrows > self.maxsize:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._not_full.wait(remaining)
+                elif self.policy == "decimate":
+                    decimated = self._decimate(msg, first_seq, last_seq, nrows)
+                    if decimated is None:
+                        return
+                    msg, first_seq, last_seq, nrows = decimated
+                elif self.policy == "collapse":
+                    self._skip(nrows, first_seq, last_seq)
+                    return
+                self._drop_oldest_rows(nrows)
+            else:
+                self._flush_skipped()
+            self._items.append((msg, nrows, first_seq, last_seq))
+            self._rows += nrows
+            self._not_empty.notify()
+
+    def get(self, timeout=None, with_rows=False):
+        """
+        Remove and return the next message, or ``(msg, nrows)`` if
+        ``with_rows`` is true; ``nrows`` is 0 for anything but table rows.
+
+        Raises
+        ------
+        queue.Empty
+            If nothing arrives within ``timeout`` seconds.
+        """
+        with self._not_empty:
+            self._reader = threading.get_ident()
+            if not self._items and self._skipped is None:
+                self._not_empty.wait(timeout)
+            return self._pop(with_rows)
+
+    def get_nowait(self, with_rows=False):
+        with self._mutex:
+            self._reader = threading.get_ident()
+            return self._pop(with_rows)
+
+    def _pop(self, with_rows=False):
+        if not self._items:
+            # Report skipped rows once the display has caught up
+            self._flush_skipped()
+        if not self._items:
+            raise queue.Empty
+        msg, nrows, _, _ = self._items.popleft()
+        if nrows:
+            self._rows -= nrows
+            self._not_full.notify()
+        return (msg, nrows) if with_rows else msg
+
+    def _can_block(self):
+        # Waiting in the thread that drains the queue would never end, and
+        # in the GUI thread it would freeze the display
+        thread = threading.get_ident()
+        return thread != self._reader and thread != threading.main_thread().ident
+
+    def _decimate(self, msg, first_seq, last_seq, nrows):
+        """
+        Keep every ``decimate_every``-th row, counting rows across calls.
+
+        Returns
+        -------
+        tuple or None
+            (msg, first_seq, last_seq, nrows) of the kept rows, or None if
+            none is kept.
+        """
+        every = self.decimate_every
+        start = self._decimate_count
+        self._decimate_count += nrows
+        keep = range((-start) % every, nrows, every)
+        if not keep:
+            self.dropped_rows += nrows
+            return None
+        lines = msg.split("\n")
+        if len(lines) != nrows:
+            # Not one line per row: the block is kept as a unit
+            return msg, first_seq, last_seq, nrows
+        if first_seq is not None and last_seq is not None:
+            if last_seq - first_seq + 1 == nrows:
+                first_seq, last_seq = first_seq + keep[0], first_seq + keep[-1]
+        self.dropped_rows += nrows - len(keep)
+        return "\n".join(lines[i] for i in keep), first_seq, last_seq, len(keep)
+
+    def _drop_oldest_rows(self, needed):
+        i = 0
+        while self._rows + needed > self.maxsize and i < len(self._items):
+            nrows = self._items[i][1]
+            if nrows:
+                del self._items[i]
+                self._rows -= nrows
+                self.dropped_rows += nrows
+            else:
+                i += 1
+
+    def _skip(self, nrows, first_seq, last_seq):
+        self.dropped_rows += nrows
+        if self._skipped is None:
+            self._skipped = [0, first_seq, last_seq]
+        self._skipped[0] += nrows
+        if last_seq is not None:
+            self._skipped[2] = last_seq
+
+    def _flush_skipped(self):
+        if self._skipped is None:
+            return
+        n, first_seq, last_seq = self._skipped
+        self._skipped = None
+        if first_seq is not None:
+            msg = f"… {n} rows skipped (seq {first_seq}–{last_seq})"
+        else:
+            msg = f"… {n} rows skipped"
+        self._items.append((msg, 0, None, None))
+        self._not_empty.notify()
@@ -0,0 +1,28 @@
+from qtpy.QtCore import QTimer
+from qtpy.QtWidgets import QLabel
+
+from .pipelineMetrics import metrics
+
+
+class QtMetricsStatus(QLabel):
+    """
+    Status line showing pipeline throughput and stage latencies.
+
+    Parameters
+    ----------
+    interval : float
+        Seconds between refreshes.
+    parent : QWidget, optional
+    """
+
+    def __init__(self, interval=1.0, parent=None):
+        super().__init__(parent)
+        self.setText("Collecting metrics…")
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self._refresh)
+        self._timer.start(int(interval * 1000))
+
+    def _refresh(self):
+        text = metrics.status_line()
+        if text:
+            self.setText(text)
@@ -0,0 +1,132 @@
+"""
+Local checkpoints of Kafka consumer positions, for resuming after a restart.
+
+OffsetCheckpoint keeps, for every partition a KafkaDispatcher has read, the
+next offset to read and the offset of the ``start`` document of the run in
+progress (None between runs), and writes them to a small JSON file every
+``interval`` seconds and when the dispatcher stops. A restarted dispatcher
+resumes each partition at that run's ``start``, or at the next offset if no
+run was in progress, and replays the gap as a catch-up; see KafkaDispatcher.
+
+The file is replaced atomically, so a crash while writing leaves the
+previous checkpoint.
+"""
+
+import json
+import os
+import time
+
+
+class OffsetCheckpoint:
+    """
+    Positions of Kafka partitions, kept in a JSON file.
+
+    Parameters
+    ----------
+    path : str
+        Checkpoint file; created, with its directory, on the first write.
+    interval : float
+        Minimum seconds between periodic writes.
+    """
+
+    def __init__(self, path, interval=5.0):
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.interval = interval
+        # (topic, partition) -> (next offset, offset of the run's start or None)
+        self.entries = self._load()
+        self._written = time.monotonic()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as ex:
+            print(f"Exception occurred: {ex}")
+            return {}
+        return {
+            (p["topic"], p["partition"]): (p["offset"], p.get("run_start"))
+            for p in saved.get("partitions", [])
+        }
+
+    def resume_offset(self, topic, partition):
+        """
+        Offset to resume a partition at: the ``start`` of the run that was
+        in progress, else the next unread offset, or None if unknown.
+        """
+        entry = self.entries.get((topic, partition))
+        if entry is None:
+            return None
+        offset, run_start = entry
+        return offset if run_start is None else run_start
+
+    def save(self, positions, run_starts, force=False):
+        """
+        Record positions and write the file, at most every ``interval``
+        seconds unless ``force`` is set.
+
+        Parameters
+        ----------
+        positions : dict
+            (topic, partition) -> next offset.
+        run_starts : dict
+            (topic, partition) -> offset of the ``start`` document of the
+            run in progress; partitions between runs are absent.
+
+        Returns
+        -------
+        bool
+            Whether the file was written.
+        """
+        if not force and time.monotonic() - self._written < self.interval:
+            return False
+        self._written = time.monotonic()
+        for key, offset in list(positions.items()):
+            self.entries[key] = (offset, run_starts.get(key))
+        try:
+            self._write()
+        except OSError as ex:
+            print(f"Exception occurred: {ex}")
+            return False
+        return True
+
+    def _write(self):
+        partitions = [
+            {"topic": topic, "partition": partition, "offset": offset, "run_start": start}
+            for (topic, partition), (offset, start) in sorted(self.entries.items())
+        ]
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"time": time.time(), "partitions": partitions}, f, indent=1)
+        os.replace(tmp, self.path)
+
+
+def add_checkpoint_arguments(parser):
+    """Add the --group-id and --checkpoint options to an argparse parser."""
+    parser.add_argument(
+        "--group-id",
+        default=None,
+        help="stable Kafka consumer group id (default: a new group per start)",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        metavar="FILE",
+        default=None,
+        help="write consumer offsets to FILE and resume from it on restart",
+    )
+    parser.add_argument(
+        "--checkpoint-interval",
+        type=float,
+        default=5.0,
+        help="seconds between checkpoint writes",
+    )
+
+
+def make_checkpoint(args):
+    """An OffsetCheckpoint from ``add_checkpoint_arguments`` options, or None."""
+    if not args.checkpoint:
+        return None
+    return OffsetCheckpoint(args.checkpoint, interval=args.checkpoint_interval)
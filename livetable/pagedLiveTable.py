@@ -0,0 +1,201 @@
+"""
+LiveTable with native event_page support.
+
+bluesky's LiveTable only implements ``event``, so pages are unpacked and
+formatted one row at a time. PagedLiveTable validates and converts every
+column of a page in one pass with NumPy and formats the rows with a single
+compiled template, producing exactly the rows LiveTable would print. It falls
+back to row-by-row formatting for values it cannot vectorize.
+
+Single events are formatted with the descriptor's compiled render plan (see
+renderPlan) using one positional template per row.
+"""
+
+from collections import OrderedDict
+from datetime import datetime
+from enum import Enum
+import logging
+import time
+
+import numpy as np
+from bluesky.callbacks.core import CallbackBase, LiveTable
+from event_model import unpack_event_page
+
+from .renderPlan import get_table_plan
+
+logger = logging.getLogger(__name__)
+
+
+def format_times(times):
+    """
+    Format timestamps like ``str(datetime.fromtimestamp(t).time())`` for a whole
+    array, splitting hours, minutes, seconds and microseconds with NumPy.
+
+    The local UTC offset is taken from the first timestamp.
+
+    Returns
+    -------
+    list of str
+    """
+    times = np.asarray(times, dtype=np.float64)
+    if not len(times):
+        return []
+    offset = time.localtime(times[0]).tm_gmtoff
+    micros = np.round((times + offset) * 1e6).astype(np.int64) % 86_400_000_000
+    secs, frac = np.divmod(micros, 1_000_000)
+    hours, rem = np.divmod(secs, 3600)
+    minutes, seconds = np.divmod(rem, 60)
+    parts = zip(hours.tolist(), minutes.tolist(), seconds.tolist(), frac.tolist())
+    text = ["%02d:%02d:%02d.%06d" % hmsf for hmsf in parts]
+    # str(time) omits the fraction entirely when it is zero
+    for i in np.flatnonzero(frac == 0).tolist():
+        text[i] = text[i][:8]
+    return text
+
+
+# Array kinds each LiveTable format code accepts without special casing
+_PAGE_KINDS = {"f": "iuf", "g": "iuf", "d": "iu", "s": "bU"}
+
+
+class PagedLiveTable(LiveTable):
+    """
+    Drop-in LiveTable that also formats ``event_page`` documents natively.
+
+    Unlike LiveTable, rows are only retained for the logbook when one is set.
+
+    Parameters
+    ----------
+    row_out : callable, optional
+        Called as ``row_out(msg, first_seq, last_seq, nrows)`` for data rows,
+        so that a display can tell rows, which it may shed under load, from
+        headers and borders, which always go through ``out``. Defaults to
+        sending rows through ``out`` as well.
+    """
+
+    def __init__(self, *args, row_out=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._row_out = row_out
+
+    def descriptor(self, doc):
+        if doc["name"] != self._stream:
+            return
+
+        self._descriptors.add(doc["uid"])
+        plan = get_table_plan(
+            doc,
+            self._fields,
+            min_width=self._min_width,
+            default_prec=self._default_prec,
+            extra_pad=self._pad_len,
+        )
+        self._plan = plan
+        self._format_info = OrderedDict(plan.format_info)
+        self._sep_format = plan.sep_format
+        self._main_fmnt = plan.main_fmnt
+        self._header = plan.header
+        self._data_formats = OrderedDict(plan.data_formats)
+        self._count = 0
+
+        if self._separator_lines:
+            self._print("\n")
+        self._print(self._sep_format)
+        self._print(self._header)
+        self._print(self._sep_format)
+        # Skip LiveTable.descriptor, which would re-derive the layout
+        CallbackBase.descriptor(self, doc)
+
+    def event(self, doc):
+        if doc["descriptor"] not in self._descriptors:
+            return
+        data = doc["data"]
+        filled = doc.get("filled", {})
+        values = [doc["seq_num"], str(datetime.fromtimestamp(doc["time"]).time())]
+        try:
+            for k in self._plan.fields:
+                v = data[k]
+                # Placeholders, bools and enums need LiveTable's special cases
+                if isinstance(v, (bool, Enum)) or not filled.get(k, True):
+                    raise TypeError(k)
+                values.append(v)
+            row = self._plan.row_template.format(*values)
+        except (KeyError, TypeError, ValueError):
+            return super().event(doc)
+
+        self._count += 1
+        if not self._count % self._header_interval:
+            self._print(self._sep_format)
+            self._print(self._header)
+            self._print(self._sep_format)
+        self._print_rows([row], doc["seq_num"], doc["seq_num"])
+
+    def _print(self, out_str):
+        if self.logbook:
+            self._rows.append(out_str)
+        self._out(out_str)
+
+    def _print_rows(self, rows, first_seq, last_seq):
+        """Emit a block of data rows through ``row_out``."""
+        if not rows:
+            return
+        if self._row_out is None:
+            self._print("\n".join(rows))
+            return
+        if self.logbook:
+            self._rows.extend(rows)
+        self._row_out("\n".join(rows), first_seq, last_seq, len(rows))
+
+    def _format_page(self, doc):
+        """
+        Return the formatted rows of a page as a list of str.
+
+        Each column is validated and converted to native values with NumPy,
+        then every row goes through the plan's compiled page template.
+
+        Raises
+        ------
+        KeyError, TypeError, ValueError
+            If a column needs LiveTable's per-value special cases.
+        """
+        data = doc["data"]
+        filled = doc.get("filled", {})
+        seq_num = np.asarray(doc["seq_num"])
+        if seq_num.dtype.kind not in "iu":
+            raise TypeError("seq_num must be integers")
+        cols = [seq_num.tolist(), format_times(doc["time"])]
+        for k in self._plan.fields:
+            values = np.asarray(data[k])
+            fmt = self._format_info[k].dtype
+            if values.ndim != 1 or values.dtype.kind not in _PAGE_KINDS[fmt]:
+                raise TypeError(f"Cannot format {k} ({values.dtype}) as {fmt!r}")
+            if not all(filled.get(k, ())):
+                raise ValueError(f"{k} is not filled in every row")
+            cols.append(values.tolist())
+        template = self._plan.page_template
+        return [template % row for row in zip(*cols)]
+
+    def event_page(self, doc):
+        if doc["descriptor"] not in self._descriptors:
+            return
+        try:
+            rows = self._format_page(doc)
+        except (KeyError, TypeError, ValueError):
+            logger.debug("Falling back to row-by-row formatting", exc_info=True)
+            for event in unpack_event_page(doc):
+                self.event(event)
+            return
+
+        # Repeat the header every print_header_interval rows, as event() does
+        seq_num = doc["seq_num"]
+        interval = self._header_interval
+        first = -(self._count + 1) % interval
+        self._count += len(rows)
+        prev = 0
+        for i in range(first, len(rows), interval):
+            if i > prev:
+                self._print_rows(rows[prev:i], seq_num[prev], seq_num[i - 1])
+            self._print(
+                "\n".join((self._sep_format, self._header, self._sep_format))
+            )
+            prev = i
+        if prev < len(rows):
+            self._print_rows(rows[prev:], seq_num[prev], seq_num[-1])
@@ -0,0 +1,339 @@
+"""
+End-to-end latency and throughput of the live table pipeline.
+
+Documents are timestamped at five points::
+
+    doc["time"] --transport--> source receipt --queue--> LessEffortCallback
+    --callback--> output --display--> lines shown by QtReConsoleMonitor
+
+where receipt is when a source (KafkaDispatcher, QtZmqDispatcher, the
+AsyncEngine sources) got the message from the broker, recorded with
+``receipt``, and "queue" is the wait until the callback runs, e.g. in the
+AsyncEngine's document queues. Each stage keeps a rolling histogram, plus
+"end_to_end" from document creation to display (to output in headless
+programs). Counters track documents by name, table rows, lines
+displayed and bytes received.
+
+Instrumentation is off unless ``metrics.enable()`` is called (or
+``LIVETABLE_METRICS=1`` is set) before the dispatchers and callbacks are
+built; while off, the pipeline only pays for ``if metrics.enabled`` checks.
+Transport latency compares clocks of two hosts, so it includes their skew.
+"""
+
+from bisect import bisect_left
+from collections import deque
+import os
+import threading
+import time
+
+# Upper bounds, in seconds, of the Prometheus histogram buckets
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+STAGES = ("transport", "queue", "callback", "display", "end_to_end")
+
+
+def _doc_time(doc):
+    # The last event of a page; None for documents without a time
+    t = doc.get("time")
+    if isinstance(t, list):
+        return t[-1] if t else None
+    return t
+
+
+class RollingHistogram:
+    """
+    Latency samples of one stage.
+
+    Keeps cumulative bucket counts, count and sum, as exported to
+    Prometheus, and the last ``window`` samples for percentiles.
+    """
+
+    def __init__(self, buckets=BUCKETS, window=1000):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+
+    def add(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def percentile(self, q):
+        """The ``q``-th percentile (0-100) of the recent samples, or None."""
+        if not self.recent:
+            return None
+        values = sorted(self.recent)
+        return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+class PipelineMetrics:
+    """
+    Stage histograms and counters shared by everything in the process.
+
+    Use the module's ``metrics`` instance.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        # Without a display, end_to_end ends when the callback outputs a line
+        self.headless = False
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stages = {stage: RollingHistogram() for stage in STAGES}
+        self.documents = {}
+        self.rows = 0
+        self.lines = 0
+        self.bytes = 0
+        self._status = None
+
+    def enable(self, headless=False):
+        self.enabled = True
+        self.headless = headless
+
+    def _add(self, stage, value):
+        if value is not None and value >= 0:
+            self.stages[stage].add(value)
+
+    def receipt(self, doc, when=None):
+        """
+        Record that a source received ``doc`` from the broker, now or at
+        ``when``. A callback given the same document in this thread measures
+        transport up to this time, and the wait since as "queue".
+
+        Returns
+        -------
+        float
+            The receipt time, for a source that hands the document to
+            another thread.
+        """
+        when = time.time() if when is None else when
+        self._local.receipt = (id(doc), when)
+        return when
+
+    def receipt_time(self, doc):
+        """The time this thread recorded the receipt of ``doc``, or None."""
+        receipt = getattr(self._local, "receipt", None)
+        if receipt is not None and receipt[0] == id(doc):
+            return receipt[1]
+        return None
+
+    def received(self, name, doc):
+        """
+        Record a document's receipt by a callback. Subsequent output from
+        the same thread is attributed to this document.
+        """
+        now = time.time()
+        doc_time = _doc_time(doc)
+        source_time = self.receipt_time(doc)
+        self._local.received = (doc_time, now)
+        name = getattr(name, "name", name)
+        with self._lock:
+            self.documents[name] = self.documents.get(name, 0) + 1
+            if doc_time is not None:
+                self._add("transport", (source_time or now) - doc_time)
+            if source_time is not None:
+                self._add("queue", now - source_time)
+
+    def add_bytes(self, nbytes):
+        """Count bytes of serialized documents received from a broker."""
+        with self._lock:
+            self.bytes += nbytes
+
+    def output(self, nrows=0):
+        """
+        Record output of a line (``nrows`` table rows) by a callback.
+
+        Returns
+        -------
+        tuple or None
+            (document time, output time) of the line, for ``displayed``.
+        """
+        now = time.time()
+        received = getattr(self._local, "received", None)
+        doc_time, received_time = received if received else (None, None)
+        stamp = (doc_time, now)
+        self._local.output = stamp
+        with self._lock:
+            self.rows += nrows
+            if received_time is not None:
+                self._add("callback", now - received_time)
+            if self.headless and doc_time is not None:
+                self._add("end_to_end", now - doc_time)
+        return stamp
+
+    def last_output(self):
+        """The stamp of the last line output by this thread."""
+        return getattr(self._local, "output", None)
+
+    def displayed(self, stamp, nlines):
+        """Record that lines up to the one with ``stamp`` are on screen."""
+        now = time.time()
+        with self._lock:
+            self.lines += nlines
+            if stamp is None:
+                return
+            doc_time, output_time = stamp
+            self._add("display", now - output_time)
+            if doc_time is not None:
+                self._add("end_to_end", now - doc_time)
+
+    def wrap_out(self, out):
+        """
+        ``out`` instrumented with ``output``, or ``out`` itself while
+        disabled.
+        """
+        if not self.enabled or out is None:
+            return out
+
+        def instrumented_out(msg):
+            self.output()
+            return out(msg)
+
+        return instrumented_out
+
+    def wrap_row_out(self, row_out):
+        """``wrap_out`` for ``row_out(msg, first_seq, last_seq, nrows)``."""
+        if not self.enabled or row_out is None:
+            return row_out
+
+        def instrumented_row_out(msg, first_seq=None, last_seq=None, nrows=1):
+            self.output(nrows)
+            return row_out(msg, first_seq, last_seq, nrows)
+
+        return instrumented_row_out
+
+    def status_line(self):
+        """One line of rates since the previous call and stage percentiles."""
+        now = time.monotonic()
+        with self._lock:
+            totals = (sum(self.documents.values()), self.rows, self.bytes)
+            percentiles = [
+                (stage, hist.percentile(50), hist.percentile(99))
+                for stage, hist in self.stages.items()
+                if hist.recent
+            ]
+        last, self._status = self._status, (now, totals)
+        parts = []
+        if last is not None and now > last[0]:
+            elapsed = now - last[0]
+            docs, rows, nbytes = ((a - b) / elapsed for a, b in zip(totals, last[1]))
+            parts.append(
+                f"{docs:.0f} docs/s  {rows:.0f} rows/s  {nbytes / 1024:.1f} kB/s"
+            )
+        for stage, p50, p99 in percentiles:
+            parts.append(f"{stage} {p50 * 1e3:.1f}/{p99 * 1e3:.1f} ms")
+        return "  |  ".join(parts) + ("  (p50/p99)" if percentiles else "")
+
+    def prometheus_text(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            lines.append("# TYPE livetable_documents_total counter")
+            for name, count in sorted(self.documents.items()):
+                lines.append(f'livetable_documents_total{{name="{name}"}} {count}')
+            for counter, value in (
+                ("rows", self.rows),
+                ("lines_displayed", self.lines),
+                ("received_bytes", self.bytes),
+            ):
+                lines.append(f"# TYPE livetable_{counter}_total counter")
+                lines.append(f"livetable_{counter}_total {value}")
+            lines.append("# TYPE livetable_latency_seconds histogram")
+            for stage, hist in self.stages.items():
+                cumulative = 0
+                for bound, count in zip(hist.buckets + ("+Inf",), hist.counts):
+                    cumulative += count
+                    lines.append(
+                        f'livetable_latency_seconds_bucket{{stage="{stage}",'
+                        f'le="{bound}"}} {cumulative}'
+                    )
+                lines.append(
+                    f'livetable_latency_seconds_sum{{stage="{stage}"}} {hist.sum}'
+                )
+                lines.append(
+                    f'livetable_latency_seconds_count{{stage="{stage}"}} {hist.count}'
+                )
+        return "\n".join(lines) + "\n"
+
+
+metrics = PipelineMetrics()
+if os.environ.get("LIVETABLE_METRICS", "") not in ("", "0"):
+    metrics.enable()
+
+
+def serve_metrics(port, host=""):
+    """Serve ``/metrics`` over HTTP from a daemon thread."""
+    import http.server
+
+    class MetricsHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = metrics.prometheus_text().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def write_metrics(path, interval=5.0):
+    """
+    Rewrite ``path`` with the Prometheus text every ``interval`` seconds from
+    a daemon thread, e.g. for node_exporter's textfile collector.
+    """
+
+    def run():
+        while True:
+            time.sleep(interval)
+            tmp = f"{path}.tmp"
+            try:
+                with open(tmp, "w") as f:
+                    f.write(metrics.prometheus_text())
+                os.replace(tmp, path)
+            except OSError as ex:
+                print(f"Exception occurred: {ex}")
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def add_metrics_arguments(parser):
+    """Add the headless entry points' metrics options to an argparse parser."""
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        help="serve Prometheus metrics on this HTTP port",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        default=None,
+        help="write Prometheus metrics to this file every few seconds",
+    )
+
+
+def start_metrics(args):
+    """
+    Enable headless metrics and their outputs if asked for by the options of
+    ``add_metrics_arguments``.
+    """
+    if args.metrics_port is None and args.metrics_file is None:
+        return
+    metrics.enable(headless=True)
+    if args.metrics_port is not None:
+        serve_metrics(args.metrics_port)
+    if args.metrics_file is not None:
+        write_metrics(args.metrics_file)
@@ -0,0 +1,330 @@
+"""
+Opt-in profiling of a running live table.
+
+Enabled with ``--profile`` on the console scripts, or ``LIVETABLE_PROFILE``
+in the environment, with a comma-separated list of modes:
+
+- "sample": a wall-clock sampler thread records the stack of every thread
+  every ``sample_interval`` seconds. It does not touch the profiled code,
+  costs well under 1% of a core at the default 50 Hz, and can stay on for
+  a whole shift.
+- "memory": ``tracemalloc`` with one frame per allocation; reports list the
+  top allocation sites and the change since the previous report. Tracing
+  every allocation makes the callback several times slower, so turn it on
+  to chase a leak rather than for a whole shift.
+- "cprofile": deterministic profiles of ``LessEffortCallback.__call__``,
+  ``KafkaDispatcher.poll`` and ``QtReConsoleMonitor._append_lines``. Exact
+  call counts, but it slows those calls down noticeably; use it for short
+  captures.
+
+Reports are written to ``directory`` every ``interval`` seconds, on SIGUSR1
+and at exit, and cover the time since the previous report:
+``*-samples.txt`` holds collapsed stacks (``thread;outer;...;inner count``,
+the input of flamegraph.pl and speedscope), ``*-summary.txt`` samples per
+hot-path section and the busiest functions, ``*-memory.txt`` the tracemalloc
+statistics and ``*-cprofile.pstats`` the cProfile data.
+"""
+
+from collections import Counter
+import atexit
+import cProfile
+import os
+import pstats
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+
+MODES = ("sample", "memory", "cprofile")
+
+# Stack frames marking the hot paths, as (file name, function name)
+SECTIONS = {
+    "callback": ("lessEffortCallback.py", "__call__"),
+    "dispatcher": ("kafkaDispatcher.py", "poll"),
+    "render": ("simpleConsoleMonitor.py", "_append_lines"),
+}
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class Profiler:
+    """
+    Sampler, tracemalloc and cProfile captures with periodic reports.
+
+    Use the module's ``profiler`` instance, configured by ``start_profiling``.
+
+    Parameters
+    ----------
+    modes : iterable of str
+        Any of MODES.
+    directory : str
+        Where reports are written; created if needed.
+    interval : float
+        Seconds between reports.
+    sample_interval : float
+        Seconds between stack samples.
+    """
+
+    def __init__(
+        self,
+        modes=(),
+        directory="livetable-profiles",
+        interval=300.0,
+        sample_interval=0.02,
+    ):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._threads = []
+        self._stacks = Counter()
+        self._samples = 0
+        self._since = time.monotonic()
+        self._generation = 0
+        self._profiles = []
+        # Each thread's current cProfile profile, by thread id
+        self._current = {}
+        self._snapshot = None
+        self.configure(modes, directory, interval, sample_interval)
+
+    def configure(
+        self, modes, directory="livetable-profiles", interval=300.0, sample_interval=0.02
+    ):
+        """Set the options; call before ``start``."""
+        unknown = set(modes) - set(MODES)
+        if unknown:
+            raise ValueError(f"Unknown profile modes {sorted(unknown)}, use {MODES}")
+        self.modes = set(modes)
+        self.directory = directory
+        self.interval = interval
+        self.sample_interval = sample_interval
+        # Checked by the hot paths before anything else
+        self.cprofile = "cprofile" in self.modes
+
+    def start(self):
+        if not self.modes:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._since = time.monotonic()
+        if "memory" in self.modes and not tracemalloc.is_tracing():
+            tracemalloc.start(1)
+        if "sample" in self.modes:
+            self._start_thread(self._sample_loop, "livetable-sampler")
+        self._start_thread(self._report_loop, "livetable-profile-reports")
+        main_thread = threading.current_thread() is threading.main_thread()
+        if hasattr(signal, "SIGUSR1") and main_thread:
+            signal.signal(signal.SIGUSR1, lambda *_: self._wake.set())
+        atexit.register(self.stop)
+        print(f"Profiling ({', '.join(sorted(self.modes))}) into {self.directory}")
+
+    def _start_thread(self, target, name):
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self):
+        """Stop sampling and write a final report."""
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join()
+        with self._lock:
+            self._profiles.extend(self._current.values())
+            self._current.clear()
+        self.report()
+
+    # Sampling
+
+    def _sample_loop(self):
+        while not self._stopped.wait(self.sample_interval):
+            own = {thread.ident for thread in self._threads}
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, frame in frames.items():
+                    if ident in own:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        stack.append(frame.f_code)
+                        frame = frame.f_back
+                    stack.append(names.get(ident, str(ident)))
+                    self._stacks[tuple(reversed(stack))] += 1
+                self._samples += 1
+
+    # cProfile
+
+    def profiling(self):
+        """Whether this thread is inside ``call``."""
+        return getattr(self._local, "profile", None) is not None
+
+    def call(self, func, *args, **kwargs):
+        """
+        Run ``func`` under this thread's cProfile profile.
+
+        A thread's profile is only handed to the reports at its next call
+        after a report (or at exit), so it is never read while enabled.
+        """
+        profile, generation = getattr(self._local, "current", (None, None))
+        if generation != self._generation:
+            profile = cProfile.Profile()
+            with self._lock:
+                finished = self._current.pop(threading.get_ident(), None)
+                if finished is not None:
+                    self._profiles.append(finished)
+                self._current[threading.get_ident()] = profile
+            self._local.current = (profile, self._generation)
+        self._local.profile = profile
+        profile.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.disable()
+            self._local.profile = None
+
+    # Reports
+
+    def _report_loop(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.interval)
+            if self._stopped.is_set():
+                return
+            self._wake.clear()
+            try:
+                self.report()
+            except Exception as ex:
+                print(f"Exception occurred: {ex}")
+
+    def report(self):
+        """Write reports covering the time since the previous one."""
+        prefix = os.path.join(
+            self.directory,
+            f"livetable-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}",
+        )
+        with self._lock:
+            stacks, self._stacks = self._stacks, Counter()
+            samples, self._samples = self._samples, 0
+            profiles, self._profiles = self._profiles, []
+            self._generation += 1
+        now = time.monotonic()
+        elapsed, self._since = now - self._since, now
+        if "sample" in self.modes:
+            self._write_samples(prefix, stacks, samples, elapsed)
+        if "memory" in self.modes and tracemalloc.is_tracing():
+            self._write_memory(prefix)
+        if profiles:
+            stats = pstats.Stats(profiles[0])
+            for profile in profiles[1:]:
+                stats.add(profile)
+            stats.dump_stats(f"{prefix}-cprofile.pstats")
+        print(f"Profile written to {prefix}-*")
+
+    def _write_samples(self, prefix, stacks, samples, elapsed):
+        sections = Counter()
+        own = Counter()
+        total = Counter()
+        with open(f"{prefix}-samples.txt", "w") as f:
+            for stack, count in stacks.most_common():
+                thread, codes = stack[0], stack[1:]
+                labels = [_frame_label(code) for code in codes]
+                f.write(";".join([thread] + labels) + f" {count}\n")
+                places = {(os.path.basename(c.co_filename), c.co_name) for c in codes}
+                for section, place in SECTIONS.items():
+                    if place in places:
+                        sections[section] += count
+                if labels:
+                    own[labels[-1]] += count
+                for label in set(labels):
+                    total[label] += count
+        n = sum(stacks.values()) or 1
+        with open(f"{prefix}-summary.txt", "w") as f:
+            f.write(
+                f"{samples} samples of all threads in {elapsed:.1f} s, "
+                f"every {self.sample_interval * 1e3:.0f} ms\n\n"
+                "Thread samples in hot-path sections:\n"
+            )
+            for section in SECTIONS:
+                f.write(
+                    f"  {section:<12}{sections[section]:>8}"
+                    f"  {sections[section] / n:7.1%}\n"
+                )
+            f.write("\nFunctions by own samples (own, total):\n")
+            for label, count in own.most_common(30):
+                f.write(f"  {count:>8} {total[label]:>8}  {label}\n")
+
+    def _write_memory(self, prefix):
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            )
+        )
+        current, peak = tracemalloc.get_traced_memory()
+        with open(f"{prefix}-memory.txt", "w") as f:
+            f.write(
+                f"Traced memory: {current / 2**20:.1f} MiB, "
+                f"peak {peak / 2**20:.1f} MiB\n\nTop allocation sites:\n"
+            )
+            for stat in snapshot.statistics("lineno")[:30]:
+                f.write(f"  {stat}\n")
+            if self._snapshot is not None:
+                f.write("\nChange since the previous report:\n")
+                for stat in snapshot.compare_to(self._snapshot, "lineno")[:30]:
+                    f.write(f"  {stat}\n")
+        self._snapshot = snapshot
+
+
+profiler = Profiler()
+
+
+def add_profile_arguments(parser):
+    """Add the --profile options to an argparse parser."""
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="sample",
+        default=None,
+        metavar="MODES",
+        help=f"profile the running table; comma-separated modes from {MODES} "
+        "(default sample); SIGUSR1 writes a report",
+    )
+    parser.add_argument(
+        "--profile-dir",
+        default=None,
+        help="directory for profile reports (default ./livetable-profiles)",
+    )
+    parser.add_argument(
+        "--profile-interval",
+        type=float,
+        default=None,
+        help="seconds between profile reports (default 300)",
+    )
+
+
+def start_profiling(args=None):
+    """
+    Start the module's profiler from ``add_profile_arguments`` options,
+    falling back on LIVETABLE_PROFILE, LIVETABLE_PROFILE_DIR and
+    LIVETABLE_PROFILE_INTERVAL. Does nothing if no modes are given.
+    """
+    modes = getattr(args, "profile", None) or os.environ.get("LIVETABLE_PROFILE")
+    if not modes:
+        return profiler
+    directory = getattr(args, "profile_dir", None) or os.environ.get(
+        "LIVETABLE_PROFILE_DIR", "livetable-profiles"
+    )
+    interval = getattr(args, "profile_interval", None) or float(
+        os.environ.get("LIVETABLE_PROFILE_INTERVAL", 300)
+    )
+    profiler.configure(
+        [mode.strip() for mode in modes.split(",") if mode.strip()],
+        directory=directory,
+        interval=interval,
+    )
+    profiler.start()
+    return profiler
@@ -0,0 +1,166 @@
+import pickle
+import time
+
+import zmq
+from bluesky.run_engine import Dispatcher
+from event_model import DocumentNames
+from qtpy.QtCore import QObject, QSocketNotifier, QTimer
+
+from .pipelineMetrics import metrics
+
+
+def normalize_address(address):
+    """``host:port``, ``(host, port)`` or a full 0MQ endpoint, as an endpoint."""
+    if isinstance(address, (tuple, list)):
+        host, port = address
+        return f"tcp://{host}:{port}"
+    if "://" in address:
+        return address
+    return f"tcp://{address}"
+
+
+def normalize_addresses(addresses):
+    """One address, a comma separated string of them or a list, as endpoints."""
+    if isinstance(addresses, str):
+        addresses = [a.strip() for a in addresses.split(",") if a.strip()]
+    elif isinstance(addresses, tuple) and len(addresses) == 2 and isinstance(
+        addresses[1], int
+    ):
+        addresses = [addresses]
+    return [normalize_address(address) for address in addresses]
+
+
+class QtZmqDispatcher(QObject):
+    """
+    Dispatch documents from one or more 0MQ proxies on the Qt event loop.
+
+    Each endpoint gets its own SUB socket, watched by a QSocketNotifier on the
+    socket's file descriptor, so documents are received and dispatched in the
+    GUI thread when they arrive, without a polling thread. Documents of all
+    endpoints go to the same callbacks.
+
+    Parameters
+    ----------
+    addresses : str or list
+        Proxy output address(es), as ``host:port``, ``(host, port)`` or
+        0MQ endpoints; a string may list several, separated by commas.
+    prefix : bytes, optional
+        Only documents published with this prefix are received; the
+        proxy drops the others.
+    deserializer : callable
+    rcvhwm : int, optional
+        Receive high-water mark of each socket, in documents. When a slow
+        viewer falls that far behind, 0MQ drops new documents before they
+        reach Python. None keeps the 0MQ default (1000).
+    conflate : bool
+        Keep only the newest document of each socket. Starts and
+        descriptors are dropped as readily as events, so this only suits a
+        viewer of the latest readings.
+    max_messages : int
+        Documents dispatched per pass of the event loop, so a burst does
+        not block the GUI; the rest follow on the next pass.
+    parent : QObject, optional
+    """
+
+    def __init__(
+        self,
+        addresses="localhost:5578",
+        *,
+        prefix=b"",
+        deserializer=pickle.loads,
+        rcvhwm=None,
+        conflate=False,
+        max_messages=100,
+        parent=None,
+    ):
+        super().__init__(parent)
+        if isinstance(prefix, str):
+            raise ValueError("prefix must be bytes, not string")
+        if b" " in prefix:
+            raise ValueError(f"prefix {prefix!r} may not contain b' '")
+        self.addresses = normalize_addresses(addresses)
+        if not self.addresses:
+            raise ValueError("No 0MQ address given")
+        self._prefix = prefix
+        self._deserializer = deserializer
+        self.rcvhwm = rcvhwm
+        self.conflate = conflate
+        self.max_messages = max_messages
+        self._dispatcher = Dispatcher()
+        self.subscribe = self._dispatcher.subscribe
+        self.unsubscribe = self._dispatcher.unsubscribe
+        # (socket, QSocketNotifier) of each endpoint
+        self._sockets = []
+        self.closed = False
+
+    def start(self):
+        if self._sockets:
+            return
+        self.closed = False
+        context = zmq.Context.instance()
+        for address in self.addresses:
+            socket = context.socket(zmq.SUB)
+            # Options only apply to connections made after they are set
+            if self.rcvhwm is not None:
+                socket.setsockopt(zmq.RCVHWM, int(self.rcvhwm))
+            if self.conflate:
+                socket.setsockopt(zmq.CONFLATE, 1)
+            # Publishers send b"<prefix> <name> <doc>"
+            socket.setsockopt(zmq.SUBSCRIBE, self._prefix + b" ")
+            socket.connect(address)
+            notifier = QSocketNotifier(
+                socket.getsockopt(zmq.FD), QSocketNotifier.Read, self
+            )
+            entry = (socket, notifier)
+            notifier.activated.connect(lambda *_, entry=entry: self._drain(entry))
+            self._sockets.append(entry)
+            # The descriptor is edge-triggered: read what arrived before the
+            # notifier was watching
+            QTimer.singleShot(0, lambda entry=entry: self._drain(entry))
+
+    def _drain(self, entry):
+        socket, notifier = entry
+        if self.closed:
+            return
+        notifier.setEnabled(False)
+        try:
+            for _ in range(self.max_messages):
+                # Reading EVENTS also re-arms the descriptor once the socket
+                # is empty, so the next arrival activates the notifier again
+                if not socket.getsockopt(zmq.EVENTS) & zmq.POLLIN:
+                    return
+                try:
+                    message = socket.recv(zmq.NOBLOCK)
+                except zmq.Again:
+                    return
+                self._handle(message)
+            QTimer.singleShot(0, lambda: self._drain(entry))
+        except zmq.ZMQError as ex:
+            print(f"Exception occurred: {ex}")
+        finally:
+            if not self.closed:
+                notifier.setEnabled(True)
+
+    def _handle(self, message):
+        received = None
+        if metrics.enabled:
+            received = time.time()
+            metrics.add_bytes(len(message))
+        try:
+            _, name, doc = message.split(b" ", 2)
+            name = DocumentNames[name.decode()]
+            doc = self._deserializer(doc)
+        except Exception as ex:
+            print(f"Exception occurred: {ex}")
+            return
+        if received is not None:
+            metrics.receipt(doc, received)
+        self._dispatcher.process(name, doc)
+
+    def stop(self):
+        self.closed = True
+        for socket, notifier in self._sockets:
+            notifier.setEnabled(False)
+            notifier.deleteLater()
+            socket.close(linger=0)
+        self._sockets = []
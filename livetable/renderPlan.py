@@ -0,0 +1,268 @@
+"""
+Compiled render plans for the live table and baseline output.
+
+A plan holds everything needed to format the rows of one descriptor: the
+ordered columns, their widths and precisions, the header and border strings
+and a single format template for a whole row (plus a printf-style twin used
+for event pages). Plans are compiled
+once and kept in a small LRU cache keyed by a hash of the descriptor's
+``data_keys``, ``hints`` and ``object_keys``, so descriptors that repeat from
+run to run reuse the same compiled formatter.
+"""
+
+from collections import OrderedDict, namedtuple
+import json
+import threading
+import warnings
+
+from bluesky.callbacks.core import LiveTable
+
+TablePlan = namedtuple(
+    "TablePlan",
+    [
+        "fields",  # data keys in column order, excluding seq_num and time
+        "format_info",  # OrderedDict of LiveTable format styles
+        "sep_format",
+        "main_fmnt",
+        "header",
+        "data_formats",  # OrderedDict of per-column LiveTable formats
+        "row_template",  # positional template: seq_num, time, *fields
+        "page_template",  # printf-style template with the same columns
+    ],
+)
+
+BaselinePlan = namedtuple("BaselinePlan", ["columns", "border", "row_template"])
+
+
+def hinted_fields(descriptor):
+    # Figure out which columns to put in the table.
+    obj_names = list(descriptor["object_keys"])
+    # We will see if these objects hint at whether
+    # a subset of their data keys ('fields') are interesting. If they
+    # did, we'll use those. If these didn't, we know that the RunEngine
+    # *always* records their complete list of fields, so we can use
+    # them all unselectively.
+    columns = []
+    for obj_name in obj_names:
+        try:
+            fields = descriptor.get("hints", {}).get(obj_name, {})["fields"]
+        except KeyError:
+            fields = descriptor["object_keys"][obj_name]
+        columns.extend(fields)
+    return columns
+
+
+class PlanCache:
+    """
+    Least-recently-used cache of compiled plans.
+
+    The module level caches are shared by every callback, which may run in
+    different threads, so lookups are locked. Plans are built outside the
+    lock; if two threads miss the same key at once, the first plan stored
+    is kept.
+
+    Parameters
+    ----------
+    maxsize : int
+        Number of plans kept.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._plans = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, build):
+        """Return the plan for ``key``, calling ``build()`` on a miss."""
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self.hits += 1
+                self._plans.move_to_end(key)
+                return plan
+            self.misses += 1
+        plan = build()
+        with self._lock:
+            plan = self._plans.setdefault(key, plan)
+            self._plans.move_to_end(key)
+            if len(self._plans) > self.maxsize:
+                self._plans.popitem(last=False)
+        return plan
+
+    def __len__(self):
+        return len(self._plans)
+
+    def clear(self):
+        with self._lock:
+            self._plans.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+plan_cache = PlanCache()
+
+# Descriptors never change once issued, so their hash can be cached by uid
+_descriptor_keys = PlanCache(maxsize=1024)
+
+
+def descriptor_key(descriptor):
+    """Hash of the parts of a descriptor that determine how it is rendered."""
+    uid = descriptor.get("uid")
+    if uid is None:
+        return _descriptor_hash(descriptor)
+    return _descriptor_keys.get(uid, lambda: _descriptor_hash(descriptor))
+
+
+def _descriptor_hash(descriptor):
+    return hash(
+        json.dumps(
+            [
+                descriptor.get("data_keys", {}),
+                descriptor.get("hints", {}),
+                descriptor.get("object_keys", {}),
+            ],
+            sort_keys=True,
+            default=repr,
+        )
+    )
+
+
+def compile_table_plan(data_keys, fields, min_width=12, default_prec=3, extra_pad=1):
+    """
+    Compile the table layout LiveTable would derive for these data keys.
+
+    Parameters
+    ----------
+    data_keys : dict
+        ``data_keys`` of the event descriptor.
+    fields : list of str
+        Requested columns, in order. Fields missing from ``data_keys`` or of
+        an unsupported dtype are skipped.
+    min_width, default_prec, extra_pad : int
+        As for LiveTable.
+
+    Returns
+    -------
+    TablePlan
+    """
+
+    def patch_up_precision(p):
+        try:
+            return int(p)
+        except (TypeError, ValueError):
+            return default_prec
+
+    fm_sty = LiveTable._fm_sty
+    pad = " " * extra_pad
+    format_info = OrderedDict(
+        [
+            ("seq_num", fm_sty(10 + extra_pad, "", "d")),
+            (LiveTable.ev_time_key, fm_sty(10 + 2 * extra_pad, 10, "s")),
+        ]
+    )
+    for k in fields:
+        width = max(min_width, len(k) + 2, default_prec + 1 + 2 * extra_pad)
+        try:
+            dk_entry = data_keys[k]
+        except KeyError:
+            # this descriptor does not know about this key
+            continue
+        if dk_entry["dtype"] not in LiveTable._FMT_MAP:
+            warnings.warn(  # noqa: B028
+                f"The key {k} will be skipped because LiveTable "
+                f"does not know how to display the dtype {dk_entry['dtype']}"
+            )
+            continue
+        if dk_entry["dtype"] == "boolean":
+            prec = 5  # 5 is the length of the string "False"
+        elif dk_entry["dtype"] == "string":
+            prec = width - 1 - 2 * extra_pad
+        else:
+            prec = patch_up_precision(dk_entry.get("precision", default_prec))
+        format_info[k] = fm_sty(
+            width=width, prec=prec, dtype=LiveTable._FMT_MAP[dk_entry["dtype"]]
+        )
+
+    sep_format = "+" + "+".join("-" * f.width for f in format_info.values()) + "+"
+    main_fmnt = "|".join(
+        "{{: >{w}}}{pad}".format(w=f.width - extra_pad, pad=pad)
+        for f in format_info.values()
+    )
+    headings = [k if k != LiveTable.ev_time_key else "time" for k in format_info]
+    header = "|" + main_fmnt.format(*headings) + "|"
+
+    def column_format(k, f):
+        return LiveTable._FMTLOOKUP[f.dtype].format(
+            k=k, width=f.width - 2 * extra_pad, prec=f.prec, dtype=f.dtype, pad=pad
+        )
+
+    data_formats = OrderedDict(
+        (k, column_format(f"h{str(hash(k))}", f)) for k, f in format_info.items()
+    )
+    row_template = (
+        "|"
+        + "|".join(column_format(i, f) for i, f in enumerate(format_info.values()))
+        + "|"
+    )
+
+    def percent_format(f):
+        width = f.width - 2 * extra_pad
+        if f.dtype == "d":
+            return f"{pad}%{width}d{pad}"
+        return f"{pad}%{width}.{f.prec}{f.dtype}{pad}"
+
+    page_template = (
+        "|" + "|".join(percent_format(f) for f in format_info.values()) + "|"
+    )
+    return TablePlan(
+        fields=list(format_info)[2:],
+        format_info=format_info,
+        sep_format=sep_format,
+        main_fmnt=main_fmnt,
+        header=header,
+        data_formats=data_formats,
+        row_template=row_template,
+        page_template=page_template,
+    )
+
+
+def get_table_plan(descriptor, fields, min_width=12, default_prec=3, extra_pad=1):
+    """Return the cached TablePlan for a descriptor, compiling it on a miss."""
+    key = (
+        "table",
+        descriptor_key(descriptor),
+        tuple(fields),
+        min_width,
+        default_prec,
+        extra_pad,
+    )
+    return plan_cache.get(
+        key,
+        lambda: compile_table_plan(
+            descriptor["data_keys"], fields, min_width, default_prec, extra_pad
+        ),
+    )
+
+
+def compile_baseline_plan(descriptor, width=30):
+    """
+    Compile the two-column layout used for baseline readings.
+
+    Returns
+    -------
+    BaselinePlan
+    """
+    border = "+" + "-" * (width + 2) + "+" + "-" * (width + 2) + "+"
+    return BaselinePlan(
+        columns=frozenset(hinted_fields(descriptor)),
+        border=border,
+        row_template=f"| {{:>{width}}} | {{:<{width}}} |",
+    )
+
+
+def get_baseline_plan(descriptor):
+    """Return the cached BaselinePlan for a descriptor, compiling it on a miss."""
+    key = ("baseline", descriptor_key(descriptor))
+    return plan_cache.get(key, lambda: compile_baseline_plan(descriptor))
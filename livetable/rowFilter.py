@@ -0,0 +1,350 @@
+"""
+Row filters over columnar event data.
+
+A filter is a boolean expression of comparisons between fields and
+literals::
+
+    I0 > 1e5 and en_energy between 280 and 290
+    not (det1 == 0 or det2 == 0)
+    status != "idle" and seq_num >= 100
+
+Operators are ``< <= > >= == != =`` and ``between A and B`` (inclusive),
+combined with ``and``, ``or``, ``not`` and parentheses. Field names are
+data keys of the stream, ``seq_num`` or ``time``; names that are not plain
+identifiers can be written in backquotes. String literals take single or
+double quotes.
+
+``parse_filter`` compiles an expression once; the RowFilter then evaluates
+it for a block of rows with one vectorized NumPy operation per comparison.
+FilterIndex keeps the matching rows of a growing ColumnStore and evaluates
+only rows appended since its last update, so a filter on a live run costs
+time proportional to the new rows, not to the run.
+"""
+
+import operator
+import re
+
+import numpy as np
+
+_COMPARISONS = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "==": operator.eq,
+    "=": operator.eq,
+    "!=": operator.ne,
+}
+
+_KEYWORDS = ("and", "or", "not", "between", "true", "false")
+
+_TOKEN = re.compile(
+    r"""\s*(?:
+        (?P<number>[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)
+      | (?P<string>"[^"]*"|'[^']*')
+      | (?P<quoted>`[^`]+`)
+      | (?P<name>[A-Za-z_][\w.:]*)
+      | (?P<op><=|>=|==|!=|<|>|=)
+      | (?P<paren>[()])
+    )""",
+    re.VERBOSE,
+)
+
+
+def _tokenize(text):
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = _TOKEN.match(text, pos)
+        if match is None:
+            raise ValueError(f"Unexpected {text[pos:].strip()[:10]!r} in filter")
+        pos = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "number":
+            value = float(value) if re.search(r"[.eE]", value) else int(value)
+        elif kind == "string":
+            value = value[1:-1]
+        elif kind == "quoted":
+            kind, value = "name", value[1:-1]
+        elif kind == "name" and value.lower() in _KEYWORDS:
+            kind, value = "keyword", value.lower()
+        tokens.append((kind, value))
+    return tokens
+
+
+class _Parser:
+    # Recursive descent over the tokens, building nested tuples:
+    # ("or", a, b), ("and", a, b), ("not", a), ("cmp", op, left, right)
+    # and ("between", operand, low, high); operands are ("field", name)
+    # or ("value", literal).
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return (None, None)
+
+    def take(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def expect_keyword(self, word):
+        if self.take() != ("keyword", word):
+            raise ValueError(f"Expected {word!r} in filter")
+
+    def parse(self):
+        if not self.tokens:
+            raise ValueError("Empty filter")
+        node = self.expression()
+        if self.pos < len(self.tokens):
+            raise ValueError(f"Unexpected {self.peek()[1]!r} in filter")
+        return node
+
+    def expression(self):
+        node = self.conjunction()
+        while self.peek() == ("keyword", "or"):
+            self.take()
+            node = ("or", node, self.conjunction())
+        return node
+
+    def conjunction(self):
+        node = self.negation()
+        while self.peek() == ("keyword", "and"):
+            self.take()
+            node = ("and", node, self.negation())
+        return node
+
+    def negation(self):
+        if self.peek() == ("keyword", "not"):
+            self.take()
+            return ("not", self.negation())
+        if self.peek() == ("paren", "("):
+            self.take()
+            node = self.expression()
+            if self.take() != ("paren", ")"):
+                raise ValueError("Missing ')' in filter")
+            return node
+        return self.comparison()
+
+    def operand(self):
+        kind, value = self.take()
+        if kind == "name":
+            return ("field", value)
+        if kind in ("number", "string"):
+            return ("value", value)
+        if kind == "keyword" and value in ("true", "false"):
+            return ("value", value == "true")
+        raise ValueError(f"Expected a field or value, got {value!r}")
+
+    def comparison(self):
+        left = self.operand()
+        kind, value = self.take()
+        if (kind, value) == ("keyword", "between"):
+            low = self.operand()
+            self.expect_keyword("and")
+            return ("between", left, low, self.operand())
+        if kind != "op":
+            raise ValueError(f"Expected a comparison after {left[1]!r}")
+        return ("cmp", value, left, self.operand())
+
+
+def _fields(node):
+    if node[0] == "field":
+        return {node[1]}
+    if node[0] == "value":
+        return set()
+    return set().union(*(_fields(n) for n in node[1:] if isinstance(n, tuple)))
+
+
+class RowFilter:
+    """
+    A compiled filter expression; see the module docstring for the syntax.
+
+    Parameters
+    ----------
+    text : str
+
+    Raises
+    ------
+    ValueError
+        If the expression cannot be parsed.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self._tree = _Parser(_tokenize(text)).parse()
+        self.fields = sorted(_fields(self._tree))
+
+    def __repr__(self):
+        return f"RowFilter({self.text!r})"
+
+    def evaluate(self, columns, nrows):
+        """
+        Evaluate the filter for a block of rows.
+
+        Parameters
+        ----------
+        columns : dict
+            Map of every name in ``fields`` to an array of ``nrows`` values.
+        nrows : int
+
+        Returns
+        -------
+        numpy.ndarray of bool
+
+        Raises
+        ------
+        ValueError
+            If a field is missing or a comparison does not apply to its
+            values.
+        """
+        missing = [f for f in self.fields if f not in columns]
+        if missing:
+            raise ValueError(f"Unknown field(s) {', '.join(missing)}")
+        with np.errstate(invalid="ignore"):
+            return self._eval(self._tree, columns, nrows)
+
+    def _operand(self, node, columns):
+        if node[0] == "field":
+            return columns[node[1]]
+        return node[1]
+
+    def _compare(self, op, left, right, nrows):
+        try:
+            result = np.asarray(op(left, right))
+        except TypeError as ex:
+            raise ValueError(f"Cannot compare: {ex}") from None
+        if result.dtype != np.bool_:
+            result = result.astype(bool)
+        if result.shape != (nrows,):
+            # Comparisons NumPy cannot broadcast (e.g. str with float)
+            result = np.broadcast_to(result, (nrows,))
+        return result
+
+    def _eval(self, node, columns, nrows):
+        kind = node[0]
+        if kind == "or":
+            return self._eval(node[1], columns, nrows) | self._eval(
+                node[2], columns, nrows
+            )
+        if kind == "and":
+            left = self._eval(node[1], columns, nrows)
+            if not left.any():
+                return left
+            return left & self._eval(node[2], columns, nrows)
+        if kind == "not":
+            return ~self._eval(node[1], columns, nrows)
+        if kind == "between":
+            value = self._operand(node[1], columns)
+            low = self._operand(node[2], columns)
+            high = self._operand(node[3], columns)
+            return self._compare(operator.ge, value, low, nrows) & self._compare(
+                operator.le, value, high, nrows
+            )
+        _, op, left, right = node
+        return self._compare(
+            _COMPARISONS[op],
+            self._operand(left, columns),
+            self._operand(right, columns),
+            nrows,
+        )
+
+
+def parse_filter(text):
+    """Compile a filter expression, or return None for blank text."""
+    if not text or not text.strip():
+        return None
+    return RowFilter(text)
+
+
+class FilterIndex:
+    """
+    Incrementally maintained rows of a ColumnStore that match a RowFilter.
+
+    ``update`` evaluates the rows appended since the previous call, and
+    forgets matches overwritten by the store's ring buffer. Matches are
+    kept as absolute row numbers (counting every row ever appended), so they
+    stay valid while the ring moves.
+
+    Parameters
+    ----------
+    store : ColumnStore
+    row_filter : RowFilter
+    block_size : int
+        Rows evaluated per vectorized step, bounding temporary memory.
+    """
+
+    def __init__(self, store, row_filter, block_size=1 << 18):
+        names = set(store.fields) | {"seq_num", "time"}
+        missing = [f for f in row_filter.fields if f not in names]
+        if missing:
+            raise ValueError(f"Unknown field(s) {', '.join(missing)}")
+        self.store = store
+        self.filter = row_filter
+        self.block_size = block_size
+        self._matches = np.empty(1024, dtype=np.int64)
+        self._first = 0
+        self._len = 0
+        # Absolute number of rows evaluated so far, and of the oldest row
+        # held by the store at the last update
+        self._evaluated = 0
+        self._oldest = 0
+        self.update()
+
+    def __len__(self):
+        return self._len - self._first
+
+    def _append(self, rows):
+        needed = self._len + len(rows)
+        if needed > len(self._matches):
+            # Drop forgotten matches before growing
+            kept = self._matches[self._first : self._len]
+            capacity = len(self._matches)
+            while capacity < len(kept) + len(rows):
+                capacity *= 2
+            self._matches = np.empty(capacity, dtype=np.int64)
+            self._matches[: len(kept)] = kept
+            self._first, self._len = 0, len(kept)
+            needed = self._len + len(rows)
+        self._matches[self._len : needed] = rows
+        self._len = needed
+
+    def update(self):
+        """
+        Catch up with rows appended to the store.
+
+        Returns
+        -------
+        tuple of int
+            (matches forgotten because their rows were overwritten,
+            matches added).
+        """
+        store = self.store
+        total = store.total_rows
+        oldest = total - len(store)
+        first = self._first
+        self._first = first + int(
+            np.searchsorted(self._matches[first : self._len], oldest)
+        )
+        forgotten = self._first - first
+        start = max(self._evaluated, oldest)
+        before = len(self)
+        for block in range(start, total, self.block_size):
+            stop = min(block + self.block_size, total)
+            rows = np.arange(block - oldest, stop - oldest)
+            columns = {name: store.take(name, rows) for name in self.filter.fields}
+            mask = self.filter.evaluate(columns, len(rows))
+            self._append(np.flatnonzero(mask) + block)
+        self._evaluated = total
+        self._oldest = oldest
+        return forgotten, len(self) - before
+
+    def rows(self):
+        """Logical row numbers of the matches, as of the last update."""
+        return self._matches[self._first : self._len] - self._oldest
@@ -0,0 +1,292 @@
+"""
+Per-run history of the documents shown by a live table.
+
+QtReConsoleMonitor only keeps its last ``_max_lines`` lines, so the tables of
+earlier runs scroll away. RunHistory keeps every run's documents instead, in
+a compact form: frames of msgpack (see documentRecorder) while the run is
+open, compressed with zlib once it stops. A past run's table is rendered on
+demand by replaying its documents through a fresh LessEffortCallback, and
+only the most recently rendered runs are kept as text, in an LRU cache with
+a memory budget.
+
+Memory
+------
+Stored runs are bounded by ``max_bytes`` of compressed documents; the oldest
+runs are forgotten beyond it. A typical scan compresses to a few hundred
+bytes per event page, so the default budget holds a whole shift. The open
+run counts towards the same budget, uncompressed: once it alone exceeds
+what the older runs leave, its oldest events are trimmed, keeping the start,
+descriptors and resources, so a run that never stops cannot grow without
+bound. Rendered text is bounded by ``cache_bytes``.
+"""
+
+from collections import OrderedDict, deque
+import threading
+import zlib
+
+from .documentRecorder import pack_frame, unpack_frames
+
+
+class RecordedRun:
+    """
+    Documents of one run.
+
+    Attributes
+    ----------
+    uid : str
+    start_doc, stop_doc : dict
+    trimmed : int
+        Events dropped to keep the open run within its budget.
+    """
+
+    def __init__(self, start_doc):
+        self.uid = start_doc["uid"]
+        self.start_doc = start_doc
+        self.stop_doc = None
+        self.events = 0
+        self.trimmed = 0
+        # Frames of an open run as (event count, frame); frames moved out of
+        # the way while trimming, all of them before the remaining ones, are
+        # kept in order in _head. Once the run stops, the compressed frames.
+        self._frames = deque()
+        self._head = []
+        self._nbytes = 0
+        self._compressed = None
+
+    @property
+    def closed(self):
+        return self._compressed is not None
+
+    @property
+    def nbytes(self):
+        """Bytes held by the stored documents."""
+        if self._compressed is not None:
+            return len(self._compressed)
+        return self._nbytes
+
+    def add(self, name, doc, events=0):
+        """Store a document; ``events`` is the number of events it holds."""
+        frame = pack_frame([name, doc])
+        self._frames.append((events, frame))
+        self._nbytes += len(frame)
+
+    def trim(self, max_bytes):
+        """Drop the oldest events until the open run fits in ``max_bytes``."""
+        frames = self._frames
+        while self._nbytes > max_bytes and frames:
+            events, frame = frames.popleft()
+            if events:
+                self._nbytes -= len(frame)
+                self.trimmed += events
+            else:
+                self._head.append((events, frame))
+
+    def _joined(self):
+        return b"".join(frame for _, frame in (*self._head, *self._frames))
+
+    def close(self, stop_doc=None):
+        self.stop_doc = stop_doc
+        self._compressed = zlib.compress(self._joined())
+        self._frames = self._head = None
+
+    def payload(self):
+        """The stored frames as they are now, and whether they are compressed."""
+        if self._compressed is not None:
+            return self._compressed, True
+        return self._joined(), False
+
+    def summary(self):
+        """Start time, scan id, plan name, event count and exit status."""
+        return {
+            "uid": self.uid,
+            "time": self.start_doc.get("time"),
+            "scan_id": self.start_doc.get("scan_id"),
+            "plan_name": self.start_doc.get("plan_name"),
+            "events": self.events,
+            "exit_status": (self.stop_doc or {}).get("exit_status"),
+            "trimmed": self.trimmed,
+            "nbytes": self.nbytes,
+        }
+
+
+class RunHistory:
+    """
+    Compact store of past runs with an LRU cache of their rendered tables.
+
+    Subscribe it to a dispatcher, or give it to LessEffortCallback as
+    ``history``; it may be fed from one thread and read from another.
+
+    Parameters
+    ----------
+    max_bytes : int
+        Budget for stored documents; the oldest runs are dropped beyond it,
+        then the oldest events of the open run.
+    cache_bytes : int
+        Budget for rendered text; the least recently viewed runs are
+        dropped beyond it.
+    """
+
+    def __init__(self, max_bytes=256 * 2**20, cache_bytes=32 * 2**20):
+        self.max_bytes = max_bytes
+        self.cache_bytes = cache_bytes
+        self._lock = threading.Lock()
+        self._runs = OrderedDict()
+        # Bytes of the closed runs; the open run is counted separately
+        self._closed_bytes = 0
+        self._descriptor_runs = {}
+        self._resource_runs = {}
+        self._rendered = OrderedDict()
+        self._rendered_bytes = 0
+        # Incremented on every change of the run list, for views to poll
+        self.generation = 0
+
+    def __call__(self, name, doc):
+        name = getattr(name, "name", name)
+        with self._lock:
+            if name == "start":
+                # A run interrupted without a stop document
+                for run in list(self._runs.values()):
+                    if not run.closed:
+                        self._close(run)
+                run = RecordedRun(doc)
+                self._runs[run.uid] = run
+                self.generation += 1
+            elif name in ("descriptor", "stop", "resource"):
+                run = self._runs.get(doc.get("run_start"))
+            elif name in ("event", "event_page"):
+                run = self._descriptor_runs.get(doc["descriptor"])
+            elif name in ("datum", "datum_page"):
+                run = self._resource_runs.get(doc["resource"])
+            else:
+                run = None
+            if run is None or run.closed:
+                return
+            if name == "event":
+                events = 1
+            elif name == "event_page":
+                events = len(doc["seq_num"])
+            else:
+                events = 0
+            run.add(name, doc, events)
+            run.events += events
+            if name == "descriptor":
+                self._descriptor_runs[doc["uid"]] = run
+            elif name == "resource":
+                self._resource_runs[doc["uid"]] = run
+            elif name == "stop":
+                self._close(run, doc)
+            elif self._closed_bytes + run.nbytes > self.max_bytes:
+                self._evict(keep=run.nbytes)
+                run.trim(self.max_bytes - self._closed_bytes)
+
+    def _close(self, run, stop_doc=None):
+        run.close(stop_doc)
+        self._closed_bytes += run.nbytes
+        self._descriptor_runs = {
+            uid: r for uid, r in self._descriptor_runs.items() if r is not run
+        }
+        self._resource_runs = {
+            uid: r for uid, r in self._resource_runs.items() if r is not run
+        }
+        self.generation += 1
+        self._evict()
+
+    def _evict(self, keep=0):
+        """Drop the oldest closed runs beyond the budget, leaving ``keep`` bytes."""
+        while self._closed_bytes + keep > self.max_bytes and len(self._runs) > 1:
+            oldest = next(iter(self._runs.values()))
+            if not oldest.closed:
+                break
+            self._runs.popitem(last=False)
+            self._closed_bytes -= oldest.nbytes
+            self._forget_rendered(oldest.uid)
+            self.generation += 1
+
+    def runs(self):
+        """Summaries of the stored runs, oldest first."""
+        with self._lock:
+            return [run.summary() for run in self._runs.values()]
+
+    @property
+    def nbytes(self):
+        with self._lock:
+            return sum(run.nbytes for run in self._runs.values())
+
+    @property
+    def rendered_bytes(self):
+        return self._rendered_bytes
+
+    def documents(self, uid):
+        """
+        The ``(name, doc)`` of a stored run.
+
+        Raises
+        ------
+        KeyError
+            If the run is not stored (any more).
+        """
+        with self._lock:
+            payload, compressed = self._runs[uid].payload()
+        # Decoded outside the lock, so the feeding thread is not held up
+        if compressed:
+            payload = zlib.decompress(payload)
+        return [(name, doc) for _, (name, doc) in unpack_frames(payload)]
+
+    def render(self, uid):
+        """
+        The table of a stored run as text, as LessEffortCallback shows it,
+        without the statistics footer.
+
+        The text of finished runs is cached.
+        """
+        with self._lock:
+            text = self._rendered.get(uid)
+            if text is not None:
+                self._rendered.move_to_end(uid)
+                return text
+            closed = self._runs[uid].closed if uid in self._runs else False
+
+        from .lessEffortCallback import LessEffortCallback
+
+        lines = []
+        callback = LessEffortCallback(out=lines.append, stats_enabled=False)
+        for name, doc in self.documents(uid):
+            callback(name, doc)
+        text = "\n".join(line.rstrip("\n") for line in lines).strip("\n")
+        if closed:
+            with self._lock:
+                self._cache(uid, text)
+        return text
+
+    def _cache(self, uid, text):
+        if uid not in self._runs or len(text) > self.cache_bytes:
+            return
+        self._forget_rendered(uid)
+        self._rendered[uid] = text
+        self._rendered_bytes += len(text)
+        while self._rendered_bytes > self.cache_bytes:
+            _, evicted = self._rendered.popitem(last=False)
+            self._rendered_bytes -= len(evicted)
+
+    def _forget_rendered(self, uid):
+        text = self._rendered.pop(uid, None)
+        if text is not None:
+            self._rendered_bytes -= len(text)
+
+    def set_cache_bytes(self, cache_bytes):
+        """Change the rendered text budget, evicting as needed."""
+        with self._lock:
+            self.cache_bytes = cache_bytes
+            while self._rendered and self._rendered_bytes > cache_bytes:
+                _, evicted = self._rendered.popitem(last=False)
+                self._rendered_bytes -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._runs.clear()
+            self._closed_bytes = 0
+            self._descriptor_runs.clear()
+            self._resource_runs.clear()
+            self._rendered.clear()
+            self._rendered_bytes = 0
+            self.generation += 1
@@ -0,0 +1,142 @@
+from qtpy.QtCore import Qt, QTimer
+from qtpy.QtGui import QFont, QPalette
+from qtpy.QtWidgets import (
+    QLabel,
+    QListWidget,
+    QListWidgetItem,
+    QPlainTextEdit,
+    QSplitter,
+    QStackedWidget,
+    QVBoxLayout,
+    QWidget,
+)
+from bluesky_widgets.qt.threading import FunctionWorker
+from datetime import datetime
+
+
+def _run_label(run):
+    started = datetime.fromtimestamp(run["time"] or 0).strftime("%H:%M:%S")
+    label = f"{started}  scan {run['scan_id']}  {run['plan_name'] or ''}"
+    if run["trimmed"]:
+        label += f"  ({run['events']} events, oldest {run['trimmed']} trimmed)"
+    else:
+        label += f"  ({run['events']} events)"
+    status = run["exit_status"]
+    if status is None:
+        label += "  running"
+    elif status != "success":
+        label += f"  {status}"
+    return label
+
+
+class QtRunHistory(QWidget):
+    """
+    Run list next to the live view, showing past runs on demand.
+
+    The first entry shows ``live_widget``; selecting a past run renders its
+    table from the RunHistory in a worker thread and shows the text in a
+    separate read-only view, so the live widget keeps only its own lines.
+
+    Parameters
+    ----------
+    history : RunHistory
+    live_widget : QWidget
+        The live view, e.g. a QtReConsoleMonitor.
+    parent : QWidget, optional
+    """
+
+    def __init__(self, history, live_widget, parent=None):
+        super().__init__(parent)
+        self.history = history
+        self._generation = None
+        self._selected = None
+        self._worker = None
+
+        self._run_list = QListWidget()
+        self._run_list.currentItemChanged.connect(self._run_selected)
+        self._lb_memory = QLabel("")
+
+        self._text_edit = QPlainTextEdit()
+        self._text_edit.setReadOnly(True)
+        self._text_edit.setLineWrapMode(QPlainTextEdit.NoWrap)
+        p = self._text_edit.palette()
+        p.setColor(QPalette.Base, p.color(QPalette.Disabled, QPalette.Base))
+        self._text_edit.setPalette(p)
+        font = QFont("Monospace")
+        font.setStyleHint(QFont.Monospace)
+        self._text_edit.setFont(font)
+
+        self._views = QStackedWidget()
+        self._views.addWidget(live_widget)
+        self._views.addWidget(self._text_edit)
+
+        runs = QWidget()
+        vbox = QVBoxLayout()
+        vbox.setContentsMargins(0, 0, 0, 0)
+        vbox.addWidget(self._run_list)
+        vbox.addWidget(self._lb_memory)
+        runs.setLayout(vbox)
+
+        splitter = QSplitter(Qt.Horizontal)
+        splitter.addWidget(runs)
+        splitter.addWidget(self._views)
+        splitter.setStretchFactor(1, 1)
+        splitter.setSizes([220, 800])
+
+        vbox = QVBoxLayout()
+        vbox.setContentsMargins(0, 0, 0, 0)
+        vbox.addWidget(splitter)
+        self.setLayout(vbox)
+
+        self._refresh()
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self._refresh)
+        self._timer.start(1000)
+
+    def _refresh(self):
+        """Rebuild the run list when runs have started or stopped."""
+        self._lb_memory.setText(
+            f"Stored {self.history.nbytes / 2**20:.1f} MiB, "
+            f"rendered {self.history.rendered_bytes / 2**20:.1f} MiB"
+        )
+        if self.history.generation == self._generation:
+            return
+        self._generation = self.history.generation
+        self._run_list.blockSignals(True)
+        self._run_list.clear()
+        live = QListWidgetItem("Live")
+        self._run_list.addItem(live)
+        current = live
+        for run in reversed(self.history.runs()):
+            item = QListWidgetItem(_run_label(run))
+            item.setData(Qt.UserRole, run["uid"])
+            self._run_list.addItem(item)
+            if run["uid"] == self._selected:
+                current = item
+        self._run_list.setCurrentItem(current)
+        self._run_list.blockSignals(False)
+        if current is live and self._selected is not None:
+            # The selected run was dropped from the history
+            self._run_selected(live)
+
+    def _run_selected(self, item, previous=None):
+        uid = None if item is None else item.data(Qt.UserRole)
+        self._selected = uid
+        if uid is None:
+            self._views.setCurrentIndex(0)
+            return
+        self._views.setCurrentIndex(1)
+        self._text_edit.setPlainText("Rendering…")
+        self._worker = FunctionWorker(self.history.render, uid)
+        self._worker.returned.connect(
+            lambda text, uid=uid: self._show_rendered(uid, text)
+        )
+        self._worker.errored.connect(
+            lambda ex, uid=uid: self._show_rendered(uid, f"Exception occurred: {ex}")
+        )
+        self._worker.start()
+
+    def _show_rendered(self, uid, text):
+        # Results of runs no longer selected are only kept in the cache
+        if uid == self._selected:
+            self._text_edit.setPlainText(text)
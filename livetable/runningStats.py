@@ -0,0 +1,346 @@
+"""
+Running statistics of the table columns.
+
+RunningStats keeps, for each numeric field of a run's table, the count,
+mean and standard deviation, the minimum and maximum with the value of
+the dimension field where they occurred, and the sums needed for the
+center of mass against the dimension field. Each
+event_page is merged with one vectorized NumPy pass per field (Chan's
+formula for the mean and variance); single events are collected and merged
+the same way every ``batch_size`` events or ``batch_time`` seconds, which
+costs O(1) per event. The run's data is never rescanned.
+
+Peak statistics follow BestEffortCallback's PeakStats where they can be
+kept incrementally:
+
+- com: center of mass, ``sum(x * y) / sum(y)``
+- cen: centroid of the signal above its minimum,
+  ``sum(x * (y - min)) / sum(y - min)``, computed from the same sums for
+  the current minimum
+- fwhm: full width at half maximum of a Gaussian with the second moment of
+  the signal above its minimum. This is an estimate; the half-maximum
+  crossings PeakStats interpolates would need the whole scan.
+"""
+
+import math
+import time
+
+import numpy as np
+
+# Converts a standard deviation into the FWHM of a Gaussian
+_FWHM_PER_SIGMA = 2 * math.sqrt(2 * math.log(2))
+
+SUMMARY_KEYS = (
+    "count",
+    "mean",
+    "std",
+    "min",
+    "min_at",
+    "max",
+    "max_at",
+    "com",
+    "cen",
+    "fwhm",
+)
+
+
+def _as_float(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+class FieldStats:
+    """Running statistics of one field against the dimension field."""
+
+    __slots__ = (
+        "count",
+        "mean",
+        "_m2",
+        "min",
+        "max",
+        "min_at",
+        "max_at",
+        "_x0",
+        "_n",
+        "_sx",
+        "_sx2",
+        "_sy",
+        "_sxy",
+        "_sx2y",
+    )
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = None
+        self.max = None
+        self.min_at = None
+        self.max_at = None
+        # Sums over the points where both x and y are finite, of x relative
+        # to the first position, which keeps them precise for large offsets
+        self._x0 = None
+        self._n = 0
+        self._sx = self._sx2 = self._sy = self._sxy = self._sx2y = 0.0
+
+    def add_many(self, x, y):
+        """Add readings ``y`` taken at dimension values ``x`` (or None)."""
+        try:
+            y = np.asarray(y, dtype=np.float64)
+        except (TypeError, ValueError):
+            return
+        if y.ndim != 1:
+            return
+        finite = np.isfinite(y)
+        yb = y[finite]
+        n = len(yb)
+        if not n:
+            return
+        if x is not None:
+            try:
+                x = np.asarray(x, dtype=np.float64)[finite]
+            except (TypeError, ValueError):
+                x = None
+        # Chan et al.: merge the page's mean and M2 into the running ones
+        mean = float(yb.mean())
+        m2 = float(((yb - mean) ** 2).sum())
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self._m2 += m2 + delta * delta * self.count * n / total
+        self.count = total
+
+        i, j = int(yb.argmin()), int(yb.argmax())
+        if self.min is None or yb[i] < self.min:
+            self.min = float(yb[i])
+            self.min_at = _as_float(x[i]) if x is not None else None
+        if self.max is None or yb[j] > self.max:
+            self.max = float(yb[j])
+            self.max_at = _as_float(x[j]) if x is not None else None
+        if x is not None:
+            both = np.isfinite(x)
+            xb, ybx = x[both], yb[both]
+            if not len(xb):
+                return
+            if self._x0 is None:
+                self._x0 = float(xb[0])
+            xb = xb - self._x0
+            self._n += len(xb)
+            self._sx += float(xb.sum())
+            self._sx2 += float((xb * xb).sum())
+            self._sy += float(ybx.sum())
+            self._sxy += float((xb * ybx).sum())
+            self._sx2y += float((xb * xb * ybx).sum())
+
+    @property
+    def std(self):
+        """Sample standard deviation, or None for fewer than two readings."""
+        if self.count < 2:
+            return None
+        return math.sqrt(max(self._m2, 0.0) / (self.count - 1))
+
+    @property
+    def com(self):
+        if not self._sy:
+            return None
+        return self._x0 + self._sxy / self._sy
+
+    def _above_min(self):
+        # Sums of y - min, x * (y - min) and x**2 * (y - min)
+        m = self.min
+        w = self._sy - m * self._n
+        if w <= 0:
+            return None
+        return w, self._sxy - m * self._sx, self._sx2y - m * self._sx2
+
+    @property
+    def cen(self):
+        sums = self._above_min() if self._n else None
+        if sums is None:
+            return None
+        w, wx, _ = sums
+        return self._x0 + wx / w
+
+    @property
+    def fwhm(self):
+        sums = self._above_min() if self._n else None
+        if sums is None:
+            return None
+        w, wx, wx2 = sums
+        variance = wx2 / w - (wx / w) ** 2
+        if variance <= 0:
+            return None
+        return _FWHM_PER_SIGMA * math.sqrt(variance)
+
+    def summary(self):
+        """All statistics as a dict keyed by SUMMARY_KEYS."""
+        return {key: getattr(self, key) for key in SUMMARY_KEYS}
+
+
+class RunningStats:
+    """
+    Running statistics of the fields of one table.
+
+    Parameters
+    ----------
+    x_field : str or None
+        Dimension field the positions refer to; "time" uses the event time.
+    fields : list of str
+        Fields to follow.
+    time_origin : float
+        Subtracted from event times, e.g. the run's start time, so that
+        positions in time read as seconds since the start.
+    batch_size : int
+        Single events collected before they are merged.
+    batch_time : float
+        Seconds after which collected events are merged anyway.
+
+    Statistics read from ``stats`` or ``summary_line`` include the events
+    merged so far; ``snapshot`` and ``format_table`` merge everything
+    first, from the thread that feeds the events.
+    """
+
+    def __init__(
+        self, x_field, fields, time_origin=0.0, batch_size=256, batch_time=0.5
+    ):
+        self.x_field = x_field
+        self.fields = list(fields)
+        self.time_origin = time_origin
+        self.batch_size = batch_size
+        self.batch_time = batch_time
+        self.stats = {field: FieldStats() for field in self.fields}
+        # Events not merged yet: positions, and readings of each field
+        self._xs = []
+        self._ys = {field: [] for field in self.fields}
+        self._flushed = time.monotonic()
+
+    @classmethod
+    def from_descriptor(cls, descriptor, x_field, fields, time_origin=0.0):
+        """Follow the numeric fields among ``fields`` of a descriptor."""
+        data_keys = descriptor["data_keys"]
+        numeric = [
+            f
+            for f in fields
+            if f in data_keys
+            and f != x_field
+            and not data_keys[f].get("shape")
+            and data_keys[f].get("dtype") in ("number", "integer")
+        ]
+        return cls(x_field, numeric, time_origin=time_origin)
+
+    def add_event(self, doc):
+        data = doc["data"]
+        if self.x_field == "time":
+            x = doc["time"] - self.time_origin
+        else:
+            x = data.get(self.x_field)
+        self._xs.append(math.nan if x is None else x)
+        for field, ys in self._ys.items():
+            ys.append(data.get(field, math.nan))
+        if (
+            len(self._xs) >= self.batch_size
+            or time.monotonic() - self._flushed > self.batch_time
+        ):
+            self.flush()
+
+    def flush(self):
+        """Merge the collected events."""
+        self._flushed = time.monotonic()
+        if not self._xs:
+            return
+        try:
+            x = np.asarray(self._xs, dtype=np.float64)
+        except (TypeError, ValueError):
+            x = np.array([_nan_if_none(_as_float(v)) for v in self._xs])
+        for field, ys in self._ys.items():
+            try:
+                y = np.asarray(ys, dtype=np.float64)
+            except (TypeError, ValueError):
+                y = np.array([_nan_if_none(_as_float(v)) for v in ys])
+            self.stats[field].add_many(x, y)
+            ys.clear()
+        self._xs.clear()
+
+    def add_page(self, doc):
+        self.flush()
+        data = doc["data"]
+        if self.x_field == "time":
+            x = np.asarray(doc["time"], dtype=np.float64) - self.time_origin
+        else:
+            x = data.get(self.x_field)
+        for field, stats in self.stats.items():
+            if field in data:
+                stats.add_many(x, data[field])
+
+    def snapshot(self):
+        """The statistics of every field, as ``{field: FieldStats.summary()}``."""
+        self.flush()
+        return {field: stats.summary() for field, stats in self.stats.items()}
+
+    def summary_line(self, precision=4):
+        """Mean, std, max position and centroid of every field on one line."""
+        parts = []
+        for field, stats in self.stats.items():
+            if not stats.count:
+                continue
+            part = f"{field}: mean {_fmt(stats.mean, precision)}"
+            part += f" ± {_fmt(stats.std, precision)}"
+            part += f", max {_fmt(stats.max, precision)}"
+            part += f" @ {_fmt(stats.max_at, precision)}"
+            if stats.cen is not None:
+                part += f", cen {_fmt(stats.cen, precision)}"
+            parts.append(part)
+        return "  |  ".join(parts)
+
+    def format_table(self, width=11, precision=4):
+        """
+        Lines of a table with one row of statistics per field.
+
+        Returns
+        -------
+        list of str
+            Empty if no field has any readings.
+        """
+        self.flush()
+        rows = [(f, s) for f, s in self.stats.items() if s.count]
+        if not rows:
+            return []
+        name_width = max(len("field"), *(len(f) for f, _ in rows))
+        headings = ["count", "mean", "std", "min", "@min", "max", "@max"]
+        headings += ["com", "cen", "fwhm"]
+        border = "+" + "-" * (name_width + 2)
+        border += ("+" + "-" * (width + 2)) * len(headings) + "+"
+
+        def line(name, cells):
+            return f"| {name:>{name_width}} | " + " | ".join(
+                f"{cell:>{width}}" for cell in cells
+            ) + " |"
+
+        if self.x_field == "time":
+            x_label = "seconds since the start"
+        else:
+            x_label = self.x_field or "-"
+        lines = [f"Statistics (positions in {x_label}):", border]
+        lines.append(line("field", headings))
+        lines.append(border)
+        for field, stats in rows:
+            summary = stats.summary()
+            cells = [str(stats.count)] + [
+                _fmt(summary[key], precision) for key in SUMMARY_KEYS[1:]
+            ]
+            lines.append(line(field, cells))
+        lines.append(border)
+        return lines
+
+
+def _nan_if_none(value):
+    return math.nan if value is None else value
+
+
+def _fmt(value, precision):
+    if value is None:
+        return "-"
+    return f"{value:.{precision}g}"
@@ -16,7 +16,12 @@ from qtpy.QtWidgets import (
     QPushButton,
 )
 from qtpy.QtGui import QIntValidator
-from bluesky_widgets.qt.threading import FunctionWorker
+from bluesky_widgets.qt.threading import GeneratorWorker
+from collections import deque
+import time as ttime
+
+from .pipelineMetrics import metrics
+from .profiling import profiler
 
 
 class PushButtonMinimumWidth(QPushButton):
@@ -35,11 +40,39 @@ class PushButtonMinimumWidth(QPushButton):
 
 
 class QtReConsoleMonitor(QWidget):
-    def __init__(self, model, parent=None):
+    """
+    Text view of the live table.
+
+    Parameters
+    ----------
+    model : BaseLiveTableModel
+        Source of the console lines.
+    parent : QWidget, optional
+    render_mode : str
+        "coalesced" collects incoming lines and appends them in one edit at
+        most ``max_fps`` times per second; "immediate" appends every batch as
+        soon as it arrives.
+    max_fps : float
+        Maximum number of display updates per second in coalesced mode.
+    """
+
+    def __init__(self, model, parent=None, render_mode="coalesced", max_fps=20):
         super().__init__(parent)
         # self.setAttribute(Qt.WA_DeleteOnClose)
         print("New QtReConsoleMonitor with QPlainTextEdit")
         self._max_lines = 1000
+        if render_mode not in ("coalesced", "immediate"):
+            raise ValueError(f"Unknown render mode {render_mode!r}")
+        self._render_mode = render_mode
+        self._frame_interval = max(1, int(1000 / max_fps))
+        # Lines waiting for the next frame; never more than fit in the widget.
+        # Messages are split into lines, since one message may hold a block
+        # of rows
+        self._pending_lines = deque(maxlen=self._max_lines)
+        # Messages received since the last frame, for the pipeline metrics
+        self._pending_msgs = 0
+        # Pipeline metrics stamp of the newest pending line
+        self._pending_stamp = None
 
         self._text_edit = QPlainTextEdit()
         self._text_edit.setReadOnly(True)
@@ -77,10 +110,19 @@ class QtReConsoleMonitor(QWidget):
         self._cb_autoscroll.setChecked(True)
         self._cb_autoscroll.stateChanged.connect(self._cb_autoscroll_state_changed)
 
+        # Throughput statistics, refreshed at most once per second
+        self._lb_stats = QLabel("")
+        self._stats_rows = 0
+        self._stats_last_batch = 0
+        self._stats_t0 = ttime.monotonic()
+        # Rows dropped by the queue as of the last stats update
+        self._stats_dropped = 0
+
         vbox = QVBoxLayout()
         hbox = QHBoxLayout()
         hbox.addWidget(self._cb_autoscroll)
         hbox.addStretch()
+        hbox.addWidget(self._lb_stats)
         hbox.addWidget(self._lb_max_lines)
         hbox.addWidget(self._le_max_lines)
         hbox.addWidget(self._pb_clear)
@@ -96,35 +138,115 @@ class QtReConsoleMonitor(QWidget):
 
     def _process_new_console_output(self, result):
         """
-        Process new console output and append to text edit.
+        Process a batch of new console output.
+
+        In coalesced mode the lines are only queued here and written by the
+        frame timer; otherwise they are appended immediately.
 
         Parameters
         ----------
         result : tuple
-            Tuple of (time, msg) where time is a timestamp and msg is the console output
+            Tuple of (time, msgs, stamp, nrows) where time is a timestamp,
+            msgs is the list of console lines drained from the model in one
+            batch, stamp is the pipeline metrics stamp of its newest line
+            and nrows the number of table rows among them
         """
-        time, msg = result
+        time, msgs, stamp, nrows = result
 
-        # Handle None or empty messages
-        if msg is None or not msg:
+        # Handle None or empty batches
+        if not msgs:
             return
 
-        # Strip any trailing newlines to prevent doubles
-        msg = msg.rstrip("\n")
+        if self._render_mode == "coalesced":
+            for msg in msgs:
+                self._pending_lines.extend(msg.split("\n"))
+            self._pending_msgs += len(msgs)
+            if stamp is not None:
+                self._pending_stamp = stamp
+        else:
+            self._append_lines(msgs)
+            if metrics.enabled:
+                metrics.displayed(stamp, len(msgs))
+
+        self._update_stats(nrows)
+
+    def _append_lines(self, lines):
+        """
+        Append lines to the text edit as a single grouped edit.
+
+        The document trims itself to ``_max_lines`` blocks once per edit, and
+        the view is scrolled at most once.
+        """
+        if profiler.cprofile and not profiler.profiling():
+            return profiler.call(self._append_lines, lines)
+        text = "\n".join(lines)
+        document = self._text_edit.document()
 
         # Add the newline explicitly only if we're not at the start
-        if self._text_edit.document().isEmpty():
-            self._text_edit.insertPlainText(msg)
-        else:
-            self._text_edit.insertPlainText("\n" + msg)
+        if not document.isEmpty():
+            text = "\n" + text
+
+        self._text_edit.setUpdatesEnabled(False)
+        cursor = QTextCursor(document)
+        cursor.movePosition(QTextCursor.End)
+        cursor.beginEditBlock()
+        cursor.insertText(text)
+        cursor.endEditBlock()
+        self._text_edit.setUpdatesEnabled(True)
 
         if self._autoscroll_enabled and not self._is_slider_pressed:
-            self._text_edit.moveCursor(QTextCursor.End)
+            sbar = self._text_edit.verticalScrollBar()
+            sbar.setValue(sbar.maximum())
+
+    def _flush_pending_lines(self):
+        """
+        Write everything collected since the last frame.
+        """
+        if not self._pending_lines:
+            return
+        lines = list(self._pending_lines)
+        self._pending_lines.clear()
+        self._append_lines(lines)
+        if metrics.enabled:
+            metrics.displayed(self._pending_stamp, self._pending_msgs)
+            self._pending_stamp = None
+        self._pending_msgs = 0
+
+    def _update_stats(self, n_rows):
+        """
+        Accumulate throughput and refresh the statistics label once per second.
+        """
+        self._stats_rows += n_rows
+        self._stats_last_batch = n_rows
+        now = ttime.monotonic()
+        elapsed = now - self._stats_t0
+        if elapsed < 1.0:
+            return
+        rate = self._stats_rows / elapsed
+        text = (
+            f"Batch: {self._stats_last_batch}  "
+            f"Rate: {rate:.0f} rows/s  "
+            f"Queue: {self.model.queue_depth()}"
+        )
+        # Make it obvious while the display is being decimated; the queue's
+        # count is cumulative, so show what was dropped since the last update
+        total = self.model.dropped_rows()
+        dropped = total - self._stats_dropped
+        self._stats_dropped = total
+        if dropped:
+            text += f"  Dropped: {dropped} (total {total})"
+            self._lb_stats.setStyleSheet("color: red")
+        else:
+            self._lb_stats.setStyleSheet("")
+        self._lb_stats.setText(text)
+        self._stats_rows = 0
+        self._stats_t0 = now
 
     def _update_console_output(self):
         """
-        Timer callback to update the display
+        Timer callback to update the display, once per frame
         """
+        self._flush_pending_lines()
         if not self._stop:
             self._start_timer()
 
@@ -132,7 +254,7 @@ class QtReConsoleMonitor(QWidget):
         """
         Start the update timer
         """
-        QTimer.singleShot(195, self._update_console_output)
+        QTimer.singleShot(self._frame_interval, self._update_console_output)
 
     def _slider_pressed(self):
         self._is_slider_pressed = True
@@ -145,6 +267,8 @@ class QtReConsoleMonitor(QWidget):
         return sbar.value() == sbar.maximum() and self._autoscroll_enabled
 
     def _pb_clear_clicked(self):
+        self._pending_lines.clear()
+        self._pending_msgs = 0
         self._text_edit.clear()
 
     def _le_max_lines_editing_finished(self):
@@ -153,22 +277,23 @@ class QtReConsoleMonitor(QWidget):
         self._le_max_lines.setText(f"{v}")
         self._max_lines = v
         self._text_edit.setMaximumBlockCount(v)
+        self._pending_lines = deque(self._pending_lines, maxlen=v)
 
     def _cb_autoscroll_state_changed(self, state):
         self._autoscroll_enabled = state == Qt.Checked
 
     def _start_thread(self):
         """
-        Start a new thread to monitor console output
+        Start the long-lived worker that drains the model's message queue
         """
-        self._thread = FunctionWorker(self.model.console_monitoring_thread)
-        self._thread.returned.connect(self._process_new_console_output)
+        self._thread = GeneratorWorker(self.model.console_monitoring_generator)
+        self._thread.yielded.connect(self._process_new_console_output)
         self._thread.finished.connect(self._finished_receiving_console_output)
         self._thread.start()
 
     def _finished_receiving_console_output(self):
         """
-        Callback when thread finishes - starts a new thread if not stopped
+        Callback when the worker exits - restarts it unless monitoring was stopped
         """
-        if not self._stop:
+        if not self._stop and self.model.continue_polling():
             self._start_thread()
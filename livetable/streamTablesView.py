@@ -0,0 +1,118 @@
+from qtpy.QtCore import QTimer
+from qtpy.QtGui import QFont, QPalette, QTextCursor
+from qtpy.QtWidgets import QPlainTextEdit, QTabWidget
+from collections import deque
+import queue
+
+
+class QtStreamTables(QTabWidget):
+    """
+    Sub-tabs with the live table of every stream of a run.
+
+    The first tab holds ``primary_widget``, the existing view of the
+    dimension stream, which keeps its own queue and worker. Each other
+    stream gets a tab when the model announces it with ``streamAdded``.
+
+    Stream queues are drained in the GUI thread once per frame, at most
+    ``lines_per_frame`` messages per stream, so a high-rate stream sheds its
+    own rows (its queue drops the oldest) instead of taking frames from the
+    others. Lines of hidden tabs are only kept, up to ``max_lines``, and are
+    written when their tab is shown, so a stream costs in proportion to its
+    own rate.
+
+    Parameters
+    ----------
+    model : BaseLiveTableModel
+    primary_widget : QWidget
+    parent : QWidget, optional
+    primary_name : str
+        Label of the first tab.
+    max_lines : int
+        Lines kept by each stream table.
+    max_fps : float
+        Maximum number of display updates per second.
+    lines_per_frame : int
+        Maximum messages taken from each stream queue per frame.
+    """
+
+    def __init__(
+        self,
+        model,
+        primary_widget,
+        parent=None,
+        primary_name="primary",
+        max_lines=1000,
+        max_fps=20,
+        lines_per_frame=500,
+    ):
+        super().__init__(parent)
+        self.model = model
+        self._max_lines = max_lines
+        self._lines_per_frame = lines_per_frame
+        # stream name -> (QPlainTextEdit, deque of lines not yet written)
+        self._streams = {}
+        self.addTab(primary_widget, primary_name)
+        self.currentChanged.connect(self._tab_changed)
+
+        self.model.streamAdded.connect(self._add_stream)
+        for stream in list(self.model.stream_queues):
+            self._add_stream(stream)
+
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self._update_streams)
+        self._timer.start(max(1, int(1000 / max_fps)))
+
+    def _add_stream(self, stream):
+        if stream in self._streams:
+            return
+        text_edit = QPlainTextEdit()
+        text_edit.setReadOnly(True)
+        text_edit.setMaximumBlockCount(self._max_lines)
+        text_edit.setLineWrapMode(QPlainTextEdit.NoWrap)
+        p = text_edit.palette()
+        p.setColor(QPalette.Base, p.color(QPalette.Disabled, QPalette.Base))
+        text_edit.setPalette(p)
+        font = QFont("Monospace")
+        font.setStyleHint(QFont.Monospace)
+        text_edit.setFont(font)
+        self._streams[stream] = (text_edit, deque(maxlen=self._max_lines))
+        self.addTab(text_edit, stream)
+
+    def _update_streams(self):
+        """Timer callback: drain each stream queue within its frame budget."""
+        current = self.currentWidget()
+        for stream, msg_queue in list(self.model.stream_queues.items()):
+            if stream not in self._streams:
+                self._add_stream(stream)
+            text_edit, pending = self._streams[stream]
+            for _ in range(self._lines_per_frame):
+                try:
+                    msg = msg_queue.get_nowait()
+                except queue.Empty:
+                    break
+                pending.extend(msg.rstrip("\n").split("\n"))
+            if text_edit is current:
+                self._write(text_edit, pending)
+
+    def _tab_changed(self, index):
+        for text_edit, pending in self._streams.values():
+            if text_edit is self.widget(index):
+                self._write(text_edit, pending)
+
+    def _write(self, text_edit, pending):
+        if not pending:
+            return
+        text = "\n".join(pending)
+        pending.clear()
+        document = text_edit.document()
+        if not document.isEmpty():
+            text = "\n" + text
+        sbar = text_edit.verticalScrollBar()
+        at_bottom = sbar.value() == sbar.maximum()
+        cursor = QTextCursor(document)
+        cursor.movePosition(QTextCursor.End)
+        cursor.beginEditBlock()
+        cursor.insertText(text)
+        cursor.endEditBlock()
+        if at_bottom:
+            sbar.setValue(sbar.maximum())
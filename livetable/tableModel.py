@@ -0,0 +1,178 @@
+from qtpy.QtCore import Signal
+from qtpy.QtWidgets import QWidget
+import queue
+import threading
+import time
+
+from .messageQueue import BoundedMessageQueue
+from .pipelineMetrics import metrics
+
+
+class BaseLiveTableModel(QWidget):
+    """
+    Message plumbing shared by the Kafka and ZMQ table models.
+
+    A LessEffortCallback writes formatted lines through ``newMsg`` and table
+    rows through ``newRows`` into ``msg_queue``; QtReConsoleMonitor runs
+    ``console_monitoring_generator`` in a single long-lived worker that drains
+    the queue in batches.
+
+    Tables of the other streams of a run arrive through ``newStreamMsg`` and
+    ``newStreamRows``, each stream into its own queue in ``stream_queues``,
+    so a busy stream sheds its own rows without delaying the others.
+    ``streamAdded`` is emitted with the name of each new stream.
+
+    Parameters
+    ----------
+    batch_size : int
+        Maximum number of messages handed to the widget in one batch.
+    batch_time : float
+        Maximum time in seconds spent collecting one batch once the first
+        message has arrived.
+    queue_size : int
+        Maximum number of table rows waiting for display.
+    overflow_policy : str
+        What happens to rows when the queue is full; see BoundedMessageQueue.
+    decimate_every : int
+        Keep one row in this many with the "decimate" policy.
+    stream_queue_size : int
+        Maximum number of rows waiting for display in each stream queue;
+        the oldest are dropped beyond it.
+    parent : QWidget, optional
+    """
+
+    streamAdded = Signal(str)
+
+    def __init__(
+        self,
+        batch_size=1000,
+        batch_time=0.05,
+        queue_size=10000,
+        overflow_policy="drop-oldest",
+        decimate_every=10,
+        stream_queue_size=2000,
+        parent=None,
+    ):
+        super().__init__(parent)
+        self.msg_queue = BoundedMessageQueue(
+            maxsize=queue_size, policy=overflow_policy, decimate_every=decimate_every
+        )
+        self.batch_size = batch_size
+        self.batch_time = batch_time
+        self.stream_queue_size = stream_queue_size
+        self.stream_queues = {}
+        self._stream_lock = threading.Lock()
+        self._stop_console_monitor = False
+        # Output stamp of the newest queued line, while metrics are enabled
+        self._line_stamp = None
+
+        self.destroyed.connect(lambda *_: self.stop_console_output_monitoring())
+
+    def newMsg(self, msg):
+        if metrics.enabled:
+            self._line_stamp = metrics.last_output()
+        self.msg_queue.put(msg)
+
+    def newRows(self, msg, first_seq=None, last_seq=None, nrows=1):
+        if metrics.enabled:
+            self._line_stamp = metrics.last_output()
+        self.msg_queue.put_rows(msg, first_seq, last_seq, nrows)
+
+    def _stream_queue(self, stream):
+        msg_queue = self.stream_queues.get(stream)
+        if msg_queue is not None:
+            return msg_queue
+        with self._stream_lock:
+            msg_queue = self.stream_queues.get(stream)
+            if msg_queue is not None:
+                return msg_queue
+            msg_queue = BoundedMessageQueue(
+                maxsize=self.stream_queue_size, policy="drop-oldest"
+            )
+            self.stream_queues = {**self.stream_queues, stream: msg_queue}
+        self.streamAdded.emit(stream)
+        return msg_queue
+
+    def newStreamMsg(self, stream, msg):
+        self._stream_queue(stream).put(msg)
+
+    def newStreamRows(self, stream, msg, first_seq=None, last_seq=None, nrows=1):
+        self._stream_queue(stream).put_rows(msg, first_seq, last_seq, nrows)
+
+    def queue_depth(self):
+        """Number of messages waiting to be displayed."""
+        return self.msg_queue.qsize()
+
+    def dropped_rows(self):
+        """Number of table rows shed by the overload policy so far."""
+        return self.msg_queue.dropped_rows
+
+    def start_console_output_monitoring(self):
+        print("Start Console Output Monitoring")
+        self._stop_console_monitor = False
+
+    def stop_console_output_monitoring(self):
+        print("Stop Console Monitoring")
+        self._stop_console_monitor = True
+
+    def continue_polling(self):
+        return not self._stop_console_monitor
+
+    def _drain_queue(self):
+        """
+        Collect queued messages into one batch.
+
+        Blocks for at most 0.2 s waiting for the first message, then takes
+        whatever else is queued until ``batch_size`` messages have been
+        collected or ``batch_time`` has elapsed.
+
+        Returns
+        -------
+        msgs : list of str
+        nrows : int
+            Number of table rows in ``msgs``.
+        """
+        try:
+            msg, nrows = self.msg_queue.get(timeout=0.2, with_rows=True)
+        except queue.Empty:
+            return [], 0
+        msgs = [msg]
+        deadline = time.monotonic() + self.batch_time
+        while len(msgs) < self.batch_size and time.monotonic() < deadline:
+            try:
+                msg, n = self.msg_queue.get_nowait(with_rows=True)
+            except queue.Empty:
+                break
+            msgs.append(msg)
+            nrows += n
+        return [msg.rstrip("\n") for msg in msgs], nrows
+
+    def console_monitoring_generator(self):
+        """
+        Generator run by a GeneratorWorker for the lifetime of the monitor.
+
+        Yields
+        ------
+        tuple
+            (time, msgs, stamp, nrows) where msgs is the list of lines
+            drained in one batch, stamp the metrics output stamp of its
+            newest line (None unless metrics are enabled and the batch
+            emptied the queue) and nrows the number of table rows in msgs.
+        """
+        while not self._stop_console_monitor:
+            stamp = self._line_stamp
+            try:
+                msgs, nrows = self._drain_queue()
+            except Exception as ex:
+                print(f"Exception occurred: {ex}")
+                continue
+            if not msgs:
+                continue
+            if stamp is not None and not self.msg_queue.qsize():
+                # The newest line queued before draining is in this batch
+                if self._line_stamp is stamp:
+                    self._line_stamp = None
+            else:
+                stamp = None
+            yield time.time(), msgs, stamp, nrows
+        print("Stop monitoring!")
@@ -1,33 +1,117 @@
-from bluesky.callbacks.zmq import RemoteDispatcher
-from bluesky_widgets.qt.zmq_dispatcher import RemoteDispatcher as QtRemoteDispatcher
-from bluesky.callbacks.best_effort import BestEffortCallback
+from .documentRecorder import add_record_arguments, make_recorder
 from .lessEffortCallback import LessEffortCallback
+from .pipelineMetrics import add_metrics_arguments, start_metrics
+from .profiling import add_profile_arguments, start_profiling
+import argparse
 
 
-def zmq_table(out=print, continue_polling=None):
+def zmq_table(
+    out=print, continue_polling=None, address="localhost:5578", recorder=None
+):
+    from bluesky.callbacks.zmq import RemoteDispatcher
+
     callback = LessEffortCallback(out=out)
     # bec = BestEffortCallback()
 
-    zmq_dispatcher = RemoteDispatcher("localhost:5578")
+    zmq_dispatcher = RemoteDispatcher(address)
 
+    if recorder is not None:
+        zmq_dispatcher.subscribe(recorder)
     zmq_dispatcher.subscribe(callback)
     zmq_dispatcher.start()
 
 
-def qt_zmq_table(out=print):
-    callback = LessEffortCallback(out=out)
+def qt_zmq_table(
+    out=print,
+    row_out=None,
+    stream_out=None,
+    stream_row_out=None,
+    address="localhost:5578",
+    rcvhwm=None,
+    conflate=False,
+):
+    """
+    LessEffortCallback fed by a QtZmqDispatcher on the Qt event loop.
+
+    ``address`` may name several proxies; see QtZmqDispatcher for
+    ``rcvhwm`` and ``conflate``. The dispatcher is returned unstarted.
+    """
+    from .qtZmqDispatcher import QtZmqDispatcher
+
+    callback = LessEffortCallback(
+        out=out, row_out=row_out, stream_out=stream_out, stream_row_out=stream_row_out
+    )
     # bec = BestEffortCallback()
 
-    zmq_dispatcher = QtRemoteDispatcher("localhost:5578")
+    zmq_dispatcher = QtZmqDispatcher(address, rcvhwm=rcvhwm, conflate=conflate)
 
     zmq_dispatcher.subscribe(callback)
 
     return zmq_dispatcher, callback
 
 
+def add_zmq_arguments(parser):
+    """Add the 0MQ source options read by the Qt ZMQ table."""
+    parser.add_argument(
+        "--address",
+        nargs="+",
+        default=["localhost:5578"],
+        help="0MQ proxy host:port; several may be given",
+    )
+    parser.add_argument(
+        "--rcvhwm",
+        type=int,
+        default=None,
+        help="documents queued per proxy before 0MQ drops new ones",
+    )
+    parser.add_argument(
+        "--conflate",
+        action="store_true",
+        help="keep only the newest document per proxy (drops runs' headers too)",
+    )
+
+
 def main():
+    parser = argparse.ArgumentParser(description="ZMQ LiveTable Monitor")
+    parser.add_argument(
+        "--address",
+        nargs="+",
+        default=["localhost:5578"],
+        help="0MQ proxy host:port; with --async several may be given",
+    )
+    parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="run receipt, rendering and output as asyncio tasks",
+    )
+    parser.add_argument(
+        "--metrics-interval",
+        type=float,
+        default=None,
+        help="with --async, report throughput on stderr every N seconds",
+    )
+    add_metrics_arguments(parser)
+    add_profile_arguments(parser)
+    add_record_arguments(parser)
+    args = parser.parse_args()
+    start_metrics(args)
+    start_profiling(args)
+
+    if args.use_async:
+        from .asyncEngine import AsyncEngine, run_engine
+
+        engine = AsyncEngine(
+            metrics_interval=args.metrics_interval, recorder=make_recorder(args)
+        )
+        for address in args.address:
+            engine.add_zmq(address)
+        run_engine(engine)
+        return
+    if len(args.address) > 1:
+        parser.error("several --address values need --async")
 
-    zmq_table()
+    zmq_table(address=args.address[0], recorder=make_recorder(args))
 
 
 if __name__ == "__main__":